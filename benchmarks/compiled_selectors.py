@@ -0,0 +1,96 @@
+"""Selector overhead on large listing pages, parsel queries against the registry.
+
+Run with `python -m benchmarks.compiled_selectors [--archive CACHE_DIR]`. A confederation
+listing is read row by row the way countries.parse does, first with parsel's
+Selector and the `td` cells looked up for every field, as the crawler used to,
+then with the CompiledSelector of tfmkt.selectors. The player and game
+extractors are timed on both kinds of selectors too, over pages from a
+response cache when --archive is given, synthetic ones otherwise.
+extract_player turns a CompiledSelector back into a parsel one, so its two
+runs only differ by that conversion.
+"""
+import argparse
+import itertools
+import logging
+import time
+
+from parsel import Selector
+
+from benchmarks.pages import archived_pages, country_listing, game_base, game_page, player_base, player_page
+from tfmkt.crawlers.games import extract_game
+from tfmkt.crawlers.players import extract_player
+from tfmkt.selectors import CompiledSelector
+
+PAGES = 50
+ROUNDS = 20
+LISTING_ROWS = 500
+
+
+def country_rows(selector):
+    rows = []
+    for row in selector.css('table.items tbody tr.odd, table.items tbody tr.even'):
+        cells = row.xpath('td')
+        rows.append((
+            cells[1].css('img::attr(src)').get(),
+            cells[1].css('img::attr(title)').get(),
+            cells[0].xpath('table/tr/td')[1].xpath('a/@href').get(),
+            *(row.css(f'td:nth-of-type({n})::text').get() for n in (3, 4, 5, 7, 8)),
+            row.css('td:nth-of-type(6) a::text').get(),
+        ))
+    return rows
+
+
+def country_rows_per_field(selector):
+    rows = []
+    for row in selector.css('table.items tbody tr.odd, table.items tbody tr.even'):
+        rows.append((
+            row.xpath('td')[1].css('img::attr(src)').get(),
+            row.xpath('td')[1].css('img::attr(title)').get(),
+            row.xpath('td')[0].xpath('table/tr/td')[1].xpath('a/@href').get(),
+            *(row.css(f'td:nth-of-type({n})::text').get() for n in (3, 4, 5, 7, 8)),
+            row.css('td:nth-of-type(6) a::text').get(),
+        ))
+    return rows
+
+
+def measure(pages, parse, unit):
+    started_at = time.perf_counter()
+    for _ in range(ROUNDS):
+        for page in pages:
+            parse(*page)
+    return len(pages) * ROUNDS * unit / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', default=None, help='Response cache directory to take pages from')
+    args = parser.parse_args()
+    logging.getLogger('tfmkt.crawlers.players').setLevel(logging.ERROR)
+
+    listing = country_listing(LISTING_ROWS)
+    if args.archive:
+        players = list(itertools.islice(archived_pages('players', args.archive), PAGES))
+        games = list(itertools.islice(archived_pages('games', args.archive), PAGES))
+    else:
+        players = [(player_page(), player_base(), 'https://www.transfermarkt.co.uk/lionel-messi/profil/spieler/28003')]
+        games = [(game_page(), game_base(), None)]
+    assert country_rows(Selector(body=listing)) == country_rows(CompiledSelector(body=listing))
+
+    runs = [
+        ('listing, parsel, td per field', 'rows', Selector, [(listing,)], country_rows_per_field, LISTING_ROWS),
+        ('listing, parsel', 'rows', Selector, [(listing,)], country_rows, LISTING_ROWS),
+        ('listing, registry', 'rows', CompiledSelector, [(listing,)], country_rows, LISTING_ROWS),
+        ('extract_player, parsel', 'pages', Selector, players, extract_player, 1),
+        ('extract_player, registry', 'pages', CompiledSelector, players, extract_player, 1),
+        ('extract_game, parsel', 'pages', Selector, games, lambda selector, base, url: extract_game(selector, base), 1),
+        ('extract_game, registry', 'pages', CompiledSelector, games, lambda selector, base, url: extract_game(selector, base), 1),
+    ]
+    print(f'{LISTING_ROWS} listing rows, {len(players)} player and {len(games)} game pages')
+    for name, unit, selector_class, pages, parse, per_page in runs:
+        # Pages are parsed up front, only the queries are timed
+        parsed = [(selector_class(body=body), *rest) for body, *rest in pages]
+        print(f'{name:34} {measure(parsed, parse, per_page):>10,.0f} {unit}/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Game reports parsed per second, and the cost of finding their events.
+
+Run with `python -m benchmarks.game_parsing [--archive CACHE_DIR]`. Event lookup
+compares one document-wide query per event type, matching section headlines
+with normalize-space, with the single pass over the sections that
+games.extract_game_events makes. Pages come from a response cache when
+--archive is given, a synthetic one otherwise.
+"""
+import argparse
+import itertools
+import time
+
+from parsel import Selector
+
+from benchmarks.pages import archived_pages, game_base, game_page
+from tfmkt.crawlers.games import EVENT_SECTIONS, extract_game, extract_game_events
+
+PAGES = 50
+ROUNDS = 20
+
+
+def events_per_type(selector):
+    return [
+        selector.xpath(
+            f"//div[./h2/@class = 'content-box-headline' and normalize-space(./h2/text()) = '{headline}']"
+            f"//div[@class='sb-aktion']"
+        )
+        for headline in EVENT_SECTIONS
+    ]
+
+
+def events_single_pass(selector):
+    return [
+        section.xpath(".//div[@class='sb-aktion']")
+        for section in selector.xpath("//div[./h2/@class = 'content-box-headline']")
+        if section.xpath('normalize-space(./h2/text())').get() in EVENT_SECTIONS
+    ]
+
+
+def measure(pages, parse):
+    started_at = time.perf_counter()
+    for _ in range(ROUNDS):
+        for page in pages:
+            parse(*page)
+    return len(pages) * ROUNDS / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', default=None, help='Response cache directory to take game reports from')
+    args = parser.parse_args()
+
+    if args.archive:
+        pages = list(itertools.islice(archived_pages('games', args.archive), PAGES))
+    else:
+        pages = [(game_page(), game_base(), None)]
+    parsed = [(Selector(body=body), base) for body, base, _ in pages]
+
+    runs = [
+        ('event lookup, xpath per type', parsed, lambda selector, base: events_per_type(selector)),
+        ('event lookup, single pass', parsed, lambda selector, base: events_single_pass(selector)),
+        ('extract_game_events', parsed, lambda selector, base: extract_game_events(selector)),
+        ('extract_game', parsed, extract_game),
+        ('parse + extract_game', pages, lambda body, base, url: extract_game(Selector(body=body), base)),
+    ]
+    print(f'{len(pages)} pages, {sum(len(body) for body, _, _ in pages) // len(pages) // 1024} kB on average')
+    for name, inputs, parse in runs:
+        print(f'{name:34} {measure(inputs, parse):>10,.0f} pages/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Items per second written to a pipe, one print per item versus ItemWriter.
+
+Run with `python -m benchmarks.output_writer`. The items look like those of
+the appearances crawler, and the pipe is drained by `cat`, as when piping a
+crawler into another one.
+"""
+import io
+import json
+import subprocess
+import time
+
+from tfmkt.common import ItemWriter
+
+ITEMS = 200_000
+
+ITEM = {
+    'type': 'appearance',
+    'href': '/spielbericht/index/spielbericht/4361261',
+    'parent': {'type': 'player', 'href': '/erling-haaland/profil/spieler/418560'},
+    'competition_code': 'GB1',
+    'matchday': '12',
+    'date': '11/09/24',
+    'venue': 'H',
+    'for': {'type': 'club', 'href': '/spielplan/verein/281/saison_id/2024'},
+    'opponent': {'type': 'club', 'href': '/spielplan/verein/31/saison_id/2024'},
+    'result': '2:1',
+    'pos': 'CF',
+    'goals': '1',
+    'assists': '',
+    'own_goals': 0,
+    'yellow_cards': '',
+    'minutes_played': "90'",
+    'passes': 21,
+    'pass_accuracy': 0.81,
+}
+
+
+def print_per_item(stream):
+    text = io.TextIOWrapper(stream, write_through=False)
+    for _ in range(ITEMS):
+        print(json.dumps(ITEM), file=text, flush=True)
+    text.flush()
+
+
+def item_writer(stream):
+    writer = ItemWriter(stream)
+    for _ in range(ITEMS):
+        writer.write(ITEM)
+    writer.flush()
+
+
+def measure(write):
+    sink = subprocess.Popen(['cat'], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    started_at = time.perf_counter()
+    write(sink.stdin)
+    elapsed = time.perf_counter() - started_at
+    sink.stdin.close()
+    sink.wait()
+    return ITEMS / elapsed
+
+
+def main():
+    runs = [
+        ('print(json.dumps(item), flush=True)', print_per_item),
+        ('ItemWriter', item_writer),
+    ]
+
+    baseline = None
+    for name, write in runs:
+        rate = measure(write)
+        baseline = baseline or rate
+        print(f'{name:40} {rate:>12,.0f} items/s  {rate / baseline:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
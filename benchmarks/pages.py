@@ -0,0 +1,166 @@
+"""Pages to benchmark the parsers on.
+
+Either archived pages from a response cache written with --cache-dir, or
+synthetic ones shaped like Transfermarkt's markup, with enough surrounding
+navigation and tables to weigh about as much as the real pages.
+"""
+from tfmkt.reparse import find_pages
+
+FILLER_ROWS = 400
+
+
+def _filler():
+    links = ''.join(f'<li><a href="/nav/{n}" title="Link {n}">Link {n}</a></li>' for n in range(FILLER_ROWS))
+    rows = ''.join(
+        f'<tr class="odd"><td class="zentriert">{n}</td><td><a href="/club-{n}/startseite/verein/{n}">'
+        f'<img src="/wappen/{n}.png" title="Club {n}" alt="Club {n}"></a></td>'
+        f'<td><span>Season {n}</span></td><td class="rechts">&euro;{n}k</td></tr>'
+        for n in range(FILLER_ROWS)
+    )
+    return f'<nav><ul>{links}</ul></nav><div class="box"><table class="items"><tbody>{rows}</tbody></table></div>'
+
+
+def player_page(player_id=28003):
+    """Return the body of a synthetic player profile page."""
+    info = ''.join(
+        f'<span class="info-table__content info-table__content--regular">{label}</span>'
+        f'<span class="info-table__content info-table__content--bold">{value}</span>'
+        for label, value in (
+            ('Name in home country:', 'Lionel Andr&eacute;s Messi Cuccittini'),
+            ('Date of birth/Age:', '<a href="/aktuell/waspassiertheute/aktuell/new/datum/1987-06-24">'
+                                   '<span itemprop="birthDate">Jun 24, 1987 (37)</span></a>'),
+            ('Place of birth:', '<span>Rosario&nbsp;&nbsp;<img title="Argentina" alt="Argentina"></span>'),
+            ('Height:', '1,70&nbsp;m'),
+            ('Citizenship:', '<img title="Argentina" alt="Argentina">&nbsp;&nbsp;Argentina<br>'
+                             '<img title="Spain" alt="Spain">&nbsp;&nbsp;Spain'),
+            ('Position:', '\n                    Attack - Right Winger                '),
+            ('Foot:', 'left'),
+            ('Player agent:', '<a href="/relatives/beraterfirma/berater/1234" title="Relatives">Relatives</a>'),
+            ('Current club:', '<a title="Inter Miami CF" href="/inter-miami-cf/startseite/verein/69261">'
+                              'Inter Miami CF</a>'),
+            ('Joined:', 'Jul 15, 2023'),
+            ('Contract expires:', ' Dec 31, 2025 '),
+            ('Date of last contract extension:', 'Oct 23, 2024'),
+            ('Outfitter:', 'adidas'),
+            ('Social-Media:', '<div class="socialmedia-icons">'
+                              '<a href="https://www.instagram.com/leomessi/" title="Instagram"></a>'
+                              '<a href="https://www.facebook.com/leomessi/" title="Facebook"></a></div>'),
+        )
+    )
+    history = ', '.join(
+        f"{{'x':{1200000000000 + n},'y':{n * 1000000},'verein':'Club','age':{17 + n},'mw':'\\u20ac{n}m',"
+        f"'datum_mw':'Jan 1, {2005 + n}','x_kurz':'{n}','mw_kurz':'{n}m','marker':{{'symbol':'url(/w/{n}.png)'}}}}"
+        for n in range(40)
+    )
+    return f'''<html><head><title>Lionel Messi</title></head><body>
+{_filler()}
+<header class="data-header">
+<h1 class="data-header__headline-wrapper"><span class="data-header__shirt-number">#10</span> Lionel <strong>Messi</strong></h1>
+<img class="data-header__profile-image" src="https://img.a.transfermarkt.technology/portrait/header/{player_id}.jpg">
+<ul><li class="data-header__label">National player: <span><img title="Argentina">&nbsp;<a href="/argentinien/startseite/verein/3437">Argentina</a></span></li>
+<li class="data-header__label">Caps/Goals: <a href="/caps">191</a> <a href="/goals">112</a></li></ul>
+</header>
+<div class="info-table info-table--right-space">{info}</div>
+<div class="tm-player-market-value-development__current-value">&euro;20.00m</div>
+<div class="tm-player-market-value-development__max-value">&euro;180.00m</div>
+<script>var chart = new Highcharts.Chart({{'series':[{{'type':'area','name':'Market value','data':[{history}]}}],'legend':{{'enabled':false}}}})</script>
+{_filler()}
+</body></html>'''.encode('utf-8')
+
+
+def player_base(player_id=28003):
+    return {
+        'type': 'player',
+        'href': f'/lionel-messi/profil/spieler/{player_id}',
+        'parent': {'type': 'club', 'href': '/inter-miami-cf/startseite/verein/69261'},
+    }
+
+
+def archived_pages(crawler, archive):
+    """Yield (body, base, url) for the pages of `crawler` in a response cache."""
+    for _, _, url, user_data, body_path in find_pages(crawler, archive):
+        with open(body_path, 'rb') as body:
+            yield body.read(), user_data.get('base', {}), url
+
+
+def _event(minute, extra, score, action, player=1):
+    # The chronometer sprite is laid out in rows of 10 minutes, 36 pixels apart
+    x, y = (minute - 1) % 10 * -36, (minute - 1) // 10 * -36
+    return (
+        '<li class="sb-aktion-heim"><div class="sb-aktion">'
+        f'<div class="sb-aktion-uhr"><span class="sb-sprite-uhr-klein" '
+        f'style="background-position: {x}px {y}px;">{extra or "&nbsp;"}</span></div>'
+        f'<div class="sb-aktion-spielstand"><b>{score}</b></div>'
+        f'<div class="sb-aktion-spielerbild"><a href="/player-{player}/profil/spieler/{player}"><img></a></div>'
+        f'<div class="sb-aktion-aktion">{action}</div>'
+        '<div class="sb-aktion-wappen"><a title="Inter Miami CF" href="/inter-miami-cf/startseite/verein/69261">'
+        '<img></a></div></div></li>'
+    )
+
+
+def _section(title, events):
+    return (
+        f'<div class="box"><h2 class="content-box-headline">\n  {title}  \n</h2>'
+        f'<div class="sb-ereignisse"><ul>{"".join(events)}</ul></div></div>'
+    )
+
+
+def game_page():
+    """Return the body of a synthetic game report page, with goals, substitutions, cards and a shoot-out."""
+    goal = (
+        '<a class="wichtig" href="/player-9/profil/spieler/9">Scorer</a> Right-footed shot, 2nd Goal of the Season'
+        '<br>Assist: <a class="wichtig" href="/player-10/profil/spieler/10">Assistant</a>, Cross, 1st Assist'
+    )
+    substitution = (
+        '<span class="sb-aktion-wechsel-ein"><div><a href="/player-12/profil/spieler/12">Joker</a></div></span>'
+        '<span class="sb-aktion-wechsel-aus"><a href="/player-13/profil/spieler/13">Tired</a>'
+        '<span>, Tactical</span></span>'
+    )
+    card = '<a class="wichtig" href="/player-14/profil/spieler/14">Defender</a> 1. Yellow card  , Foul'
+    goals = [_event(minute, '+3' if minute == 45 else '', f'{n}:0', goal) for n, minute in enumerate((7, 45, 88), 1)]
+    substitutions = [_event(minute, '', '', substitution) for minute in range(46, 90, 7)]
+    cards = [_event(minute, '', '', card) for minute in (12, 33, 67, 90)]
+    shootout = [_event(1, '', f'{n}:{n - 1}', goal) for n in range(1, 6)]
+    return f'''<html><head><title>Game report</title></head><body>
+{_filler()}
+<div class="box-content">
+<div class="sb-heim"><a href="/inter-miami-cf/startseite/verein/69261" title="Inter Miami CF"><img alt="Inter Miami CF"></a><p>Position: 1</p></div>
+<div class="sb-spieldaten"><p class="sb-datum"><a href="/spieltag">13. Matchday</a>  | <a href="/aktuell/waspassiertheute/aktuell/new/datum/2024-10-19">Sat, 10/19/24</a> | <span>8:30 PM</span></p>
+<p class="sb-zusatzinfos">
+<span><a href="/stadion">Chase Stadium</a> | Attendance: <strong>21,550</strong></span>
+<a href="/referee/profil/schiedsrichter/1" title="Referee Name">Referee Name</a></p></div>
+<div class="ergebnis-wrap"><div class="sb-endstand">3:0<div class="sb-halbzeit">(2:0)</div></div></div>
+<div class="sb-gast"><a href="/new-england/startseite/verein/626" title="New England Revolution"><img alt="New England"></a><p>Position: 14</p></div>
+</div>
+<table><tr><td><b>Manager</b></td><td><a href="/manager/1">Home Manager</a></td></tr>
+<tr><td><div>Manager</div></td><td><a href="/manager/2">Away Manager</a></td></tr></table>
+{_section('Goals', goals)}
+{_section('Substitutions', substitutions)}
+{_section('Cards', cards)}
+{_section('Penalty shoot-out', shootout)}
+{_filler()}
+</body></html>'''.encode('utf-8')
+
+
+def game_base(game_id=4361261):
+    return {
+        'parent': {'type': 'competition', 'href': '/major-league-soccer/startseite/wettbewerb/MLS1'},
+        'href': f'/inter-miami-cf_new-england-revolution/index/spielbericht/{game_id}',
+    }
+
+
+def country_listing(rows=500):
+    """Return the body of a synthetic confederation listing, with `rows` countries."""
+    body = ''.join(
+        f'<tr class="{"odd" if n % 2 else "even"}">'
+        f'<td><table><tr><td><img></td><td><a href="/country-{n}/startseite/wettbewerb/C{n}">League {n}</a></td></tr>'
+        f'</table></td><td class="zentriert"><img src="/flagge/tiny/{n}.png" title="Country {n}"></td>'
+        f'<td class="zentriert">{n % 20}</td><td class="zentriert">{n * 3}</td><td class="zentriert">26.{n % 10}</td>'
+        f'<td class="zentriert"><a href="/legionaere">{n % 60}.0 %</a></td><td class="rechts">&euro;{n}k</td>'
+        f'<td class="rechts">&euro;{n}m</td></tr>'
+        for n in range(rows)
+    )
+    # No filler, its table would pass for country rows
+    return f'''<html><head><title>Europe</title></head><body>
+<div class="box"><table class="items"><thead><tr><th>Competition</th></tr></thead><tbody>{body}</tbody></table></div>
+</body></html>'''.encode('utf-8')
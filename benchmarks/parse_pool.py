@@ -0,0 +1,95 @@
+"""Player pages per second with parsing on the event loop versus in a parse pool.
+
+Run with `python -m benchmarks.parse_pool [--archive CACHE_DIR]`. Each page is
+fetched with a simulated network latency, then handled the way
+players.parse_details does, at several concurrency levels. On the event loop,
+the page is parsed in a thread as crawlee does and extracted on the loop; with
+a pool, extract_page() hands the raw body over. Pages come from a response
+cache when --archive is given, synthetic ones otherwise.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+from parsel import Selector
+
+from benchmarks.pages import archived_pages, player_base, player_page
+from tfmkt import common
+from tfmkt.common import extract_page
+from tfmkt.crawlers.players import extract_player
+
+PAGES = 300
+FETCH_LATENCY = 0.2
+CONCURRENCY_LEVELS = (20, 50, 100)
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+
+class FakeContext:
+    def __init__(self, body, selector):
+        self.http_response = FakeResponse(body)
+        self.selector = selector
+
+
+async def crawl(pages, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    parse_on_loop = common.parse_pool() is None
+
+    async def handle(body, base, url):
+        async with slots:
+            await asyncio.sleep(FETCH_LATENCY)
+            # Crawlee parses every page in a thread before calling the handler
+            selector = await asyncio.to_thread(Selector, body=body) if parse_on_loop else None
+            await extract_page(FakeContext(body, selector), extract_player, base, url)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(handle(*page) for page in pages))
+    return len(pages) / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', default=None, help='Response cache directory to take player pages from')
+    args = parser.parse_args()
+    # The synthetic history is parsed fine, but archived pages may lack one
+    logging.getLogger('tfmkt.crawlers.players').setLevel(logging.ERROR)
+
+    if args.archive:
+        pages = list(itertools.islice(archived_pages('players', args.archive), PAGES))
+    else:
+        body = player_page()
+        pages = [(body, player_base(), 'https://www.transfermarkt.co.uk/lionel-messi/profil/spieler/28003')] * PAGES
+
+    workers = str(os.cpu_count())
+    runs = [
+        ('event loop', {}),
+        (f'thread pool ({workers})', {'TFMKT_PARSE_WORKERS': workers, 'TFMKT_PARSE_POOL': 'thread'}),
+        (f'process pool ({workers})', {'TFMKT_PARSE_WORKERS': workers, 'TFMKT_PARSE_POOL': 'process'}),
+    ]
+    print(f'{len(pages)} pages, {FETCH_LATENCY}s simulated latency')
+    print(f'{"":24}' + ''.join(f'{f"c={concurrency}":>14}' for concurrency in CONCURRENCY_LEVELS))
+    for name, env in runs:
+        os.environ.pop('TFMKT_PARSE_WORKERS', None)
+        os.environ.update(env)
+        common._parse_pool = None
+        # Start the pool before timing, worker processes take a while to boot
+        pool = common.parse_pool()
+        if pool is not None:
+            list(pool.map(abs, range(int(workers) * 4)))
+        rates = [asyncio.run(crawl(pages, concurrency)) for concurrency in CONCURRENCY_LEVELS]
+        print(f'{name:24}' + ''.join(f'{rate:>10,.0f} p/s' for rate in rates))
+        if pool is not None:
+            pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
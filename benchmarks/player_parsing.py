@@ -0,0 +1,62 @@
+"""Player profiles parsed per second, and the cost of looking their labels up.
+
+Run with `python -m benchmarks.player_parsing [--archive CACHE_DIR]`. Label
+lookup compares one `//span[text()='<label>']/following::span[1]` query per
+label, which each scan the whole page, with the single pass of
+players.profile_values. Pages come from a response cache when --archive is
+given, a synthetic one otherwise.
+"""
+import argparse
+import itertools
+import logging
+import time
+
+from parsel import Selector
+
+from benchmarks.pages import archived_pages, player_base, player_page
+from tfmkt.crawlers.players import PROFILE_LABELS, extract_player, profile_values
+
+PAGES = 50
+ROUNDS = 5
+
+
+def xpath_per_label(selector):
+    return {
+        label: selector.xpath(f"//span[text()='{label}']/following::span[1]")
+        for label in PROFILE_LABELS
+    }
+
+
+def measure(pages, parse):
+    started_at = time.perf_counter()
+    for _ in range(ROUNDS):
+        for page in pages:
+            parse(*page)
+    return len(pages) * ROUNDS / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--archive', default=None, help='Response cache directory to take player pages from')
+    args = parser.parse_args()
+    logging.getLogger('tfmkt.crawlers.players').setLevel(logging.ERROR)
+
+    if args.archive:
+        pages = list(itertools.islice(archived_pages('players', args.archive), PAGES))
+    else:
+        pages = [(player_page(), player_base(), 'https://www.transfermarkt.co.uk/lionel-messi/profil/spieler/28003')]
+    parsed = [(Selector(body=body), base, url) for body, base, url in pages]
+
+    runs = [
+        ('label lookup, xpath per label', parsed, lambda selector, base, url: xpath_per_label(selector)),
+        ('label lookup, single pass', parsed, lambda selector, base, url: profile_values(selector)),
+        ('extract_player', parsed, extract_player),
+        ('parse + extract_player', pages, lambda body, base, url: extract_player(Selector(body=body), base, url)),
+    ]
+    print(f'{len(pages)} pages, {sum(len(body) for body, _, _ in pages) // len(pages) // 1024} kB on average')
+    for name, inputs, parse in runs:
+        print(f'{name:34} {measure(inputs, parse):>10,.0f} pages/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,10 @@ import os
 import subprocess
 import sys
 
+import pytest
+from crawlee import service_locator
+from crawlee.http_clients import HttpClient, HttpCrawlingResult
+
 
 def run_crawler(crawler_name, parents_data=None, season=2024, tmp_path=None,
                 max_requests=None):
@@ -40,3 +44,57 @@ def run_crawler(crawler_name, parents_data=None, season=2024, tmp_path=None,
         if line:
             items.append(json.loads(line))
     return items
+
+
+class FakeResponse:
+    http_version = 'HTTP/1.1'
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.headers = {'content-type': 'text/html'}
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+    async def read_stream(self):
+        yield self.body
+
+
+class FakeHttpClient(HttpClient):
+    def __init__(self, direct_response, unlocked_response):
+        super().__init__()
+        self.direct_response = direct_response
+        self.unlocked_response = unlocked_response
+        self.unlock_call = None
+        self.cleaned_up = False
+        self.crawled = 0
+
+    async def crawl(self, request, **kwargs):
+        self.crawled += 1
+        request.loaded_url = request.url
+        return HttpCrawlingResult(http_response=self.direct_response)
+
+    async def send_request(self, url, **kwargs):
+        self.unlock_call = (url, kwargs)
+        return self.unlocked_response
+
+    def stream(self, url, **kwargs):
+        raise NotImplementedError
+
+    async def cleanup(self):
+        self.cleaned_up = True
+
+
+class FakeStatistics:
+    def __init__(self):
+        self.status_codes = []
+
+    def register_status_code(self, status_code):
+        self.status_codes.append(status_code)
+
+
+@pytest.fixture(autouse=True)
+def fresh_crawlee_storages():
+    """Have each test open crawlee's storages anew, their locks belong to the event loop that used them first."""
+    service_locator.storage_instance_manager.clear_cache()
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from crawlee import Request
+
+from tests.conftest import FakeHttpClient, FakeResponse
+from tfmkt.autoscaling import AdaptiveHttpClient, AdmissionRequestManager, AimdController
+from tfmkt.brightdata import WebUnlockerHttpClient
+
+
+def make_controller(now, **kwargs):
+    return AimdController(initial=8, interval=10, clock=lambda: now[0], **kwargs)
+
+
+def test_controller_halves_the_limit_on_429s():
+    now = [0.0]
+    controller = make_controller(now)
+    for _ in range(9):
+        controller.record(200, 1.0)
+    now[0] = 11
+    controller.record(429, 1.0)
+
+    assert controller.limit == 4
+
+
+def test_controller_halves_the_limit_on_slow_responses():
+    now = [0.0]
+    controller = make_controller(now, max_p95_latency=20)
+    now[0] = 11
+    controller.record(200, 25.0)
+
+    assert controller.limit == 4
+
+
+def test_controller_grows_only_when_the_limit_was_reached():
+    now = [0.0]
+    controller = make_controller(now)
+
+    def saturate():
+        while controller.try_acquire():
+            pass
+        for _ in range(controller.limit):
+            controller.release()
+
+    now[0] = 11
+    controller.record(200, 1.0)
+    assert controller.limit == 8  # nothing was in flight
+
+    saturate()
+    now[0] = 22
+    controller.record(200, 1.0)
+    assert controller.limit == 9
+
+    saturate()
+    now[0] = 33
+    controller.record(200, 1.0, unlocked=True)
+    assert controller.limit == 9  # mostly unlocked, hold
+
+
+class FakeRequestManager:
+    def __init__(self, urls):
+        self.pending = [Request.from_url(url) for url in urls]
+
+    async def is_empty(self):
+        return not self.pending
+
+    async def fetch_next_request(self):
+        return self.pending.pop(0) if self.pending else None
+
+    async def mark_request_as_handled(self, request):
+        return None
+
+    async def reclaim_request(self, request, *, forefront=False):
+        self.pending.append(request)
+
+
+def test_admission_never_exceeds_the_limit():
+    controller = AimdController(initial=3)
+    manager = AdmissionRequestManager(
+        FakeRequestManager(f'https://www.transfermarkt.co.uk/{number}' for number in range(12)),
+        controller,
+    )
+
+    async def crawl():
+        fetched = [await manager.fetch_next_request() for _ in range(5)]
+        assert [request is not None for request in fetched] == [True, True, True, False, False]
+        assert await manager.is_empty()
+
+        # Completions may be retried, the slot comes back once
+        await manager.mark_request_as_handled(fetched[0])
+        await manager.mark_request_as_handled(fetched[0])
+        assert not await manager.is_empty()
+        assert await manager.fetch_next_request() is not None
+        assert await manager.fetch_next_request() is None
+
+        await manager.reclaim_request(fetched[1])
+        assert await manager.fetch_next_request() is not None
+
+    asyncio.run(crawl())
+
+
+def test_adaptive_client_records_the_direct_status():
+    inner = FakeHttpClient(FakeResponse(429, b''), FakeResponse(200, b'<html>unlocked</html>'))
+    controller = AimdController(interval=0)
+    client = AdaptiveHttpClient(WebUnlockerHttpClient(inner, 'secret', 'test-zone'), controller)
+
+    result = asyncio.run(client.crawl(Request.from_url('https://www.transfermarkt.co.uk/example')))
+
+    assert result.http_response.status_code == 200
+    assert controller.limit == 5
+
+
+class FailingHttpClient(FakeHttpClient):
+    async def crawl(self, request, **kwargs):
+        raise TimeoutError('navigation timed out')
+
+
+def test_adaptive_client_backs_off_on_failed_crawls():
+    controller = AimdController(initial=8, interval=0)
+    client = AdaptiveHttpClient(FailingHttpClient(None, None), controller)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.crawl(Request.from_url('https://www.transfermarkt.co.uk/example')))
+
+    assert controller.limit == 4
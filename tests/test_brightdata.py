@@ -1,61 +1,19 @@
 import asyncio
 import json
+from datetime import timedelta
 
 from crawlee import Request
-from crawlee.http_clients import HttpClient, HttpCrawlingResult
 
+from tests.conftest import FakeHttpClient, FakeResponse, FakeStatistics
 from tfmkt.brightdata import (
     BRIGHTDATA_ENDPOINT,
+    CoalescingHttpClient,
+    DirectAccessBreaker,
     WebUnlockerHttpClient,
     build_http_client,
     looks_blocked,
 )
-
-
-class FakeResponse:
-    http_version = 'HTTP/1.1'
-
-    def __init__(self, status_code, body):
-        self.status_code = status_code
-        self.headers = {'content-type': 'text/html'}
-        self.body = body
-
-    async def read(self):
-        return self.body
-
-    async def read_stream(self):
-        yield self.body
-
-
-class FakeHttpClient(HttpClient):
-    def __init__(self, direct_response, unlocked_response):
-        super().__init__()
-        self.direct_response = direct_response
-        self.unlocked_response = unlocked_response
-        self.unlock_call = None
-        self.cleaned_up = False
-
-    async def crawl(self, request, **kwargs):
-        request.loaded_url = request.url
-        return HttpCrawlingResult(http_response=self.direct_response)
-
-    async def send_request(self, url, **kwargs):
-        self.unlock_call = (url, kwargs)
-        return self.unlocked_response
-
-    def stream(self, url, **kwargs):
-        raise NotImplementedError
-
-    async def cleanup(self):
-        self.cleaned_up = True
-
-
-class FakeStatistics:
-    def __init__(self):
-        self.status_codes = []
-
-    def register_status_code(self, status_code):
-        self.status_codes.append(status_code)
+from tfmkt.throttling import TrafficLane
 
 
 def test_looks_blocked_detects_statuses_and_datadome_markers():
@@ -107,6 +65,68 @@ def test_unblocked_crawl_returns_replayable_direct_response():
     assert client.unlocked == 0
 
 
+def test_attempts_are_timed_from_when_their_lane_lets_them_through():
+    inner = FakeHttpClient(FakeResponse(429, b''), FakeResponse(200, b'unlocked'))
+    client = WebUnlockerHttpClient(
+        inner,
+        'secret',
+        'test-zone',
+        unlocker_lane=TrafficLane('unlocker', rate=20),
+        request_timeout=timedelta(seconds=30),
+    )
+
+    async def crawl_all():
+        # The last crawls wait on the unlocker lane for longer than their own timeout
+        await asyncio.gather(*(
+            client.crawl(Request.from_url(f'https://example.com/{number}'), timeout=timedelta(seconds=0.01))
+            for number in range(3)
+        ))
+
+    asyncio.run(crawl_all())
+
+    assert inner.unlock_call[1]['timeout'] == timedelta(seconds=30)
+
+
+def test_breaker_skips_direct_attempts_for_blocked_patterns():
+    inner = FakeHttpClient(
+        FakeResponse(403, b'Human Verification'),
+        FakeResponse(200, b'<html>unlocked</html>'),
+    )
+    client = WebUnlockerHttpClient(
+        inner, 'secret', 'test-zone', breaker=DirectAccessBreaker(min_samples=3, threshold=1.0),
+    )
+
+    for player_id in range(5):
+        url = f'https://www.transfermarkt.co.uk/player-{player_id}/profil/spieler/{player_id}'
+        result = asyncio.run(client.crawl(Request.from_url(url)))
+        assert asyncio.run(result.http_response.read()) == b'<html>unlocked</html>'
+
+    assert inner.crawled == 3
+    assert client.unlocked == 5
+    assert client.direct_skipped == 2
+
+    # Other page types keep going direct
+    asyncio.run(client.crawl(Request.from_url('https://www.transfermarkt.co.uk/laliga/startseite/wettbewerb/ES1')))
+    assert inner.crawled == 4
+
+
+def test_breaker_probes_and_closes_after_recovery():
+    now = [0.0]
+    breaker = DirectAccessBreaker(min_samples=2, threshold=1.0, probe_interval=30, clock=lambda: now[0])
+    url = 'https://www.transfermarkt.co.uk/a/spielbericht/index/1'
+
+    breaker.record(url, blocked=True)
+    breaker.record(url, blocked=True)
+    assert not breaker.allow_direct(url)
+
+    now[0] = 31
+    assert breaker.allow_direct(url)
+    assert not breaker.allow_direct(url)  # a single probe per interval
+
+    breaker.record(url, blocked=False)
+    assert breaker.allow_direct(url)
+
+
 def test_build_http_client_requires_non_empty_key(monkeypatch):
     monkeypatch.delenv('BRIGHTDATA_API_KEY', raising=False)
     assert build_http_client() is None
@@ -119,3 +139,29 @@ def test_build_http_client_requires_non_empty_key(monkeypatch):
     client = build_http_client()
     assert isinstance(client, WebUnlockerHttpClient)
     assert client._zone == 'custom-zone'
+
+
+class SlowHttpClient(FakeHttpClient):
+    async def crawl(self, request, **kwargs):
+        await asyncio.sleep(0.05)
+        return await super().crawl(request, **kwargs)
+
+
+def test_concurrent_crawls_of_one_url_share_a_fetch():
+    inner = SlowHttpClient(FakeResponse(405, b'Human Verification'), FakeResponse(200, b'<html>unlocked</html>'))
+    unlocker = WebUnlockerHttpClient(inner, 'secret', 'test-zone')
+    client = CoalescingHttpClient(unlocker)
+    url = 'https://www.transfermarkt.co.uk/a/spielbericht/index/1'
+
+    async def crawl_all():
+        concurrent = await asyncio.gather(*(client.crawl(Request.from_url(url)) for _ in range(2)))
+        # Reached again later: served from the unlocked responses of the run
+        later = await client.crawl(Request.from_url(url))
+        other = await client.crawl(Request.from_url(url + '0'))
+        return [*concurrent, later, other]
+
+    results = asyncio.run(crawl_all())
+
+    assert [asyncio.run(result.http_response.read()) for result in results] == [b'<html>unlocked</html>'] * 4
+    assert unlocker.unlocked == 2
+    assert client.coalesced == 2
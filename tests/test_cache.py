@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+from crawlee import Request
+
+from tests.conftest import FakeHttpClient, FakeResponse, FakeStatistics
+from tfmkt.cache import CacheMissError, CachingHttpClient, ResponseCache, build_response_cache
+
+
+def test_cached_crawl_skips_the_inner_client(tmp_path):
+    inner = FakeHttpClient(FakeResponse(200, b'<html>page</html>'), None)
+    client = CachingHttpClient(inner, ResponseCache(str(tmp_path)))
+    url = 'https://www.transfermarkt.co.uk/example'
+
+    first = asyncio.run(client.crawl(Request.from_url(url)))
+    request = Request.from_url(url)
+    statistics = FakeStatistics()
+    second = asyncio.run(client.crawl(request, statistics=statistics))
+
+    assert inner.crawled == 1
+    assert asyncio.run(first.http_response.read()) == b'<html>page</html>'
+    assert asyncio.run(second.http_response.read()) == b'<html>page</html>'
+    assert second.http_response.status_code == 200
+    assert second.http_response.headers.get('content-type') == 'text/html'
+    assert request.loaded_url == url
+    assert statistics.status_codes == [200]
+    assert (client.hits, client.misses, client.stored) == (1, 1, 1)
+
+
+def test_blocked_responses_are_not_cached(tmp_path):
+    inner = FakeHttpClient(FakeResponse(200, b'Human Verification'), None)
+    client = CachingHttpClient(inner, ResponseCache(str(tmp_path)))
+
+    for _ in range(2):
+        asyncio.run(client.crawl(Request.from_url('https://example.com')))
+
+    assert inner.crawled == 2
+    assert client.stored == 0
+
+
+def test_replay_fails_on_cache_miss(tmp_path):
+    inner = FakeHttpClient(FakeResponse(200, b'unused'), None)
+    client = CachingHttpClient(inner, ResponseCache(str(tmp_path)), replay=True)
+
+    with pytest.raises(CacheMissError):
+        asyncio.run(client.crawl(Request.from_url('https://example.com')))
+    assert inner.crawled == 0
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    cache.put('https://example.com', {'status_code': 200}, b'body')
+    assert cache.get('https://example.com') is not None
+
+    metadata_path, _ = cache._paths('https://example.com')
+    metadata_path.write_text(metadata_path.read_text().replace('"stored_at": ', '"stored_at": -1'))
+    assert cache.get('https://example.com') is None
+
+
+def test_size_limit_evicts_least_recently_read(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=2500)
+    for page in range(3):
+        cache.put(f'https://example.com/{page}', {'status_code': 200}, b'x' * 600)
+        time.sleep(0.01)
+    cache.get('https://example.com/0')
+
+    cache.put('https://example.com/3', {'status_code': 200}, b'x' * 600)
+
+    assert cache.size() <= 2500
+    assert cache.get('https://example.com/0') is not None
+    assert cache.get('https://example.com/1') is None
+    assert cache.get('https://example.com/3') is not None
+
+
+def test_build_response_cache_requires_a_directory(monkeypatch, tmp_path):
+    monkeypatch.delenv('TFMKT_CACHE_DIR', raising=False)
+    assert build_response_cache() is None
+
+    monkeypatch.setenv('TFMKT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('TFMKT_CACHE_MAX_MB', '1')
+    assert build_response_cache()._max_size == 1024 * 1024
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+from crawlee import Request
+from crawlee.crawlers import HttpCrawler, ParselCrawler
+from parsel import Selector
+
+from tests.conftest import FakeResponse
+from tfmkt import common
+from tfmkt.common import (
+    RecentKeys,
+    extract_page,
+    in_shard,
+    load_dead_letters,
+    page_crawler_class,
+    page_selector,
+    unsharded,
+    write_dead_letter,
+)
+
+
+def test_recent_keys_drops_duplicates_and_forgets_old_keys():
+    seen = RecentKeys(2)
+
+    assert seen.add(1)
+    assert not seen.add(1)
+    assert seen.add(2)
+    assert seen.add(3)
+    # 1 was the least recently seen, so it was forgotten
+    assert seen.add(1)
+    assert not seen.add(3)
+    # Looking a key up does not remember it
+    assert 4 not in seen
+    assert seen.add(4)
+    assert 4 in seen
+
+
+def test_dead_letters_rebuild_the_failed_requests(tmp_path, monkeypatch):
+    path = tmp_path / 'failed.jsonl'
+    monkeypatch.setenv('TFMKT_DEAD_LETTER', str(path))
+    base = {'type': 'player', 'href': '/player/1', 'parent': {'type': 'club'}}
+    request = Request.from_url('https://www.transfermarkt.co.uk/player/1', label='parse_details', user_data={'base': base})
+
+    write_dead_letter('players', request, ValueError('no birth date'))
+    write_dead_letter('clubs', Request.from_url('https://www.transfermarkt.co.uk/club/1'), KeyError('name'))
+
+    assert json.loads(path.read_text().splitlines()[0])['error'] == 'ValueError'
+    [retry] = load_dead_letters(str(path), 'players')
+    assert retry.url == request.url
+    assert retry.label == 'parse_details'
+    assert retry.user_data['base'] == base
+    # Not deduplicated against the original, which a state directory remembers as handled
+    assert retry.unique_key != request.unique_key
+
+
+def test_dead_letters_go_back_to_the_shard_they_failed_under(tmp_path, monkeypatch):
+    path = tmp_path / 'failed.jsonl'
+    monkeypatch.setenv('TFMKT_DEAD_LETTER', str(path))
+    # Squad pages are read by every node, whatever shard their url hashes to
+    squad = Request.from_url('https://www.transfermarkt.co.uk/club/kader/verein/1', label='parse_squad')
+    monkeypatch.setenv('TFMKT_SHARD', '1/3')
+    write_dead_letter('players', squad, TimeoutError())
+
+    loaded = {}
+    for index in range(3):
+        monkeypatch.setenv('TFMKT_SHARD', f'{index}/3')
+        loaded[index] = [request.url for request in load_dead_letters(str(path), 'players')]
+    assert loaded == {0: [], 1: [squad.url], 2: []}
+
+    monkeypatch.delenv('TFMKT_SHARD')
+    assert len(load_dead_letters(str(path), 'players')) == 1
+
+
+def test_shards_split_keys_between_nodes(monkeypatch):
+    hrefs = [f'/player-{n}/profil/spieler/{n}' for n in range(1000)]
+    shards = []
+    for index in range(3):
+        monkeypatch.setenv('TFMKT_SHARD', f'{index}/3')
+        shards.append({href for href in hrefs if in_shard(href)})
+
+    assert sum(len(shard) for shard in shards) == len(hrefs)
+    assert set.union(*shards) == set(hrefs)
+    assert all(250 < len(shard) < 420 for shard in shards)
+
+
+def test_unsharded_crawls_see_every_key(monkeypatch):
+    monkeypatch.setenv('TFMKT_SHARD', '0/2')
+    hrefs = [f'/club-{n}/startseite/verein/{n}' for n in range(20)]
+
+    async def crawl():
+        for href in hrefs:
+            if in_shard(href):
+                yield href
+
+    async def collect(items):
+        return [item async for item in items]
+
+    assert len(asyncio.run(collect(crawl()))) < len(hrefs)
+    assert asyncio.run(collect(unsharded(crawl()))) == hrefs
+
+
+class FakeContext:
+    def __init__(self, body):
+        self.selector = Selector(body=body)
+        self.http_response = FakeResponse(200, body)
+
+
+def extract_title(selector, base):
+    return {**base, 'title': selector.css('title::text').get()}
+
+
+def test_parse_pool_extracts_the_same_item(monkeypatch):
+    context = FakeContext(b'<html><head><title>Transfermarkt</title></head></html>')
+    base = {'type': 'page'}
+    inline = asyncio.run(extract_page(context, extract_title, base))
+
+    monkeypatch.setenv('TFMKT_PARSE_WORKERS', '1')
+    monkeypatch.setenv('TFMKT_PARSE_POOL', 'thread')
+    monkeypatch.setattr(common, '_parse_pool', None)
+    context.selector = None  # the pool must parse the body itself
+    pooled = asyncio.run(extract_page(context, extract_title, base))
+    common._parse_pool.shutdown()
+
+    assert pooled == inline == {'type': 'page', 'title': 'Transfermarkt'}
+
+
+def test_parse_pool_crawls_leave_pages_unparsed(monkeypatch):
+    monkeypatch.setattr(common, '_parse_pool', None)
+    assert page_crawler_class() is ParselCrawler
+
+    monkeypatch.setenv('TFMKT_PARSE_WORKERS', '1')
+    monkeypatch.setenv('TFMKT_PARSE_POOL', 'thread')
+    assert page_crawler_class() is HttpCrawler
+    common._parse_pool.shutdown()
+
+    context = FakeContext(b'<html><head><title>Transfermarkt</title></head></html>')
+    context.selector = None  # as HttpCrawler leaves it
+    selector = asyncio.run(page_selector(context))
+    assert extract_title(selector, {}) == {'title': 'Transfermarkt'}
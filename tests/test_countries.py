@@ -0,0 +1,27 @@
+from parsel import Selector
+
+from benchmarks.pages import country_listing
+from tfmkt.crawlers.countries import confederation_page_requests, country_item, extract_countries
+
+
+def test_confederation_listings_are_paged_from_their_first_page():
+    parent = {'type': 'confederation', 'href': '/wettbewerbe/europa'}
+    base_url = 'https://www.transfermarkt.co.uk'
+
+    requests = confederation_page_requests(f'{base_url}/wettbewerbe/europa', base_url, parent)
+
+    assert [request.url for request in requests] == [f'{base_url}/wettbewerbe/europa?page={n}' for n in range(2, 7)]
+    assert requests[0].user_data['parent'] == parent
+    assert confederation_page_requests(f'{base_url}/wettbewerbe/europa?page=2', base_url, parent) == []
+    assert confederation_page_requests(f'{base_url}/wettbewerbe/fifa', base_url, parent) == []
+
+
+def test_countries_are_read_from_rows_with_a_flag():
+    page = country_listing(2).replace(b'<tbody>', b'<tbody><tr class="odd"><td></td><td>No flag</td></tr>')
+
+    countries = list(extract_countries(Selector(body=page)))
+
+    assert [country['country_id'] for country in countries] == ['0', '1']
+    item = country_item(countries[1], {'type': 'confederation'})
+    assert item['href'] == '/wettbewerbe/national/wettbewerbe/1'
+    assert (item['country_name'], item['country_code'], item['foreigner_percentage']) == ('Country 1', 'C1', '1.0 %')
@@ -0,0 +1,144 @@
+from pathlib import Path
+
+from parsel import Selector
+
+from benchmarks.pages import game_base, game_page
+
+from tfmkt.crawlers.games import (
+    extract_fixtures,
+    extract_game,
+    extract_game_events,
+    extract_game_with_formations,
+    fixture_games,
+)
+from tfmkt.crawlers.game_lineups import lineups_request
+from tfmkt.utils import background_position_in_px_to_minute
+
+
+def event(style, player):
+    return (
+        f'<div class="sb-aktion"><div><span class="sb-sprite-uhr-klein" style="{style}">&nbsp;</span></div>'
+        f'<div class="sb-aktion-spielerbild"><a href="/player/{player}"></a></div>'
+        '<div class="sb-aktion-aktion"><a href="/player/1">Scorer</a> Header<br><a href="/player/2">Assist</a></div>'
+        '</div>'
+    )
+
+
+# Cards come first on this page, and the Goals headline is padded
+GAME = f"""<html><body>
+<div class="box"><h2 class="content-box-headline">Cards</h2>{event('background-position: -72px -36px;', 3)}</div>
+<div class="box"><h2 class="content-box-headline">
+    Goals
+</h2>{event('background-position: 0px 0px;', 1)}{event('background-position: -324px -468px;', 2)}</div>
+<div class="box"><h2 class="content-box-headline">Line-Ups</h2>{event('background-position: 0px 0px;', 4)}</div>
+</body></html>"""
+
+
+def test_events_are_listed_by_type_then_page_order():
+    events = extract_game_events(Selector(text=GAME))
+
+    assert [(e['type'], e['minute'], e['player']['href']) for e in events] == [
+        ('Goals', 1, '/player/1'),
+        ('Goals', -1, '/player/2'),
+        ('Cards', 13, '/player/3'),
+    ]
+    assert events[0]['action']['player_assist'] == {'href': '/player/2'}
+
+
+def test_sprite_positions_map_to_minutes():
+    assert background_position_in_px_to_minute(0, 0) == 1
+    assert background_position_in_px_to_minute(-324, -36) == 20
+    assert background_position_in_px_to_minute(-72, -396) == 113
+    assert background_position_in_px_to_minute(0, -468) == -1
+
+
+LINEUPS = (
+    "<div class='box'><h2 class='content-box-headline'>Line-Ups</h2>"
+    "<div class='large-6 columns'><div class='row'><div> Starting Line-up: 4-3-3 </div></div></div>"
+    "<div class='large-6 columns'><div class='row'><div>Starting Line-up: 4-4-2</div></div></div></div>"
+)
+
+
+def test_game_reports_lead_straight_to_the_line_ups_page():
+    page = game_page().replace(b'</body>', LINEUPS.encode() + b'</body>')
+    item, formations = extract_game_with_formations(Selector(body=page), game_base())
+
+    assert formations == ('Starting Line-up: 4-3-3', 'Starting Line-up: 4-4-2')
+    request = lineups_request(item, formations, 'https://www.transfermarkt.co.uk')
+    assert request.url == 'https://www.transfermarkt.co.uk/inter-miami-cf_new-england-revolution/aufstellung/spielbericht/4361261'
+    lineups = request.user_data['base']['lineups']
+    assert lineups['home_club']['href'] == '/inter-miami-cf/startseite/verein/69261'
+    assert lineups['away_club']['formation'] == 'Starting Line-up: 4-4-2'
+
+
+def test_games_still_to_be_played_have_no_line_ups():
+    _, formations = extract_game_with_formations(Selector(body=game_page()), game_base())
+
+    assert formations is None
+
+
+def fixture(date, time, home, result, away):
+    return (
+        f'<tr><td>{date}</td><td>{time}</td>'
+        f'<td class="text-right no-border-rechts hauptlink"><span class="tabellenplatz">(1.)</span> '
+        f'<a title="Club {home}" href="/club-{home}/spielplan/verein/{home}/saison_id/2024">C{home}</a></td>'
+        f'<td><a href="/club-{home}/spielplan/verein/{home}/saison_id/2024"><img alt="Club {home}"></a></td>'
+        f'<td class="zentriert hauptlink"><a class="ergebnis-link" href="/spielbericht/index/spielbericht/{home}{away}">'
+        f'{result}</a></td>'
+        f'<td class="no-border-links hauptlink"><a title="Club {away}" href="/club-{away}/spielplan/verein/{away}/saison_id/2024">'
+        f'C{away}</a> <span class="tabellenplatz">(12.)</span></td></tr>'
+    )
+
+
+# The second game of the day and the second game at 3:00 PM leave date and time out
+FIXTURES = f"""<html><body>
+<div class="box"><div class="content-box-headline"> 1.Matchday </div><table>
+{fixture('<a href="/aktuell/waspassiertheute/aktuell/new/datum/2024-08-17">Sat 8/17/24</a>', '3:00 PM', 1, '2:1', 2)}
+{fixture('', '', 3, '0:0', 4)}
+</table></div>
+<div class="box"><div class="content-box-headline">2.Matchday</div><table>
+{fixture('<a href="/aktuell/waspassiertheute/aktuell/new/datum/2024-08-24">Sat 8/24/24</a>', '', 2, '-:-', 3)}
+</table></div>
+</body></html>"""
+
+
+def test_fixture_lists_hold_the_game_items():
+    fixtures = list(extract_fixtures(Selector(text=FIXTURES)))
+
+    assert [href for href, _ in fixtures] == [
+        '/spielbericht/index/spielbericht/12', '/spielbericht/index/spielbericht/34', '/spielbericht/index/spielbericht/23',
+    ]
+    first, second, third = (attributes for _, attributes in fixtures)
+    assert first == {
+        'home_club': {'type': 'club', 'href': '/club-1/startseite/verein/1'},
+        'home_club_name': 'Club 1',
+        'home_club_position': 'Position: 1',
+        'away_club': {'type': 'club', 'href': '/club-2/startseite/verein/2'},
+        'away_club_name': 'Club 2',
+        'away_club_position': 'Position: 12',
+        'result': '2:1',
+        'matchday': '1. Matchday',
+        'date': 'Sat, 8/17/24',
+        'kickoff_time': '3:00 PM',
+    }
+    assert (second['date'], second['kickoff_time'], second['matchday']) == ('Sat, 8/17/24', '3:00 PM', '1. Matchday')
+    assert (third['date'], third['kickoff_time'], third['result'], third['matchday']) == (
+        'Sat, 8/24/24', None, '-:-', '2. Matchday',
+    )
+
+
+# A game report, and the fixture list it is listed on with a second game on the same day
+PAGES = Path(__file__).parent / 'pages'
+
+
+def test_fixture_lists_and_game_reports_agree_on_the_fields_they_share():
+    base = game_base()
+    game = extract_game(Selector(body=(PAGES / 'game_report.html').read_bytes()), base)
+    fixture_list = Selector(body=(PAGES / 'fixture_list.html').read_bytes())
+    lite_games = {item['game_id']: item for item in fixture_games(fixture_list, base['parent'])}
+
+    lite_game = lite_games[game['game_id']]
+    # Fixture lists link the report under another slug
+    shared = set(lite_game) - {'href'}
+    assert {field: lite_game[field] for field in shared} == {field: game[field] for field in shared}
+    assert (lite_games[4361262]['date'], lite_games[4361262]['kickoff_time']) == ('Sat, 10/19/24', '8:30 PM')
@@ -0,0 +1,93 @@
+import asyncio
+import io
+import json
+import os
+import signal
+
+import pytest
+
+from tfmkt.common import EmittedKeys, ItemWriter, encode_item, stream_items, write_items
+
+
+def read_items(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_writer_writes_in_batches():
+    stream = io.BytesIO()
+    writer = ItemWriter(stream, batch_size=3, interval=60)
+
+    for number in range(4):
+        writer.write({'number': number})
+    assert read_items(stream) == [{'number': 0}, {'number': 1}, {'number': 2}]
+
+    writer.flush()
+    assert read_items(stream)[-1] == {'number': 3}
+
+
+def test_items_are_encoded_as_print_did():
+    item = {'name': 'Kylian Mbappé', 'citizenship': 'França', 'pass_accuracy': 0.81, 'value': 1e-07, 'height': 1.78}
+
+    assert encode_item(item) == (json.dumps(item) + '\n').encode('utf-8')
+
+
+def test_writer_writes_late_items_right_away():
+    stream = io.BytesIO()
+    writer = ItemWriter(stream, batch_size=100, interval=0)
+
+    writer.write({'number': 0})
+    assert read_items(stream) == [{'number': 0}]
+
+
+def test_write_items_flushes_on_sigterm():
+    stream = io.BytesIO()
+
+    async def items():
+        for number in range(3):
+            yield {'number': number}
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.sleep(60)
+        yield {'number': 3}
+
+    with pytest.raises(SystemExit) as exit:
+        asyncio.run(write_items(items(), ItemWriter(stream, interval=60)))
+
+    assert exit.value.code == 128 + signal.SIGTERM
+    assert len(read_items(stream)) == 3
+
+
+def test_writer_skips_items_written_by_an_earlier_run(tmp_path):
+    keys_path = str(tmp_path / 'emitted.keys')
+    first_run = io.BytesIO()
+    writer = ItemWriter(first_run, batch_size=1, emitted=EmittedKeys(keys_path))
+    writer.write({'href': '/player/1'})
+    writer.write({'href': '/player/2'})
+
+    second_run = io.BytesIO()
+    writer = ItemWriter(second_run, batch_size=1, emitted=EmittedKeys(keys_path))
+    for number in (1, 2, 3):
+        writer.write({'href': f'/player/{number}'})
+
+    assert read_items(second_run) == [{'href': '/player/3'}]
+    assert writer.skipped == 2
+
+
+def test_items_are_marked_written_once_flushed():
+    stream = io.BytesIO()
+    written_when_marked = {}
+
+    async def crawl(parents, season, base_url, emit):
+        for number in range(3):
+            def mark(number=number):
+                written_when_marked[number] = read_items(stream)
+            await emit({'number': number}, on_written=mark)
+        return []
+
+    writer = ItemWriter(stream, batch_size=2, interval=60)
+    asyncio.run(write_items(stream_items(crawl, []), writer))
+
+    assert written_when_marked == {
+        0: [{'number': 0}, {'number': 1}],
+        1: [{'number': 0}, {'number': 1}],
+        2: [{'number': 0}, {'number': 1}, {'number': 2}],
+    }
@@ -0,0 +1,238 @@
+import asyncio
+import gzip
+import json
+from datetime import timedelta
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+from crawlee import Request
+from crawlee.crawlers import BasicCrawler
+
+from tfmkt import common
+from tfmkt.common import CrawlFailedError, create_crawler, iterate, load_parents, run_crawler, stream_items
+from tfmkt.pipeline import run_pipeline
+
+
+async def crawl_clubs(parents, season, base_url, emit):
+    async for parent in iterate(parents):
+        for number in range(2):
+            await emit({'type': 'club', 'href': f'/club/{number}', 'parent': parent})
+    return []
+
+
+async def crawl_players(parents, season, base_url, emit):
+    failures = []
+    async for parent in iterate(parents):
+        if parent['href'] == '/club/1':
+            failures.append((parent['href'], RuntimeError('blocked')))
+        await emit({'type': 'player', 'parent': parent})
+    return failures
+
+
+def test_run_crawler_handles_requests_produced_during_the_crawl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    handled = []
+
+    async def produce():
+        for number in range(5):
+            await asyncio.sleep(0.05)
+            yield Request.from_url(f'https://www.transfermarkt.co.uk/page/{number}')
+
+    async def crawl():
+        crawler, failures = await create_crawler(crawler_class=BasicCrawler, name='test')
+
+        @crawler.router.default_handler
+        async def handler(context):
+            handled.append(context.request.url)
+
+        await run_crawler(crawler, produce())
+        return failures
+
+    assert asyncio.run(crawl()) == []
+    assert len(handled) == 5
+
+
+def test_stream_items_raises_after_the_last_item_when_requests_failed():
+    async def collect():
+        items = []
+        with pytest.raises(CrawlFailedError) as error:
+            async for item in stream_items(crawl_players, [{'href': '/club/0'}, {'href': '/club/1'}]):
+                items.append(item)
+        return items, error.value.failures
+
+    items, failures = asyncio.run(collect())
+    assert len(items) == 2
+    assert [url for url, _ in failures] == ['/club/1']
+
+
+def crawl_with_handler(name, handler, handler_timeout=0.2):
+    async def crawl(parents, season, base_url, emit):
+        crawler, failures = await create_crawler(
+            crawler_class=partial(BasicCrawler, request_handler_timeout=timedelta(seconds=handler_timeout)),
+            name=name,
+        )
+        crawler.router.default_handler(partial(handler, emit=emit))
+        await run_crawler(crawler, [Request.from_url(f'https://www.transfermarkt.co.uk/page/{number}') for number in range(2)])
+        return failures
+
+    return crawl
+
+
+def test_handlers_cancelled_after_emitting_do_not_repeat_items(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    attempts = []
+
+    async def handler(context, emit):
+        attempts.append(context.request.url)
+        await emit({'url': context.request.url})
+        if attempts.count(context.request.url) == 1:
+            # Cancelled by the request handler timeout, and retried
+            await asyncio.sleep(10)
+
+    async def collect():
+        return [item async for item in stream_items(crawl_with_handler('cancelled', handler), [])]
+
+    items = asyncio.run(collect())
+    assert sorted(item['url'] for item in items) == sorted(set(attempts))
+    assert len(attempts) == 4
+
+
+def test_handlers_do_not_wait_for_their_items_to_be_taken(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    async def handler(context, emit):
+        for number in range(3):
+            await emit({'url': context.request.url, 'number': number})
+
+    async def collect():
+        items = []
+        async for item in stream_items(crawl_with_handler('slow-consumer', handler), []):
+            # Slower than the request handler timeout
+            await asyncio.sleep(0.1)
+            items.append(item)
+        return items
+
+    assert len(asyncio.run(collect())) == 6
+
+
+def test_pipeline_feeds_each_stage_items_to_the_next(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    parents_file = tmp_path / 'parents.json'
+    parents_file.write_text(json.dumps({'type': 'competition', 'href': '/league', 'parent': {'type': 'root'}}) + '\n')
+
+    stages = [
+        SimpleNamespace(iter_items=partial(stream_items, crawl_clubs)),
+        SimpleNamespace(iter_items=partial(stream_items, crawl_players)),
+    ]
+    with pytest.raises(SystemExit):
+        asyncio.run(run_pipeline(stages, parents_arg=str(parents_file)))
+
+    items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [item['parent']['href'] for item in items] == ['/club/0', '/club/1']
+    # Grandparents are dropped, as when piping crawlers into each other
+    assert 'parent' not in items[0]['parent']
+
+
+def crawl_children(name, item_type):
+    async def crawl(parents, season, base_url, emit):
+        crawler, failures = await create_crawler(crawler_class=BasicCrawler, name=name)
+
+        @crawler.router.default_handler
+        async def handler(context):
+            await emit({'type': item_type, 'href': context.request.url.removeprefix('https://www.transfermarkt.co.uk')})
+
+        requests = (
+            Request.from_url(f"https://www.transfermarkt.co.uk{parent['href']}/{item_type}")
+            async for parent in iterate(parents)
+        )
+        await run_crawler(crawler, requests)
+        return failures
+
+    return crawl
+
+
+def test_pipeline_retries_feed_each_stage_items_to_the_next(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    dead_letter = tmp_path / 'failed.jsonl'
+    dead_letter.write_text(''.join(
+        json.dumps({'crawler': name, 'url': f'https://www.transfermarkt.co.uk{path}', 'label': None, 'user_data': {}})
+        + '\n'
+        for name, path in (('retry-clubs', '/league/club'), ('retry-players', '/other/club/player'))
+    ))
+    monkeypatch.setenv('TFMKT_RETRY_FAILED', str(dead_letter))
+    parents_file = tmp_path / 'parents.json'
+    parents_file.write_text('')
+
+    stages = [
+        SimpleNamespace(iter_items=partial(stream_items, crawl_children('retry-clubs', 'club'))),
+        SimpleNamespace(iter_items=partial(stream_items, crawl_children('retry-players', 'player'))),
+    ]
+    asyncio.run(run_pipeline(stages, parents_arg=str(parents_file)))
+
+    items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert sorted(item['href'] for item in items) == ['/league/club/player', '/other/club/player']
+
+
+def test_run_crawler_bounds_the_requests_waiting_in_the_queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(common, 'MAX_PENDING_REQUESTS', 2)
+    monkeypatch.setattr(common, 'FINISHED_POLL_INTERVAL', 0.01)
+    produced = []
+    handled = []
+    backlog = []
+
+    def produce():
+        for number in range(10):
+            backlog.append(len(produced) - len(handled))
+            produced.append(number)
+            yield Request.from_url(f'https://www.transfermarkt.co.uk/page/{number}')
+
+    async def crawl():
+        crawler, _ = await create_crawler(crawler_class=BasicCrawler, name='bounded')
+
+        @crawler.router.default_handler
+        async def handler(context):
+            await asyncio.sleep(0.02)
+            handled.append(context.request.url)
+
+        await run_crawler(crawler, produce())
+
+    asyncio.run(crawl())
+    assert len(handled) == 10
+    assert max(backlog) <= 2
+
+
+def test_load_parents_streams_gzipped_files(tmp_path):
+    parents_file = tmp_path / 'parents.json.gz'
+    with gzip.open(parents_file, 'wt') as lines:
+        for number in range(3):
+            lines.write(json.dumps({'type': 'club', 'href': f'/club/{number}', 'parent': {'type': 'competition'}}) + '\n')
+
+    async def collect():
+        return [parent async for parent in load_parents(str(parents_file))]
+
+    assert asyncio.run(collect()) == [{'type': 'club', 'href': f'/club/{number}'} for number in range(3)]
+
+
+def test_crawlers_resume_from_the_state_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('TFMKT_STATE_DIR', str(tmp_path / 'state'))
+    handled = []
+
+    async def crawl(urls):
+        crawler, _ = await create_crawler(crawler_class=BasicCrawler, name='resumed_crawl')
+
+        @crawler.router.default_handler
+        async def handler(context):
+            handled.append(context.request.url)
+
+        await run_crawler(crawler, [Request.from_url(url) for url in urls])
+
+    async def interrupted_then_resumed():
+        await crawl(['https://www.transfermarkt.co.uk/page/1'])
+        await crawl(['https://www.transfermarkt.co.uk/page/1', 'https://www.transfermarkt.co.uk/page/2'])
+
+    asyncio.run(interrupted_then_resumed())
+    assert handled == ['https://www.transfermarkt.co.uk/page/1', 'https://www.transfermarkt.co.uk/page/2']
+    assert (tmp_path / 'state' / 'request_queues' / 'resumed-crawl').is_dir()
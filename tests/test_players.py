@@ -0,0 +1,126 @@
+import asyncio
+
+from crawlee import Request
+from parsel import Selector
+
+from tfmkt.crawlers.players import (
+    LITE_SEEN_KIND,
+    PROFILE_LABELS,
+    extract_player_hrefs,
+    extract_squad,
+    player_requests,
+    profile_values,
+    squad_requests,
+)
+from tfmkt.seen_index import SeenIndex
+
+PROFILE = b"""<html><body>
+<span class="info-table__content">Height:</span><span class="info-table__content">1,70 m</span>
+<span>Outfitter:<span>nested in the label</span></span><span>adidas</span>
+<span> Current club: </span><span><a href="/inter-miami-cf/startseite/verein/69261">Inter Miami</a></span>
+<span>Foot:</span>
+</body></html>"""
+
+
+def test_profile_values_match_a_following_span_query_per_label():
+    selector = Selector(body=PROFILE)
+    values = profile_values(selector)
+
+    for label in PROFILE_LABELS:
+        expected = selector.xpath(f"//span[text()='{label}']/following::span[1]").get()
+        assert (values[label].get() if label in values else None) == expected
+    assert values['Outfitter:'].xpath('text()').get() == 'adidas'
+    assert values['Current club:'].xpath('a/@href').get() == '/inter-miami-cf/startseite/verein/69261'
+    # The last span on the page has no value
+    assert 'Foot:' not in values
+
+
+SQUAD = b"""<html><body><div class="responsive-table"><table class="items"><tbody>
+<tr><td><table class="inline-table"><tr><td class="hauptlink"><a href="/a/profil/spieler/1">A</a></td></tr></table></td></tr>
+<tr><td><table class="inline-table"><tr><td class="hauptlink"><a href="/b/profil/spieler/2">B</a></td></tr></table></td></tr>
+</tbody></table></div></body></html>"""
+
+
+def test_player_requests_leave_out_seen_players(tmp_path):
+    seen_index = SeenIndex(str(tmp_path / 'seen.db'))
+    seen_index.add('player', '/a/profil/spieler/1')
+    club = {'type': 'club', 'href': '/club/startseite/verein/1'}
+
+    hrefs = extract_player_hrefs(Selector(body=SQUAD))
+    requests = player_requests(hrefs, club, 'https://www.transfermarkt.co.uk', seen_index, label='parse_player')
+
+    assert hrefs == ['/a/profil/spieler/1', '/b/profil/spieler/2']
+    assert [(request.url, request.label) for request in requests] == [
+        ('https://www.transfermarkt.co.uk/b/profil/spieler/2', 'parse_player'),
+    ]
+    assert requests[0].user_data['base'] == {'type': 'player', 'href': '/b/profil/spieler/2', 'parent': club}
+
+    # Players seen by a full crawl are fetched again by a lite one, and the other way around
+    lite_requests = player_requests(hrefs, club, 'https://www.transfermarkt.co.uk', seen_index, LITE_SEEN_KIND)
+    assert len(lite_requests) == 2
+
+
+def squad_row(number, href, name, position, birth_date, flags, height, contract, value):
+    return (
+        f'<tr class="odd"><td class="zentriert rueckennummer"><div class="rn_nummer">{number}</div></td>'
+        '<td class="posrela"><table class="inline-table"><tr>'
+        f'<td rowspan="2"><img data-src="https://img/{number}.jpg" src="data:image/gif;base64,R0l"></td>'
+        f'<td class="hauptlink"><a href="{href}">{name} </a></td></tr><tr><td>{position}</td></tr></table></td>'
+        f'<td class="zentriert">{birth_date}</td>'
+        f'<td class="zentriert">{"".join(f"<img class=flaggenrahmen title={flag}>" for flag in flags)}</td>'
+        f'<td class="zentriert">{height}</td><td class="zentriert">left</td><td class="zentriert">Jul 15, 2023</td>'
+        '<td class="zentriert"><a title="Paris SG"><img></a></td>'
+        f'<td class="zentriert">{contract}</td><td class="rechts hauptlink"><a href="/mw">{value}</a></td></tr>'
+    )
+
+
+SQUAD_VIEW = f"""<html><body><div class="responsive-table"><table class="items">
+<thead><tr><th>#</th><th><a href="?sort=name">Player</a></th><th>Date of birth/Age</th><th>Nat.</th>
+<th>Height</th><th>Foot</th><th>Joined</th><th>Signed from</th><th>Contract</th><th>Market value</th></tr></thead>
+<tbody>
+{squad_row(10, '/lionel-messi/profil/spieler/28003', 'Lionel Messi', 'Right Winger', 'Jun 24, 1987 (37)',
+           ['Argentina', 'Spain'], '1,70m', 'Dec 31, 2025', '&euro;20.00m')}
+{squad_row('-', '/new-kid/profil/spieler/1', 'New Kid', 'Centre-Back', '-', ['USA'], '-', '-', '-')}
+</tbody></table></div></body></html>""".encode()
+
+
+def test_squad_view_rows_become_player_attributes():
+    club = {'type': 'club', 'href': '/inter-miami-cf/startseite/verein/69261'}
+
+    players = dict(extract_squad(Selector(body=SQUAD_VIEW), club))
+
+    assert players['/lionel-messi/profil/spieler/28003'] == {
+        'name': 'Lionel Messi',
+        'number': '#10',
+        'date_of_birth': 'Jun 24, 1987',
+        'age': '37',
+        'height': '1,70 m',
+        'citizenship': 'Argentina',
+        'additional_citizenships': ['Spain'],
+        'position': 'Right Winger',
+        'image_url': 'https://img/10.jpg',
+        'current_club': {'href': '/inter-miami-cf/startseite/verein/69261'},
+        'foot': 'left',
+        'joined': 'Jul 15, 2023',
+        'contract_expires': 'Dec 31, 2025',
+        'current_market_value': '€20.00m',
+        'code': 'lionel-messi',
+    }
+    # Without a date of birth the profile page is needed
+    assert players['/new-kid/profil/spieler/1'] is None
+
+
+def test_squad_requests_point_at_the_detailed_squad_view():
+    async def requests():
+        yield Request.from_url(
+            'https://www.transfermarkt.co.uk/inter-miami-cf/startseite/verein/69261/saison_id/2024',
+            label='parse', user_data={'parent': {'type': 'club'}},
+        )
+
+    async def collect():
+        return [request async for request in squad_requests(requests())]
+
+    [request] = asyncio.run(collect())
+    assert request.url == 'https://www.transfermarkt.co.uk/inter-miami-cf/kader/verein/69261/saison_id/2024/plus/1'
+    assert request.label == 'parse_squad'
+    assert request.user_data['parent'] == {'type': 'club'}
@@ -0,0 +1,80 @@
+import json
+
+from tfmkt.cache import ResponseCache
+from tfmkt import reparse as reparse_module
+from tfmkt.reparse import find_pages, reparse
+
+CLUB_PAGE = b"""
+<html><body>
+<div class="data-header__profile-container"><img src="https://tmssl.akamaized.net/223.png"></div>
+<h1 class="data-header__headline-wrapper data-header__headline-wrapper--oswald">HNK Sibenik</h1>
+<div class="dataMarktwert"><a>12.50m</a></div>
+<ul>
+  <li>Squad size: <span>25</span></li>
+  <li>Foreigners: <span><a>9</a> <span>36.0 %</span></span></li>
+  <li>Stadium: <span><a>Stadion Subicevac</a> <span>3.412 Seats</span></span></li>
+</ul>
+</body></html>
+"""
+
+
+def store_page(cache, url, label, base, body):
+    cache.put(url, {'label': label, 'user_data': {'label': label, 'base': base}}, body)
+
+
+def test_reparse_feeds_archived_pages_to_the_handler(tmp_path, capsys):
+    cache = ResponseCache(str(tmp_path))
+    base = {'type': 'club', 'href': '/hnk-sibenik/startseite/verein/223', 'parent': {'type': 'competition'}}
+    store_page(cache, 'https://www.transfermarkt.co.uk/hnk-sibenik/startseite/verein/223/saison_id/2024',
+               'parse_details', base, CLUB_PAGE)
+
+    reparse('clubs', str(tmp_path), jobs=1)
+
+    items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(items) == 1
+    assert items[0]['type'] == 'club'
+    assert items[0]['name'] == 'HNK Sibenik'
+    assert items[0]['squad_size'] == '25'
+    assert items[0]['stadium_name'] == 'Stadion Subicevac'
+    assert items[0]['code'] == 'hnk-sibenik'
+
+
+def test_find_pages_tells_handlers_sharing_a_label_apart(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    store_page(cache, 'https://example.com/club', 'parse_details', {'type': 'club', 'href': '/c'}, b'club')
+    store_page(cache, 'https://example.com/player', 'parse_details', {'type': 'player', 'href': '/p'}, b'player')
+    store_page(cache, 'https://example.com/listing', 'parse', {}, b'listing')
+
+    assert [page[2] for page in find_pages('players', str(tmp_path))] == ['https://example.com/player']
+    assert [page[2] for page in find_pages('clubs', str(tmp_path))] == ['https://example.com/club']
+
+
+def test_find_pages_covers_every_label_items_are_built_from(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    player = {'type': 'player', 'href': '/p'}
+    store_page(cache, 'https://example.com/profile', 'parse_details', player, b'profile')
+    store_page(cache, 'https://example.com/fused', 'parse_player', player, b'fused')
+    cache.put('https://example.com/squad', {'label': 'parse_squad', 'user_data': {'parent': {'type': 'club'}}}, b'squad')
+
+    assert sorted(page[2] for page in find_pages('players', str(tmp_path))) == [
+        'https://example.com/fused', 'https://example.com/profile',
+    ]
+    monkeypatch.setenv('TFMKT_LITE', '1')
+    assert sorted(page[1] for page in find_pages('players', str(tmp_path))) == [
+        'parse_details', 'parse_player', 'parse_squad',
+    ]
+
+
+def test_reparse_keeps_archive_order_across_batches(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(reparse_module, 'REPARSE_BATCH_SIZE', 1)
+    monkeypatch.setattr(reparse_module, 'BATCHES_PER_WORKER', 1)
+    cache = ResponseCache(str(tmp_path))
+    for club_id in range(5):
+        base = {'type': 'club', 'href': f'/club-{club_id}/startseite/verein/{club_id}'}
+        store_page(cache, f'https://www.transfermarkt.co.uk{base["href"]}', 'parse_details', base, CLUB_PAGE)
+
+    reparse('clubs', str(tmp_path), jobs=2)
+
+    items = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [item['href'] for item in items] == [page[3]['base']['href'] for page in find_pages('clubs', str(tmp_path))]
+    assert len(items) == 5
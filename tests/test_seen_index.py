@@ -0,0 +1,69 @@
+from datetime import date
+
+from tfmkt import seen_index
+from tfmkt.crawlers.appearances import season_completed
+from tfmkt.seen_index import BloomFilter, SeenIndex
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    for key in range(1000):
+        bloom.add(str(key))
+
+    assert all(str(key) in bloom for key in range(1000))
+    false_positives = sum(str(key) in bloom for key in range(1000, 11000))
+    assert false_positives < 300
+
+
+def test_seen_index_persists_across_runs(tmp_path):
+    path = str(tmp_path / 'seen.db')
+    index = SeenIndex(path)
+    assert not index.skip('game', 4095553)
+    index.add('game', 4095553)
+    index.add('player', '/lionel-messi/profil/spieler/28003')
+    index.commit()
+
+    reopened = SeenIndex(path)
+    assert reopened.skip('game', 4095553)
+    assert reopened.skip('player', '/lionel-messi/profil/spieler/28003')
+    # Kinds are kept apart
+    assert not reopened.skip('player', 4095553)
+    assert reopened.skipped == {'game': 1, 'player': 1}
+
+
+def test_seen_index_commits_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(seen_index, 'COMMIT_INTERVAL', 2)
+    path = str(tmp_path / 'seen.db')
+    index = SeenIndex(path)
+
+    index.add('game', 1)
+    assert not SeenIndex(path).skip('game', 1)
+    index.add('game', 2)
+    assert SeenIndex(path).skip('game', 2)
+
+    index.add('game', 3)
+    index.report('game')
+    assert SeenIndex(path).skip('game', 3)
+
+
+def test_only_seasons_that_are_over_are_skipped():
+    today = date(2026, 10, 18)
+    assert season_completed(2024, today)
+    # 2025/26, or the calendar year 2026 elsewhere
+    assert not season_completed(2025, today)
+    assert not season_completed(2026, today)
+
+
+def test_workers_share_an_index_without_locking_each_other_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(seen_index, 'COMMIT_INTERVAL', 2)
+    monkeypatch.setattr(seen_index, 'BUSY_TIMEOUT', 0.1)
+    path = str(tmp_path / 'seen.db')
+    first, second = SeenIndex(path), SeenIndex(path)
+
+    first.add('game', 1)
+    assert first.skip('game', 1)
+    second.add('game', 2)
+    second.add('game', 3)
+    first.add('game', 4)
+
+    assert all(SeenIndex(path).skip('game', game_id) for game_id in (1, 2, 3, 4))
@@ -0,0 +1,72 @@
+import pytest
+from parsel import Selector
+
+from tfmkt.selectors import CompiledSelector, compiled, plain
+
+PAGE = b"""<html><body>
+<table class="items"><tbody>
+<tr class="odd"><td>1</td><td><img src="/flagge/40.png" title="Germany"> Germany</td></tr>
+<tr class="even"><td>2</td><td><img src="/flagge/157.png" title="Spain"> Spain</td></tr>
+</tbody></table>
+<a href="/spieler/1" class="wichtig">One</a>
+</body></html>"""
+
+QUERIES = [
+    ('css', 'table.items tbody tr.odd, table.items tbody tr.even'),
+    ('css', 'td:nth-of-type(2) img::attr(title)'),
+    ('css', 'td::text'),
+    ('xpath', '//tr/td[2]'),
+    ('xpath', "count(//tr)"),
+    ('xpath', "normalize-space(//td[2])"),
+    ('xpath', "//a[re:test(@href, '/spieler/[0-9]+')]/@class"),
+]
+
+
+@pytest.mark.parametrize('method, query', QUERIES)
+def test_compiled_selector_matches_parsel(method, query):
+    selector = CompiledSelector(body=PAGE)
+    expected = getattr(Selector(root=selector.root, type='html'), method)(query)
+    result = getattr(selector, method)(query)
+
+    assert result.getall() == expected.getall()
+    for match, reference in zip(result, expected):
+        assert type(match) is CompiledSelector
+        for slot in ('root', 'type', 'namespaces', '_expr', '_huge_tree', '_text'):
+            assert getattr(match, slot) == getattr(reference, slot)
+
+
+def test_chained_queries_stay_compiled():
+    rows = compiled(Selector(body=PAGE)).css('tr')
+    cells = rows[1].xpath('td')
+
+    assert type(cells[1]) is CompiledSelector
+    assert cells[1].css('img::attr(src)').get() == '/flagge/157.png'
+
+
+def test_queries_with_variables_fall_back_to_parsel():
+    selector = CompiledSelector(body=PAGE)
+
+    assert selector.xpath('//img[@title=$name]/@src', name='Spain').get() == '/flagge/157.png'
+
+
+def test_invalid_queries_raise_value_error():
+    with pytest.raises(ValueError, match='XPath error'):
+        CompiledSelector(body=PAGE).xpath('//td[')
+
+
+def test_compiled_leaves_other_selectors_alone():
+    json_selector = Selector(text='{"a": 1}')
+    selector = CompiledSelector(body=PAGE)
+
+    assert compiled(json_selector) is json_selector
+    assert compiled(selector) is selector
+
+
+def test_plain_turns_back_into_a_parsel_selector():
+    selector = CompiledSelector(body=PAGE)
+    parsel_selector = plain(selector)
+
+    assert type(parsel_selector) is Selector
+    assert type(parsel_selector.css('a')[0]) is Selector
+    assert parsel_selector.css('a::attr(href)').get() == '/spieler/1'
+    assert plain(parsel_selector) is parsel_selector
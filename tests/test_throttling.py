@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from crawlee import ConcurrencySettings
+
+from tfmkt.throttling import TokenBucket, TrafficLane, build_concurrency_settings, build_traffic_lane
+
+
+def test_token_bucket_spaces_out_acquisitions():
+    async def acquire_all():
+        bucket = TokenBucket(rate=50, burst=1)
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(acquire_all()) >= 0.09
+
+
+def test_lane_caps_concurrent_requests():
+    lane = TrafficLane('direct', concurrency=2)
+    in_flight = []
+    peak = []
+
+    async def request():
+        async with lane.slot():
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def run_all():
+        await asyncio.gather(*(request() for _ in range(8)))
+
+    asyncio.run(run_all())
+    assert max(peak) == 2
+
+
+def test_lanes_are_configured_from_the_environment(monkeypatch):
+    monkeypatch.setenv('TFMKT_UNLOCKER_CONCURRENCY', '5')
+    monkeypatch.setenv('TFMKT_UNLOCKER_RATE', '2.5')
+    monkeypatch.delenv('TFMKT_DIRECT_CONCURRENCY', raising=False)
+    monkeypatch.delenv('TFMKT_DIRECT_RATE', raising=False)
+
+    unlocker_lane = build_traffic_lane('unlocker')
+    direct_lane = build_traffic_lane('direct')
+
+    assert (unlocker_lane.concurrency, unlocker_lane.rate) == (5, 2.5)
+    assert (direct_lane.concurrency, direct_lane.rate) == (None, None)
+
+
+def test_crawler_pool_makes_room_for_both_lanes():
+    settings = build_concurrency_settings(TrafficLane('direct', concurrency=20), TrafficLane('unlocker', concurrency=5))
+    assert settings.max_concurrency == 25
+
+    settings = build_concurrency_settings(TrafficLane('direct', concurrency=4, rate=2), None)
+    assert settings.max_concurrency == 4
+    assert settings.max_tasks_per_minute == 120
+
+    assert build_concurrency_settings(TrafficLane('direct'), TrafficLane('unlocker')) is None
+
+
+def test_crawler_pool_is_sized_whenever_a_lane_is_limited():
+    settings = build_concurrency_settings(TrafficLane('direct'), TrafficLane('unlocker', concurrency=5, rate=1))
+    assert settings.max_concurrency == ConcurrencySettings().max_concurrency + 5
+    assert settings.max_tasks_per_minute == float('inf')
+
+    settings = build_concurrency_settings(TrafficLane('direct', rate=2), TrafficLane('unlocker', rate=0.5))
+    assert settings.max_tasks_per_minute == 150
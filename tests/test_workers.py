@@ -0,0 +1,26 @@
+import json
+
+from tfmkt.workers import record_worker_failures, record_worker_stats, worker_argv
+
+
+def test_worker_argv_drops_the_coordinator_options():
+    argv = ['players', '-p', 'clubs.json', '--workers', '4', '--state-dir=state', '--cache-dir', 'cache']
+
+    assert worker_argv(argv) == ['players', '-p', 'clubs.json', '--cache-dir', 'cache']
+
+
+def test_workers_report_counters_and_failures(tmp_path, monkeypatch):
+    path = tmp_path / 'worker-0.jsonl'
+    monkeypatch.delenv('TFMKT_WORKER_STATS', raising=False)
+    record_worker_stats('Response cache', hits=1)
+    assert not path.exists()
+
+    monkeypatch.setenv('TFMKT_WORKER_STATS', str(path))
+    record_worker_stats('Response cache', hits=1, misses=2)
+    record_worker_failures([('https://www.transfermarkt.co.uk/player/1', ValueError('no birth date'))])
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert records == [
+        {'section': 'Response cache', 'counters': {'hits': 1, 'misses': 2}},
+        {'failure': {'url': 'https://www.transfermarkt.co.uk/player/1', 'error': 'no birth date'}},
+    ]
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Any, Callable
+
+from crawlee import Request
+from crawlee.http_clients import HttpClient, HttpCrawlingResult
+from crawlee.request_loaders import RequestManager
+
+from tfmkt.brightdata import BLOCKED_STATUS_CODES
+
+logger = logging.getLogger(__name__)
+
+
+class AimdController:
+    """Additive-increase, multiplicative-decrease limit on requests in flight.
+
+    Every `interval` seconds the controller looks at the responses recorded
+    since its last decision. It halves the limit when too many of them were
+    throttled, blocked or failed, or when their p95 latency is too high. It holds the
+    limit while most requests need the Web Unlocker, since adding concurrency
+    then mostly adds unlocker load, or while the limit was not reached.
+    Otherwise it raises the limit by one.
+    """
+
+    def __init__(
+        self,
+        initial: int = 10,
+        minimum: int = 1,
+        maximum: int = 100,
+        interval: float = 15.0,
+        max_block_rate: float = 0.05,
+        max_p95_latency: float = 30.0,
+        max_unlock_rate: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.limit = min(max(initial, minimum), maximum)
+        self._minimum = minimum
+        self._maximum = maximum
+        self._interval = interval
+        self._max_block_rate = max_block_rate
+        self._max_p95_latency = max_p95_latency
+        self._max_unlock_rate = max_unlock_rate
+        self._clock = clock
+        self._in_flight = 0
+        self._peak = 0
+        # (status code, or None for a request that got no response, latency, unlocked)
+        self._samples: list[tuple[int | None, float, bool]] = []
+        self._window_started = clock()
+
+    def has_room(self) -> bool:
+        """Return whether fewer than `limit` requests are in flight."""
+        return self._in_flight < self.limit
+
+    def try_acquire(self) -> bool:
+        """Count one more request in flight, unless the limit is reached."""
+        if not self.has_room():
+            return False
+        self._in_flight += 1
+        self._peak = max(self._peak, self._in_flight)
+        return True
+
+    def release(self) -> None:
+        """Count a request acquired with try_acquire() out again."""
+        self._in_flight -= 1
+
+    def record(self, status_code: int | None, latency: float, unlocked: bool = False) -> None:
+        """Record the outcome of one request, and adjust the limit when an interval is over.
+
+        A `status_code` of None records a request that failed without a
+        response, such as a timeout, which counts as blocked.
+        """
+        self._samples.append((status_code, latency, unlocked))
+        if self._clock() - self._window_started >= self._interval:
+            self._adjust()
+
+    def _adjust(self) -> None:
+        requests = len(self._samples)
+        block_rate = sum(
+            status_code is None or status_code in BLOCKED_STATUS_CODES for status_code, _, _ in self._samples
+        ) / requests
+        unlock_rate = sum(unlocked for _, _, unlocked in self._samples) / requests
+        latencies = sorted(latency for _, latency, _ in self._samples)
+        p95_latency = latencies[math.ceil(0.95 * requests) - 1]
+
+        previous_limit = self.limit
+        if block_rate >= self._max_block_rate or p95_latency >= self._max_p95_latency:
+            decision = 'decrease'
+            self.limit = max(self._minimum, self.limit // 2)
+        elif unlock_rate >= self._max_unlock_rate or self._peak < self.limit:
+            decision = 'hold'
+        else:
+            decision = 'increase'
+            self.limit = min(self._maximum, self.limit + 1)
+
+        logger.info(
+            'Adaptive concurrency %s: %d -> %d (requests=%d block_rate=%.2f unlock_rate=%.2f p95_latency=%.1fs)',
+            decision,
+            previous_limit,
+            self.limit,
+            requests,
+            block_rate,
+            unlock_rate,
+            p95_latency,
+        )
+
+        self._samples = []
+        self._peak = self._in_flight
+        self._window_started = self._clock()
+
+
+class AdmissionRequestManager(RequestManager):
+    """Hand requests to the crawler only while an AimdController has room for them.
+
+    The limit applies where crawlee schedules work, the way its own
+    ThrottlingRequestManager applies per-domain delays: while the limit is
+    reached, is_empty() reports nothing to do and fetch_next_request() returns
+    None, so the pool starts no more requests than the controller allows and
+    none of them waits for a slot inside its navigation timeout. A request
+    holds its slot until it is handled or reclaimed.
+    """
+
+    def __init__(self, inner: RequestManager, controller: AimdController) -> None:
+        self._inner = inner
+        self._controller = controller
+        self._admitted: set[str] = set()
+
+    @property
+    def inner(self) -> RequestManager:
+        return self._inner
+
+    async def drop(self) -> None:
+        await self._inner.drop()
+
+    async def purge(self) -> None:
+        await self._inner.purge()
+
+    async def add_request(self, request: Any, *, forefront: bool = False) -> Any:
+        return await self._inner.add_request(request, forefront=forefront)
+
+    async def add_requests(self, requests: Any, **kwargs: Any) -> None:
+        await self._inner.add_requests(requests, **kwargs)
+
+    async def get_handled_count(self) -> int:
+        return await self._inner.get_handled_count()
+
+    async def get_total_count(self) -> int:
+        return await self._inner.get_total_count()
+
+    async def is_empty(self) -> bool:
+        return not self._controller.has_room() or await self._inner.is_empty()
+
+    async def is_finished(self) -> bool:
+        return await self._inner.is_finished()
+
+    async def fetch_next_request(self) -> Request | None:
+        if not self._controller.try_acquire():
+            return None
+        try:
+            request = await self._inner.fetch_next_request()
+        except BaseException:
+            self._controller.release()
+            raise
+        if request is None:
+            self._controller.release()
+            return None
+        self._admitted.add(request.unique_key)
+        return request
+
+    async def reclaim_request(self, request: Request, *, forefront: bool = False) -> Any:
+        result = await self._inner.reclaim_request(request, forefront=forefront)
+        self._release(request)
+        return result
+
+    async def mark_request_as_handled(self, request: Request) -> Any:
+        result = await self._inner.mark_request_as_handled(request)
+        self._release(request)
+        return result
+
+    def _release(self, request: Request) -> None:
+        # Completions may be retried, the slot is only given back once
+        if request.unique_key in self._admitted:
+            self._admitted.remove(request.unique_key)
+            self._controller.release()
+
+
+class AdaptiveHttpClient(HttpClient):
+    """Feed an AimdController the status and latency of crawls.
+
+    The controller caps requests in flight through AdmissionRequestManager.
+
+    The status recorded is the one the site answered the direct attempt with,
+    when the inner client reports it, so a 429 rescued by the Web Unlocker
+    still counts as throttling. Crawls that raise, timeouts included, are
+    recorded as failures.
+    """
+
+    def __init__(self, inner: HttpClient, controller: AimdController) -> None:
+        super().__init__()
+        self._inner = inner
+        self._controller = controller
+
+    async def crawl(
+        self,
+        request: Any,
+        *,
+        session: Any = None,
+        proxy_info: Any = None,
+        statistics: Any = None,
+        timeout: Any = None,
+    ) -> HttpCrawlingResult:
+        started_at = time.monotonic()
+        try:
+            result = await self._inner.crawl(
+                request,
+                session=session,
+                proxy_info=proxy_info,
+                statistics=statistics,
+                timeout=timeout,
+            )
+        # Crawlee times navigations out by cancelling them
+        except (Exception, asyncio.CancelledError):
+            self._controller.record(None, time.monotonic() - started_at)
+            raise
+        latency = time.monotonic() - started_at
+
+        response = result.http_response
+        self._controller.record(
+            getattr(response, 'direct_status_code', None) or response.status_code,
+            latency,
+            unlocked=getattr(response, 'unlocked', False),
+        )
+        return result
+
+    async def send_request(self, url: str, **kwargs: Any) -> Any:
+        return await self._inner.send_request(url, **kwargs)
+
+    def stream(self, url: str, **kwargs: Any) -> Any:
+        return self._inner.stream(url, **kwargs)
+
+    async def cleanup(self) -> None:
+        logger.info('Adaptive concurrency summary: final limit=%d', self._controller.limit)
+        await self._inner.cleanup()
+
+
+def build_concurrency_controller(maximum: int) -> AimdController | None:
+    """Build the controller when TFMKT_ADAPTIVE_CONCURRENCY is set.
+
+    TFMKT_ADAPTIVE_INTERVAL, TFMKT_ADAPTIVE_MAX_BLOCK_RATE and
+    TFMKT_ADAPTIVE_MAX_P95_LATENCY (seconds) tune its decisions.
+    """
+    if os.environ.get('TFMKT_ADAPTIVE_CONCURRENCY', '').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    options = {'maximum': maximum}
+    for env_var, option in (
+        ('TFMKT_ADAPTIVE_INTERVAL', 'interval'),
+        ('TFMKT_ADAPTIVE_MAX_BLOCK_RATE', 'max_block_rate'),
+        ('TFMKT_ADAPTIVE_MAX_P95_LATENCY', 'max_p95_latency'),
+    ):
+        value = os.environ.get(env_var)
+        if value:
+            options[option] = float(value)
+    return AimdController(**options)
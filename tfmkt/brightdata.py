@@ -1,10 +1,18 @@
+import asyncio
 import json
 import logging
 import os
-from typing import Any, AsyncIterator
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import Any, AsyncIterator, Callable
+from urllib.parse import urlparse
 
 from crawlee.http_clients import HttpClient, HttpCrawlingResult, ImpitHttpClient
 
+from tfmkt.throttling import TrafficLane
+from tfmkt.workers import record_worker_stats
+
 
 logger = logging.getLogger(__name__)
 
@@ -18,15 +26,32 @@ DATADOME_MARKERS = (
     b'enable javascript and then reload',
 )
 
+# Responses fetched through the Web Unlocker that are kept in memory, so a URL
+# reached again shortly after is not paid for twice. Older ones are fetched
+# again, unless the response cache has them.
+UNLOCKED_MEMO_SIZE = 256
+
 
 class _MemoryResponse:
-    """Replayable HTTP response backed by an in-memory body."""
+    """Replayable HTTP response backed by an in-memory body.
 
-    def __init__(self, response: Any, body: bytes) -> None:
+    Also tells whether it was fetched through the Web Unlocker, and which
+    status the direct attempt got, if one was made.
+    """
+
+    def __init__(
+        self,
+        response: Any,
+        body: bytes,
+        direct_status_code: int | None = None,
+        unlocked: bool = False,
+    ) -> None:
         self._http_version = response.http_version
         self._status_code = response.status_code
         self._headers = response.headers
         self._body = body
+        self.direct_status_code = direct_status_code
+        self.unlocked = unlocked
 
     @property
     def http_version(self) -> str:
@@ -56,16 +81,110 @@ def looks_blocked(status_code: int, body: bytes) -> bool:
     return any(marker in normalized_body for marker in DATADOME_MARKERS)
 
 
+class DirectAccessBreaker:
+    """Circuit breaker over direct requests, per host and URL pattern.
+
+    A pattern opens once at least `min_samples` of its last `window` direct
+    attempts were recorded and `threshold` of them were blocked. While open,
+    direct attempts are skipped, except for one probe every `probe_interval`
+    seconds; a probe that gets through closes the pattern again.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        threshold: float = 0.8,
+        min_samples: int = 5,
+        probe_interval: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._window = window
+        self._threshold = threshold
+        self._min_samples = min_samples
+        self._probe_interval = probe_interval
+        self._clock = clock
+        self._outcomes: dict[str, deque] = {}
+        self._opened_at: dict[str, float] = {}
+
+    @staticmethod
+    def pattern(url: str) -> str:
+        """Return the pattern `url` is tracked under, such as www.transfermarkt.co.uk/profil/spieler."""
+        parsed = urlparse(url)
+        segments = [segment for segment in parsed.path.split('/') if segment]
+        # Transfermarkt paths read /<slug>/<page type>/<entity>/<id>, where the
+        # slug changes with every entity and the page type decides the blocking
+        prefix = segments[1:3] if len(segments) >= 3 else segments[:1]
+        return '/'.join([parsed.netloc, *prefix])
+
+    def allow_direct(self, url: str) -> bool:
+        pattern = self.pattern(url)
+        opened_at = self._opened_at.get(pattern)
+        if opened_at is None:
+            return True
+
+        now = self._clock()
+        if now - opened_at >= self._probe_interval:
+            # Let this one request probe, and hold the others off until the next interval
+            self._opened_at[pattern] = now
+            return True
+        return False
+
+    def record(self, url: str, blocked: bool) -> None:
+        pattern = self.pattern(url)
+        outcomes = self._outcomes.setdefault(pattern, deque(maxlen=self._window))
+        outcomes.append(blocked)
+
+        if pattern in self._opened_at:
+            if not blocked:
+                logger.info('Direct access to %s recovered, closing its circuit', pattern)
+                del self._opened_at[pattern]
+                outcomes.clear()
+            return
+
+        if len(outcomes) >= self._min_samples and sum(outcomes) / len(outcomes) >= self._threshold:
+            logger.info(
+                'Direct access to %s blocked %d of the last %d times, going straight to Bright Data',
+                pattern,
+                sum(outcomes),
+                len(outcomes),
+            )
+            self._opened_at[pattern] = self._clock()
+
+
 class WebUnlockerHttpClient(HttpClient):
-    """Try requests directly, falling back to Bright Data Web Unlocker on blocks."""
+    """Try requests directly, falling back to Bright Data Web Unlocker on blocks.
+
+    URL patterns that keep getting blocked skip the direct attempt altogether,
+    see DirectAccessBreaker. Direct requests and Web Unlocker requests each go
+    through their own TrafficLane, so either can be capped or slowed down
+    without holding back the other.
+
+    Pass `request_timeout` to time each attempt from when its lane lets it
+    through, rather than passing on the crawl's timeout, which also runs while
+    the request waits on the lanes.
+    """
 
-    def __init__(self, inner: HttpClient, api_key: str, zone: str) -> None:
+    def __init__(
+        self,
+        inner: HttpClient,
+        api_key: str,
+        zone: str,
+        breaker: DirectAccessBreaker | None = None,
+        direct_lane: TrafficLane | None = None,
+        unlocker_lane: TrafficLane | None = None,
+        request_timeout: timedelta | None = None,
+    ) -> None:
         super().__init__()
         self._inner = inner
         self._api_key = api_key
         self._zone = zone
+        self._breaker = breaker or DirectAccessBreaker()
+        self._direct_lane = direct_lane or TrafficLane('direct')
+        self._unlocker_lane = unlocker_lane or TrafficLane('unlocker')
+        self._request_timeout = request_timeout
         self.attempted = 0
         self.unlocked = 0
+        self.direct_skipped = 0
 
     async def crawl(
         self,
@@ -77,40 +196,54 @@ class WebUnlockerHttpClient(HttpClient):
         timeout: Any = None,
     ) -> HttpCrawlingResult:
         self.attempted += 1
-        direct_result = await self._inner.crawl(
-            request,
-            session=session,
-            proxy_info=proxy_info,
-            statistics=None,
-            timeout=timeout,
-        )
-        response = direct_result.http_response
-        body = await response.read()
+        blocked = True
+        direct_status_code = None
+        timeout = self._request_timeout or timeout
+
+        if self._breaker.allow_direct(request.url):
+            async with self._direct_lane.slot():
+                direct_result = await self._inner.crawl(
+                    request,
+                    session=session,
+                    proxy_info=proxy_info,
+                    statistics=None,
+                    timeout=timeout,
+                )
+                response = direct_result.http_response
+                body = await response.read()
+            direct_status_code = response.status_code
+            blocked = looks_blocked(response.status_code, body)
+            self._breaker.record(request.url, blocked)
+        else:
+            self.direct_skipped += 1
 
-        if looks_blocked(response.status_code, body):
+        if blocked:
             self.unlocked += 1
-            response = await self._inner.send_request(
-                BRIGHTDATA_ENDPOINT,
-                method='POST',
-                headers={
-                    'Authorization': f'Bearer {self._api_key}',
-                    'Content-Type': 'application/json',
-                },
-                payload=json.dumps({
-                    'zone': self._zone,
-                    'url': request.url,
-                    'format': 'raw',
-                }).encode('utf-8'),
-                session=session,
-                timeout=timeout,
-            )
-            body = await response.read()
+            async with self._unlocker_lane.slot():
+                response = await self._inner.send_request(
+                    BRIGHTDATA_ENDPOINT,
+                    method='POST',
+                    headers={
+                        'Authorization': f'Bearer {self._api_key}',
+                        'Content-Type': 'application/json',
+                    },
+                    payload=json.dumps({
+                        'zone': self._zone,
+                        'url': request.url,
+                        'format': 'raw',
+                    }).encode('utf-8'),
+                    session=session,
+                    timeout=timeout,
+                )
+                body = await response.read()
             request.loaded_url = request.url
 
         if statistics:
             statistics.register_status_code(response.status_code)
 
-        return HttpCrawlingResult(http_response=_MemoryResponse(response, body))
+        return HttpCrawlingResult(
+            http_response=_MemoryResponse(response, body, direct_status_code=direct_status_code, unlocked=blocked),
+        )
 
     async def send_request(self, url: str, **kwargs: Any) -> Any:
         return await self._inner.send_request(url, **kwargs)
@@ -120,18 +253,126 @@ class WebUnlockerHttpClient(HttpClient):
 
     async def cleanup(self) -> None:
         logger.info(
-            'Bright Data Web Unlocker summary: attempted=%d unlocked=%d',
+            'Bright Data Web Unlocker summary: attempted=%d unlocked=%d direct_skipped=%d',
             self.attempted,
             self.unlocked,
+            self.direct_skipped,
         )
+        record_worker_stats(
+            'Bright Data Web Unlocker',
+            attempted=self.attempted,
+            unlocked=self.unlocked,
+            direct_skipped=self.direct_skipped,
+        )
+        await self._inner.cleanup()
+
+
+class CoalescingHttpClient(HttpClient):
+    """Share one fetch between crawls of the same URL.
+
+    A crawl for a URL already being fetched waits for that fetch and gets the
+    same response, so parents pointing at one page cost one request. The last
+    UNLOCKED_MEMO_SIZE responses that needed the Web Unlocker are also reused
+    when their URL comes up again later in the run. Only a response cache
+    keeps every unlocked page from being paid for twice in a run.
+    """
+
+    def __init__(self, inner: HttpClient, memo_size: int = UNLOCKED_MEMO_SIZE) -> None:
+        super().__init__()
+        self._inner = inner
+        self._memo_size = memo_size
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self._unlocked: OrderedDict[str, tuple[str, Any]] = OrderedDict()
+        self.coalesced = 0
+
+    async def crawl(
+        self,
+        request: Any,
+        *,
+        session: Any = None,
+        proxy_info: Any = None,
+        statistics: Any = None,
+        timeout: Any = None,
+    ) -> HttpCrawlingResult:
+        loaded_url, response = await self._fetch(request, session, proxy_info, timeout)
+        request.loaded_url = loaded_url
+        if statistics:
+            statistics.register_status_code(response.status_code)
+        return HttpCrawlingResult(http_response=response)
+
+    async def _fetch(self, request: Any, session: Any, proxy_info: Any, timeout: Any) -> tuple[str, Any]:
+        url = request.url
+        while True:
+            if url in self._unlocked:
+                self._unlocked.move_to_end(url)
+                self.coalesced += 1
+                return self._unlocked[url]
+
+            leader = self._in_flight.get(url)
+            if leader is None:
+                break
+            try:
+                # Shielded, so a follower timing out leaves the fetch to the others
+                shared = await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() or not leader.cancelled():
+                    raise
+                # The leader was cancelled, not us: fetch it ourselves
+                continue
+            self.coalesced += 1
+            return shared
+
+        leader = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting, so a failure is not worth a warning
+        leader.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._in_flight[url] = leader
+        try:
+            result = await self._inner.crawl(request, session=session, proxy_info=proxy_info, timeout=timeout)
+        except asyncio.CancelledError:
+            leader.cancel()
+            raise
+        except Exception as error:
+            leader.set_exception(error)
+            raise
+        finally:
+            del self._in_flight[url]
+
+        shared = (request.loaded_url or url, result.http_response)
+        leader.set_result(shared)
+        if getattr(result.http_response, 'unlocked', False):
+            self._unlocked[url] = shared
+            if len(self._unlocked) > self._memo_size:
+                self._unlocked.popitem(last=False)
+        return shared
+
+    async def send_request(self, url: str, **kwargs: Any) -> Any:
+        return await self._inner.send_request(url, **kwargs)
+
+    def stream(self, url: str, **kwargs: Any) -> Any:
+        return self._inner.stream(url, **kwargs)
+
+    async def cleanup(self) -> None:
+        logger.info('Request coalescing summary: coalesced=%d', self.coalesced)
+        record_worker_stats('Request coalescing', coalesced=self.coalesced)
         await self._inner.cleanup()
 
 
-def build_http_client() -> HttpClient | None:
+def build_http_client(
+    direct_lane: TrafficLane | None = None,
+    unlocker_lane: TrafficLane | None = None,
+    request_timeout: timedelta | None = None,
+) -> HttpClient | None:
     """Build the fallback client when Bright Data credentials are configured."""
     api_key = os.environ.get('BRIGHTDATA_API_KEY')
     if not api_key:
         return None
 
     zone = os.environ.get('BRIGHTDATA_ZONE') or 'web_unlocker2'
-    return WebUnlockerHttpClient(ImpitHttpClient(), api_key, zone)
+    return WebUnlockerHttpClient(
+        ImpitHttpClient(),
+        api_key,
+        zone,
+        direct_lane=direct_lane,
+        unlocker_lane=unlocker_lane,
+        request_timeout=request_timeout,
+    )
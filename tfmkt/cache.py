@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+
+from crawlee import HttpHeaders
+from crawlee.http_clients import HttpClient, HttpCrawlingResult
+
+from tfmkt.brightdata import looks_blocked
+from tfmkt.workers import record_worker_stats
+
+
+logger = logging.getLogger(__name__)
+
+# Eviction trims the cache to this fraction of its size limit, so that a full
+# cache is not rescanned on every store.
+EVICTION_TARGET = 0.9
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode for a request that is not in the cache."""
+
+
+class _StoredResponse:
+    """HTTP response rebuilt from a cache entry."""
+
+    def __init__(self, metadata: dict, body: bytes) -> None:
+        self._http_version = metadata['http_version']
+        self._status_code = metadata['status_code']
+        self._headers = HttpHeaders(metadata['headers'])
+        self._body = body
+
+    @property
+    def http_version(self) -> str:
+        return self._http_version
+
+    @property
+    def status_code(self) -> int:
+        return self._status_code
+
+    @property
+    def headers(self) -> Any:
+        return self._headers
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def read_stream(self) -> AsyncIterator[bytes]:
+        yield self._body
+
+
+class ResponseCache:
+    """Responses stored on disk under the SHA-256 of their request URL.
+
+    Each entry is a pair of files sharded by the first two hex digits of the
+    key: `<key>.body` with the raw response body and `<key>.json` with the
+    status, headers, final URL and the label and user data of the request.
+    Entries older than `ttl` seconds are treated as missing. When `max_size`
+    bytes is exceeded, the least recently read entries are evicted first.
+    """
+
+    def __init__(self, directory: str, ttl: float | None = None, max_size: int | None = None) -> None:
+        self._directory = Path(directory)
+        self._ttl = ttl
+        self._max_size = max_size
+        self._size = None
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = self.key(url)
+        shard = self._directory / key[:2]
+        return shard / f'{key}.json', shard / f'{key}.body'
+
+    def get(self, url: str) -> tuple[dict, bytes] | None:
+        """Return the (metadata, body) stored for `url`, or None if missing or expired."""
+        metadata_path, body_path = self._paths(url)
+        try:
+            metadata = json.loads(metadata_path.read_text())
+            body = body_path.read_bytes()
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if self._ttl is not None and time.time() - metadata['stored_at'] > self._ttl:
+            self._remove(metadata_path, body_path)
+            return None
+
+        # The body mtime doubles as the last-read time for eviction
+        os.utime(body_path)
+        return metadata, body
+
+    def put(self, url: str, metadata: dict, body: bytes) -> None:
+        metadata_path, body_path = self._paths(url)
+        metadata_path.parent.mkdir(parents=True, exist_ok=True)
+
+        if self._max_size is not None:
+            # Size the cache before writing, so the new entry is counted once
+            size_without_entry = self.size() - self._entry_size(metadata_path, body_path)
+        metadata = {**metadata, 'url': url, 'stored_at': time.time()}
+
+        # Write through temporary files so a crash never leaves a torn entry
+        for path, content in (
+            (body_path, body),
+            (metadata_path, json.dumps(metadata).encode('utf-8')),
+        ):
+            temporary_path = path.with_suffix(path.suffix + '.tmp')
+            temporary_path.write_bytes(content)
+            os.replace(temporary_path, path)
+
+        if self._max_size is not None:
+            self._size = size_without_entry + self._entry_size(metadata_path, body_path)
+            if self._size > self._max_size:
+                self._evict()
+
+    def size(self) -> int:
+        """Return the total size of the cache in bytes."""
+        if self._size is None:
+            self._size = sum(
+                path.stat().st_size for path in self._directory.glob('*/*') if not path.name.endswith('.tmp')
+            )
+        return self._size
+
+    def entries(self) -> Iterator[tuple[dict, Path]]:
+        """Yield (metadata, body path) for every entry in the cache, listing one shard at a time."""
+        for shard in sorted(self._directory.glob('*/')):
+            for metadata_path in sorted(shard.glob('*.json')):
+                try:
+                    metadata = json.loads(metadata_path.read_text())
+                except (FileNotFoundError, json.JSONDecodeError):
+                    continue
+                yield metadata, metadata_path.with_suffix('.body')
+
+    def _evict(self) -> None:
+        bodies = sorted(self._directory.glob('*/*.body'), key=lambda path: path.stat().st_mtime)
+        target = self._max_size * EVICTION_TARGET
+        evicted = 0
+        for body_path in bodies:
+            if self._size <= target:
+                break
+            metadata_path = body_path.with_suffix('.json')
+            self._size -= self._entry_size(metadata_path, body_path)
+            self._remove(metadata_path, body_path)
+            evicted += 1
+        logger.info('Evicted %d entries from the response cache in %s', evicted, self._directory)
+
+    @staticmethod
+    def _entry_size(metadata_path: Path, body_path: Path) -> int:
+        size = 0
+        for path in (metadata_path, body_path):
+            try:
+                size += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    @staticmethod
+    def _remove(metadata_path: Path, body_path: Path) -> None:
+        for path in (metadata_path, body_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class CachingHttpClient(HttpClient):
+    """Serve responses from a ResponseCache, fetching and storing misses through `inner`.
+
+    Only responses that are neither errors nor block pages are stored, so a
+    replay never feeds a DataDome challenge to a parser. With `replay=True`
+    the network is never used and misses fail the request.
+    """
+
+    def __init__(self, inner: HttpClient, cache: ResponseCache, replay: bool = False) -> None:
+        super().__init__()
+        self._inner = inner
+        self._cache = cache
+        self._replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    async def crawl(
+        self,
+        request: Any,
+        *,
+        session: Any = None,
+        proxy_info: Any = None,
+        statistics: Any = None,
+        timeout: Any = None,
+    ) -> HttpCrawlingResult:
+        cached = await asyncio.to_thread(self._cache.get, request.url)
+        if cached is not None:
+            self.hits += 1
+            metadata, body = cached
+            request.loaded_url = metadata['loaded_url']
+            if statistics:
+                statistics.register_status_code(metadata['status_code'])
+            return HttpCrawlingResult(http_response=_StoredResponse(metadata, body))
+
+        self.misses += 1
+        if self._replay:
+            raise CacheMissError(f'{request.url} is not in the response cache')
+
+        result = await self._inner.crawl(
+            request,
+            session=session,
+            proxy_info=proxy_info,
+            statistics=statistics,
+            timeout=timeout,
+        )
+        response = result.http_response
+        body = await response.read()
+        metadata = {
+            'loaded_url': request.loaded_url or request.url,
+            'status_code': response.status_code,
+            'http_version': response.http_version,
+            'headers': dict(response.headers),
+            # Kept so pages can be fed back into their handlers offline, see tfmkt.reparse
+            'label': request.label,
+            'user_data': dict(request.user_data),
+        }
+
+        if response.status_code < 400 and not looks_blocked(response.status_code, body):
+            await asyncio.to_thread(self._cache.put, request.url, metadata, body)
+            self.stored += 1
+
+        return HttpCrawlingResult(http_response=_StoredResponse(metadata, body))
+
+    async def send_request(self, url: str, **kwargs: Any) -> Any:
+        return await self._inner.send_request(url, **kwargs)
+
+    def stream(self, url: str, **kwargs: Any) -> Any:
+        return self._inner.stream(url, **kwargs)
+
+    async def cleanup(self) -> None:
+        logger.info(
+            'Response cache summary: hits=%d misses=%d stored=%d',
+            self.hits,
+            self.misses,
+            self.stored,
+        )
+        record_worker_stats('Response cache', hits=self.hits, misses=self.misses, stored=self.stored)
+        await self._inner.cleanup()
+
+
+def build_response_cache() -> ResponseCache | None:
+    """Build the response cache when TFMKT_CACHE_DIR is configured.
+
+    TFMKT_CACHE_TTL sets the entry lifetime in seconds and TFMKT_CACHE_MAX_MB
+    the size limit in megabytes. Both default to unlimited.
+    """
+    directory = os.environ.get('TFMKT_CACHE_DIR')
+    if not directory:
+        return None
+
+    ttl = os.environ.get('TFMKT_CACHE_TTL')
+    max_mb = os.environ.get('TFMKT_CACHE_MAX_MB')
+    return ResponseCache(
+        directory,
+        ttl=float(ttl) if ttl else None,
+        max_size=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+    )
+
+
+def replay_enabled() -> bool:
+    """Return whether TFMKT_REPLAY asks for crawls to be served from the cache only."""
+    return os.environ.get('TFMKT_REPLAY', '').lower() in ('1', 'true', 'yes')
+
@@ -1,6 +1,9 @@
 import argparse
 import asyncio
 import importlib
+import logging
+import os
+import sys
 
 CRAWLER_MODULES = {
     'confederations': 'tfmkt.crawlers.confederations',
@@ -15,15 +18,34 @@ CRAWLER_MODULES = {
     'game_lineups': 'tfmkt.crawlers.game_lineups',
 }
 
+# Flags making a crawler also emit the items of the crawler that usually follows
+# it, from pages it fetches anyway, and the crawler each of them applies to
+FUSED_CRAWL_FLAGS = {
+    'with_lineups': 'games',
+    'with_players': 'clubs',
+    'with_countries': 'competitions',
+}
+
 
 def main():
-    parser = argparse.ArgumentParser(description='Transfermarkt scraper')
+    if sys.argv[1:2] == ['reparse']:
+        return reparse_main(sys.argv[2:])
+    if sys.argv[1:2] == ['pipeline']:
+        return pipeline_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(
+        description='Transfermarkt scraper',
+        epilog='Run "tfmkt pipeline -h" to chain crawlers in one process, '
+               'or "tfmkt reparse -h" to re-run handlers over an archive of fetched pages.',
+    )
     parser.add_argument('crawler', choices=CRAWLER_MODULES.keys(), help='Crawler to run')
-    parser.add_argument('-p', '--parents', default=None, help='Parents file path')
-    parser.add_argument('-s', '--season', default=2024, type=int, help='Season year')
-    parser.add_argument('--base-url', default=None, help='Base URL override')
+    add_crawl_arguments(parser)
 
     args = parser.parse_args()
+    check_fused_crawl(parser, args, args.crawler)
+    export_http_arguments(parser, args)
+    if args.workers:
+        return run_workers_main(sys.argv[1:], args)
 
     module = importlib.import_module(CRAWLER_MODULES[args.crawler])
     asyncio.run(module.run(
@@ -33,5 +55,174 @@ def main():
     ))
 
 
+def pipeline_main(argv):
+    from tfmkt.pipeline import run_pipeline
+
+    parser = argparse.ArgumentParser(
+        prog='tfmkt pipeline',
+        description='Run crawlers in one process, each feeding its items to the next as parents',
+    )
+    parser.add_argument('crawlers', help='Comma-separated crawlers, for example competitions,clubs,players')
+    add_crawl_arguments(parser)
+
+    args = parser.parse_args(argv)
+    export_http_arguments(parser, args)
+
+    crawlers = args.crawlers.split(',')
+    for crawler in crawlers:
+        if crawler not in CRAWLER_MODULES:
+            parser.error(f"unknown crawler '{crawler}' (choose from {', '.join(CRAWLER_MODULES)})")
+    if len(set(crawlers)) != len(crawlers):
+        parser.error('each crawler can only appear once in a pipeline')
+    # Items of a fused crawl are not parents for a further stage
+    check_fused_crawl(parser, args, crawlers[-1])
+    if args.workers:
+        return run_workers_main(['pipeline', *argv], args)
+
+    modules = [importlib.import_module(CRAWLER_MODULES[crawler]) for crawler in crawlers]
+    asyncio.run(run_pipeline(
+        modules,
+        parents_arg=args.parents,
+        season=args.season,
+        base_url=args.base_url,
+    ))
+
+
+def run_workers_main(argv, args):
+    from tfmkt.workers import run_workers
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_workers(argv, args.workers, parents_arg=args.parents, state_dir=args.state_dir))
+
+
+def shard_argument(value):
+    """Check a --shard value of the form i/n, with 0 <= i < n."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, for example 0/4, got '{value}'")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 0 and {count - 1}, got {index}")
+    return value
+
+
+def check_fused_crawl(parser, args, crawler):
+    """Check that the fused crawl flags given apply to `crawler`, and have pages to start from."""
+    for flag, fused_crawler in FUSED_CRAWL_FLAGS.items():
+        if getattr(args, flag) and crawler != fused_crawler:
+            parser.error(f"--{flag.replace('_', '-')} only applies to the {fused_crawler} crawler, run last")
+    # Line-ups start from game reports, which --lite only reads for the --full competitions
+    if args.with_lineups and args.lite and not (args.full or os.environ.get('TFMKT_FULL_COMPETITIONS')):
+        parser.error('--with-lineups reads the game reports --lite skips, '
+                     'list the competitions to crawl line-ups for with --full')
+
+
+def add_crawl_arguments(parser):
+    parser.add_argument('-p', '--parents', default=None, help='Parents file path')
+    parser.add_argument('-s', '--season', default=2024, type=int, help='Season year')
+    parser.add_argument('--base-url', default=None, help='Base URL override')
+    parser.add_argument('--cache-dir', default=None, help='Keep fetched pages in this response cache directory')
+    parser.add_argument('--cache-ttl', default=None, type=float, help='Seconds before a cached page expires')
+    parser.add_argument('--cache-max-mb', default=None, type=float, help='Evict cached pages beyond this size')
+    parser.add_argument('--replay', action='store_true', help='Serve every page from the cache, never the network')
+    parser.add_argument('--direct-concurrency', default=None, type=int, help='Max parallel direct requests')
+    parser.add_argument('--direct-rate', default=None, type=float, help='Max direct requests per second')
+    parser.add_argument('--unlocker-concurrency', default=None, type=int, help='Max parallel Web Unlocker requests')
+    parser.add_argument('--unlocker-rate', default=None, type=float, help='Max Web Unlocker requests per second')
+    parser.add_argument('--adaptive-concurrency', action='store_true',
+                        help='Adjust concurrency to 429s, block rate and latency')
+    parser.add_argument('--state-dir', default=None,
+                        help='Keep crawl state here, to resume an interrupted crawl by running it again')
+    parser.add_argument('--dead-letter', default=None, help='Append failed requests to this JSON lines file')
+    parser.add_argument('--retry-failed', default=None,
+                        help='Crawl only the failed requests listed in this dead-letter file, not the parents')
+    parser.add_argument('--incremental', default=None, metavar='INDEX',
+                        help='Skip games, players and appearances recorded in this seen index by earlier runs')
+    parser.add_argument('--shard', default=None, type=shard_argument, metavar='I/N',
+                        help='Only crawl the pages of shard I out of N, counting from 0')
+    parser.add_argument('--parse-workers', default=None, type=int,
+                        help='Parse detail pages in a pool of this many processes, off the event loop')
+    parser.add_argument('--parse-pool', default=None, choices=('process', 'thread'),
+                        help='Kind of pool --parse-workers starts, processes by default')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='Split the crawl between this many processes, merging their output')
+    parser.add_argument('--with-lineups', action='store_true',
+                        help='games: also emit game_lineups items, without fetching the game reports twice')
+    parser.add_argument('--with-players', action='store_true',
+                        help='clubs: also emit player items, without fetching the club pages twice')
+    parser.add_argument('--with-countries', action='store_true',
+                        help='competitions: also emit country items, without fetching the listings twice')
+    parser.add_argument('--lite', action='store_true',
+                        help='players, games: build items from squad tables and fixture lists, '
+                             'without a request per player or game')
+    parser.add_argument('--full', default=None, metavar='COMPETITION_IDS',
+                        help='games: with --lite, still read the game reports of these comma-separated competitions')
+
+
+def export_http_arguments(parser, args):
+    if args.replay and not (args.cache_dir or os.environ.get('TFMKT_CACHE_DIR')):
+        parser.error('--replay needs a --cache-dir to replay from')
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.workers and args.shard:
+        parser.error('--workers shards the crawl itself, it cannot be combined with --shard')
+    if args.retry_failed and args.parents:
+        parser.error('--retry-failed crawls the requests of the dead-letter file, it takes no --parents')
+    if args.retry_failed and args.dead_letter and os.path.abspath(args.retry_failed) == os.path.abspath(args.dead_letter):
+        parser.error('--dead-letter must be another file than the one passed to --retry-failed')
+
+    # Crawlers read their HTTP settings from the environment, see create_crawler
+    for env_var, value in (
+        ('TFMKT_CACHE_DIR', args.cache_dir),
+        ('TFMKT_CACHE_TTL', args.cache_ttl),
+        ('TFMKT_CACHE_MAX_MB', args.cache_max_mb),
+        ('TFMKT_REPLAY', '1' if args.replay else None),
+        ('TFMKT_DIRECT_CONCURRENCY', args.direct_concurrency),
+        ('TFMKT_DIRECT_RATE', args.direct_rate),
+        ('TFMKT_UNLOCKER_CONCURRENCY', args.unlocker_concurrency),
+        ('TFMKT_UNLOCKER_RATE', args.unlocker_rate),
+        ('TFMKT_ADAPTIVE_CONCURRENCY', '1' if args.adaptive_concurrency else None),
+        ('TFMKT_STATE_DIR', args.state_dir),
+        ('TFMKT_DEAD_LETTER', args.dead_letter),
+        ('TFMKT_RETRY_FAILED', args.retry_failed),
+        ('TFMKT_SEEN_INDEX', args.incremental),
+        ('TFMKT_SHARD', args.shard),
+        ('TFMKT_PARSE_WORKERS', args.parse_workers),
+        ('TFMKT_PARSE_POOL', args.parse_pool),
+        ('TFMKT_WITH_LINEUPS', '1' if args.with_lineups else None),
+        ('TFMKT_WITH_PLAYERS', '1' if args.with_players else None),
+        ('TFMKT_WITH_COUNTRIES', '1' if args.with_countries else None),
+        ('TFMKT_LITE', '1' if args.lite else None),
+        ('TFMKT_FULL_COMPETITIONS', args.full),
+    ):
+        if value is not None:
+            os.environ[env_var] = str(value)
+
+
+def reparse_main(argv):
+    from tfmkt.reparse import REPARSE_HANDLERS, reparse
+
+    parser = argparse.ArgumentParser(
+        prog='tfmkt reparse',
+        description='Re-run crawler handlers over archived pages, without the network',
+    )
+    parser.add_argument('crawler', choices=REPARSE_HANDLERS.keys(), help='Crawler whose handler to run')
+    parser.add_argument('--archive', required=True, help='Response cache directory written with --cache-dir')
+    parser.add_argument('-j', '--jobs', default=None, type=int, help='Parser processes, one per core by default')
+    parser.add_argument('--lite', action='store_true',
+                        help='players, games: also build items from the squad tables and fixture lists of a --lite crawl')
+    parser.add_argument('--full', default=None, metavar='COMPETITION_IDS',
+                        help='games: with --lite, competitions whose fixture lists the crawl did not build items from')
+
+    args = parser.parse_args(argv)
+    # Read by the handlers, as in the crawl
+    for env_var, value in (('TFMKT_LITE', '1' if args.lite else None), ('TFMKT_FULL_COMPETITIONS', args.full)):
+        if value is not None:
+            os.environ[env_var] = value
+
+    logging.basicConfig(level=logging.INFO)
+    reparse(args.crawler, args.archive, jobs=args.jobs)
+
+
 if __name__ == '__main__':
     main()
@@ -2,20 +2,91 @@ import os
 import sys
 import json
 import gzip
+import hashlib
+import time
+import signal
+import asyncio
 import logging
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from contextvars import ContextVar
 from datetime import timedelta
 
-from crawlee import Request
-from crawlee.crawlers import ParselCrawler
+from crawlee import ConcurrencySettings, Request
+from crawlee.configuration import Configuration
+from crawlee.request_loaders import RequestManager
+from crawlee.storage_clients import FileSystemStorageClient
+from crawlee.storages import RequestQueue
+from crawlee.crawlers import HttpCrawler, ParselCrawler
+from crawlee.http_clients import ImpitHttpClient
 
-from tfmkt.brightdata import build_http_client
+from tfmkt.autoscaling import AdaptiveHttpClient, AdmissionRequestManager, build_concurrency_controller
+from tfmkt.brightdata import CoalescingHttpClient, build_http_client
+from tfmkt.cache import CachingHttpClient, build_response_cache, replay_enabled
+from tfmkt.selectors import CompiledSelector, compiled
+from tfmkt.throttling import build_concurrency_settings, build_traffic_lane
+from tfmkt.workers import record_worker_failures
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_BASE_URL = 'https://www.transfermarkt.co.uk'
 
+# Seconds between checks for a crawler having handled all of its requests
+FINISHED_POLL_INTERVAL = 0.5
 
-def create_crawler(crawler_class=ParselCrawler, use_unlocker=True):
+# Requests waiting in a crawler's queue beyond which run_crawler stops
+# reading parents, so a huge parents file is never loaded all at once
+MAX_PENDING_REQUESTS = 1000
+
+# Items written out by ItemWriter in one go, and the most seconds an item may
+# sit in its buffer, so that a downstream crawler in a pipe is never starved
+WRITE_BATCH_SIZE = 256
+WRITE_INTERVAL = 1.0
+
+# Time each attempt through the Web Unlocker client gets once its traffic lane
+# lets it through, and the time a request may wait on the lanes on top of its
+# direct and unlocker attempts
+UNLOCKER_REQUEST_TIMEOUT = timedelta(seconds=120)
+LANE_WAIT_TIMEOUT = timedelta(minutes=5)
+
+
+# Items a crawl may get ahead of the code iterating over them, see stream_items.
+# Once that many are waiting, its crawlers take no new requests.
+ITEM_BUFFER_SIZE = 1000
+
+# Item stream the crawlers created in this context emit to, see stream_items()
+_item_stream = ContextVar('item_stream', default=None)
+
+# Writer the items streamed in this context are written with, see write_items()
+_item_writer = ContextVar('item_writer', default=None)
+
+# HTTP client options shared by every crawler created inside shared_http_clients()
+_shared_http_clients = ContextVar('shared_http_clients', default=None)
+
+# Pool pages are parsed on when TFMKT_PARSE_WORKERS is set, see extract_page()
+_parse_pool = None
+
+# Whether TFMKT_SHARD applies to the crawls started in this context, see unsharded()
+_sharding = ContextVar('sharding', default=True)
+
+
+class CrawlFailedError(Exception):
+    """Raised by stream_items() after the last item, when some requests of the crawl failed."""
+
+    def __init__(self, failures):
+        super().__init__(f'{len(failures)} requests failed')
+        self.failures = failures
+
+
+def env_flag(name):
+    """Return whether the environment variable `name` is set to 1, true or yes."""
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+async def create_crawler(crawler_class=ParselCrawler, use_unlocker=True, name=None):
     """Create a crawler that goes through Bright Data and tracks failed requests.
 
     Pass `crawler_class` to pick a different static crawler, for example
@@ -27,20 +98,57 @@ def create_crawler(crawler_class=ParselCrawler, use_unlocker=True):
     targets Bright Data refuses to proxy, which it does for any path
     Transfermarkt disallows in robots.txt.
 
+    Pass `name` to give the crawler a request queue of its own, so that several
+    crawlers can run side by side in one process. Inside shared_http_clients()
+    the crawler uses the HTTP client shared by the whole context.
+
+    Set TFMKT_STATE_DIR to keep the request queue of named crawlers on disk,
+    so that an interrupted crawl resumes where it stopped.
+
+    Set TFMKT_DEAD_LETTER to append the requests that fail to a JSON lines
+    file, and TFMKT_RETRY_FAILED to such a file to crawl the requests it lists
+    for the crawler `name`. Retries take no parents, except in a pipeline,
+    where the items the retries of a stage yield are new parents of the next.
+
     Set TFMKT_MAX_REQUESTS to stop a crawl early. Useful for smoke runs against
     competitions too large to scrape in full, where the point is to prove the
     crawler works rather than to collect everything.
 
-    Returns a (crawler, failures) tuple. After crawler.run(), call
-    check_failures(failures) to exit with non-zero status if any requests failed.
+    Set TFMKT_CACHE_DIR to keep every fetched page in an on-disk response
+    cache, and TFMKT_REPLAY to re-run a crawl from that cache alone, without
+    touching the network.
+
+    Set TFMKT_DIRECT_CONCURRENCY and TFMKT_DIRECT_RATE (requests per second)
+    to limit requests sent straight to Transfermarkt, and
+    TFMKT_UNLOCKER_CONCURRENCY and TFMKT_UNLOCKER_RATE for those sent through
+    Bright Data. The two are limited independently.
+
+    Set TFMKT_ADAPTIVE_CONCURRENCY to let an AIMD controller cap requests in
+    flight, backing off on 429s, blocks and slow responses.
+
+    Returns a (crawler, failures) tuple. Run the crawler with run_crawler(),
+    and return the failures from the crawl function for stream_items() to
+    report.
     """
     failures = []
 
-    http_client = build_http_client() if use_unlocker else None
-    crawler_options = {'http_client': http_client}
+    shared = _shared_http_clients.get()
+    crawler_options, controller = shared[use_unlocker] if shared is not None else _http_client_options(use_unlocker)
+    crawler_options = dict(crawler_options)
 
-    if http_client is not None:
-        crawler_options['navigation_timeout'] = timedelta(seconds=120)
+    # Kept alive so requests can be fed in while the crawl runs, see run_crawler
+    crawler_options['keep_alive'] = True
+
+    if name is not None:
+        crawler_options['request_manager'] = await open_request_queue(name)
+    stream = _item_stream.get()
+    if stream is not None or controller is not None:
+        request_manager = crawler_options.get('request_manager') or await RequestQueue.open()
+        if stream is not None:
+            request_manager = StreamedRequestManager(request_manager, stream)
+        if controller is not None:
+            request_manager = AdmissionRequestManager(request_manager, controller)
+        crawler_options['request_manager'] = request_manager
 
     max_requests = os.environ.get('TFMKT_MAX_REQUESTS')
     if max_requests:
@@ -51,13 +159,651 @@ def create_crawler(crawler_class=ParselCrawler, use_unlocker=True):
     @crawler.failed_request_handler
     async def on_failed_request(context, error):
         failures.append((context.request.url, error))
+        write_dead_letter(name, context.request, error)
+
+    retry_path = os.environ.get('TFMKT_RETRY_FAILED')
+    if retry_path and name is not None:
+        retries = load_dead_letters(retry_path, name)
+        logger.info('Retrying %d failed %s requests from %s', len(retries), name, retry_path)
+        await crawler.add_requests(retries)
 
     return crawler, failures
 
 
+async def open_request_queue(name):
+    """Open the request queue of crawler `name`, persisted in TFMKT_STATE_DIR if set.
+
+    Without a state directory the queue only lives for the current run. With
+    one, handled and pending requests are kept across runs: feeding the same
+    parents again skips the handled requests, and requests that were in flight
+    when the previous run died are retried.
+    """
+    directory = os.environ.get('TFMKT_STATE_DIR')
+    if not directory:
+        return await RequestQueue.open(alias=name)
+
+    return await RequestQueue.open(
+        # Named queues are never purged, but their names cannot hold underscores
+        name=name.replace('_', '-'),
+        storage_client=FileSystemStorageClient(),
+        configuration=Configuration(storage_dir=directory, purge_on_start=False),
+    )
+
+
+def _http_client_options(use_unlocker):
+    """Build the HTTP client for a crawler, along with the crawler options it calls for.
+
+    Returns the options and the adaptive concurrency controller, or None
+    without TFMKT_ADAPTIVE_CONCURRENCY.
+    """
+    direct_lane = build_traffic_lane('direct')
+    unlocker_lane = build_traffic_lane('unlocker')
+    http_client = build_http_client(direct_lane, unlocker_lane, UNLOCKER_REQUEST_TIMEOUT) if use_unlocker else None
+    crawler_options = {}
+
+    if http_client is not None:
+        # Each attempt is timed by the client, see WebUnlockerHttpClient
+        crawler_options['navigation_timeout'] = 2 * UNLOCKER_REQUEST_TIMEOUT + LANE_WAIT_TIMEOUT
+
+    concurrency_settings = build_concurrency_settings(
+        direct_lane,
+        unlocker_lane if http_client is not None else None,
+    )
+    if concurrency_settings is not None:
+        crawler_options['concurrency_settings'] = concurrency_settings
+
+    # Crawls of a URL already being fetched share its response, with or without the Web Unlocker
+    http_client = CoalescingHttpClient(http_client or ImpitHttpClient())
+
+    controller = build_concurrency_controller(
+        maximum=(concurrency_settings or ConcurrencySettings()).max_concurrency,
+    )
+    if controller is not None:
+        http_client = AdaptiveHttpClient(http_client, controller)
+
+    response_cache = build_response_cache()
+    if response_cache is not None:
+        http_client = CachingHttpClient(http_client, response_cache, replay=replay_enabled())
+
+    crawler_options['http_client'] = http_client
+    return crawler_options, controller
+
+
+@asynccontextmanager
+async def shared_http_clients():
+    """Make every crawler created in this context share its HTTP client.
+
+    One client is built for crawlers going through the Web Unlocker and one for
+    those that never do. Sharing them means traffic lanes, the adaptive
+    controller and the response cache see every request of every crawler.
+    """
+    clients = {}
+    async with AsyncExitStack() as stack:
+        for use_unlocker in (True, False):
+            crawler_options, controller = _http_client_options(use_unlocker)
+            # Entered here, crawlers leave the clients open when they finish
+            crawler_options['http_client'] = await stack.enter_async_context(crawler_options['http_client'])
+            clients[use_unlocker] = crawler_options, controller
+
+        token = _shared_http_clients.set(clients)
+        try:
+            yield
+        finally:
+            _shared_http_clients.reset(token)
+
+
+def parse_pool():
+    """Return the pool detail pages are parsed on, or None to parse them on the event loop.
+
+    TFMKT_PARSE_WORKERS sets the size of the pool, and TFMKT_PARSE_POOL its
+    kind: 'process' (the default) or 'thread'. The pool is shared by every
+    crawler of the process.
+    """
+    global _parse_pool
+    workers = os.environ.get('TFMKT_PARSE_WORKERS')
+    if not workers:
+        return None
+    if _parse_pool is None:
+        if os.environ.get('TFMKT_PARSE_POOL', 'process') == 'thread':
+            _parse_pool = ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix='parse')
+        else:
+            # Not forked, the crawler runs threads of its own
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=int(workers),
+                mp_context=multiprocessing.get_context('forkserver'),
+            )
+    return _parse_pool
+
+
+def _extract_body(extract, body, args):
+    """Run in the parse pool: build an item from a raw page body."""
+    return extract(CompiledSelector(body=body), *args)
+
+
+def page_crawler_class():
+    """Return the crawler class for crawls that read some of their pages with extract_page().
+
+    With a parse pool those pages are only parsed in the pool: the crawler is
+    an HttpCrawler, which leaves pages unparsed, and the other handlers parse
+    theirs with page_selector(). Without one, it is a ParselCrawler.
+    """
+    return ParselCrawler if parse_pool() is None else HttpCrawler
+
+
+async def page_selector(context):
+    """Return a CompiledSelector over the page of a handler's `context`, parsing it if the crawler did not."""
+    selector = getattr(context, 'selector', None)
+    if selector is not None:
+        return compiled(selector)
+    body = await context.http_response.read()
+    # Off the event loop, as ParselCrawler parses pages
+    return await asyncio.to_thread(CompiledSelector, body=body)
+
+
+async def extract_page(context, extract, *args):
+    """Return `extract(selector, *args)` for the page of a handler's `context`.
+
+    Without a parse pool this runs on the event loop, over the selector the
+    crawler parsed. With one, the raw body is parsed and the item extracted in
+    the pool, and only the item comes back, so the event loop keeps fetching
+    meanwhile. `extract` and `args` must then be picklable, which module level
+    functions and items are. Crawlers using it are built with
+    page_crawler_class(), so the page is not parsed on the event loop as well.
+    """
+    pool = parse_pool()
+    if pool is None:
+        return extract(compiled(context.selector), *args)
+    body = await context.http_response.read()
+    return await asyncio.get_running_loop().run_in_executor(pool, _extract_body, extract, body, args)
+
+
+async def run_crawler(crawler, requests):
+    """Run `crawler` over `requests`, enqueueing each one as soon as it is produced.
+
+    `requests` may be an iterable or an async iterable, so a crawler can start
+    on its first parents while later ones are still coming in. No more than
+    MAX_PENDING_REQUESTS are left waiting in the queue at a time. The crawl
+    ends once every request is handled and `requests` is exhausted.
+    """
+    request_manager = await crawler.get_request_manager()
+
+    async def feed():
+        async for request in iterate(requests):
+            while (
+                await request_manager.get_total_count() - await request_manager.get_handled_count()
+                >= MAX_PENDING_REQUESTS
+            ):
+                await asyncio.sleep(FINISHED_POLL_INTERVAL)
+            await crawler.add_requests([request])
+
+        while not await request_manager.is_finished():
+            await asyncio.sleep(FINISHED_POLL_INTERVAL)
+        crawler.stop('all requests were handled')
+
+    feeder = asyncio.create_task(feed())
+
+    def stop_on_error(task):
+        if not task.cancelled() and task.exception() is not None:
+            crawler.stop('reading the requests failed')
+
+    feeder.add_done_callback(stop_on_error)
+    try:
+        await crawler.run()
+    finally:
+        # The crawl may end first, for example on TFMKT_MAX_REQUESTS
+        feeder.cancel()
+        try:
+            await feeder
+        except asyncio.CancelledError:
+            pass
+
+
+class ItemStream:
+    """Items emitted by the request handlers of a crawl, on their way to stream_items().
+
+    The items of a request are held back until it is marked handled, and
+    dropped when it is reclaimed to be retried, so a retried request never
+    repeats them. Its queue only marks it handled once the caller of
+    stream_items() has taken them, see StreamedRequestManager. Items are
+    queued along with the callback to run once they are written.
+    """
+
+    def __init__(self):
+        self.items = asyncio.Queue()
+        # Items emitted by the handler running in each task, until its request is marked handled
+        self._held = {}
+        self._released = 0
+        self._taken = 0
+        # (items to take first, request manager, request), in the order they were released
+        self._unmarked = deque()
+
+    async def emit(self, item, on_written=None):
+        held = self._held.get(asyncio.current_task())
+        if held is None:
+            # Not emitted by a request handler, nothing to hold it back for
+            self._release([(item, on_written)])
+        else:
+            held.append((item, on_written))
+
+    def hold(self):
+        """Hold back the items emitted from the current task, which is about to handle a request."""
+        self._held[asyncio.current_task()] = []
+
+    def drop(self):
+        """Drop the items held for the request handled in the current task."""
+        self._held.pop(asyncio.current_task(), None)
+
+    async def mark_handled(self, request_manager, request):
+        """Release the items of `request`, and mark it handled in `request_manager` once they are taken."""
+        self._release(self._held.pop(asyncio.current_task(), []))
+        if self._taken >= self._released:
+            return await request_manager.mark_request_as_handled(request)
+        self._unmarked.append((self._released, request_manager, request))
+        return None
+
+    async def take(self):
+        """Count one more item as taken, and mark the requests whose items are all taken handled."""
+        self._taken += 1
+        while self._unmarked and self._unmarked[0][0] <= self._taken:
+            _, request_manager, request = self._unmarked.popleft()
+            await request_manager.mark_request_as_handled(request)
+
+    def full(self):
+        return self._released - self._taken >= ITEM_BUFFER_SIZE
+
+    def _release(self, items):
+        for item in items:
+            self.items.put_nowait(item)
+        self._released += len(items)
+
+
+class StreamedRequestManager(RequestManager):
+    """Request manager of a crawler whose items go through an ItemStream.
+
+    Handlers never wait for their items to be taken, which could outlast the
+    request handler timeout. Instead, the crawler takes no new requests while
+    ITEM_BUFFER_SIZE items are waiting, and a request stays in flight in its
+    queue until its items are taken, so an interrupted crawl retries it.
+    """
+
+    def __init__(self, inner, stream):
+        self._inner = inner
+        self._stream = stream
+
+    @property
+    def inner(self):
+        return self._inner
+
+    async def drop(self):
+        await self._inner.drop()
+
+    async def purge(self):
+        await self._inner.purge()
+
+    async def add_request(self, request, *, forefront=False):
+        return await self._inner.add_request(request, forefront=forefront)
+
+    async def add_requests(self, requests, **kwargs):
+        await self._inner.add_requests(requests, **kwargs)
+
+    async def get_handled_count(self):
+        return await self._inner.get_handled_count()
+
+    async def get_total_count(self):
+        return await self._inner.get_total_count()
+
+    async def is_empty(self):
+        return self._stream.full() or await self._inner.is_empty()
+
+    async def is_finished(self):
+        return await self._inner.is_finished()
+
+    async def fetch_next_request(self):
+        request = await self._inner.fetch_next_request()
+        if request is not None:
+            # Crawlee handles the request in the task that fetched it
+            self._stream.hold()
+        return request
+
+    async def reclaim_request(self, request, *, forefront=False):
+        self._stream.drop()
+        return await self._inner.reclaim_request(request, forefront=forefront)
+
+    async def mark_request_as_handled(self, request):
+        return await self._stream.mark_handled(self._inner, request)
+
+
+async def stream_items(crawl, parents, season=2024, base_url=None):
+    """Yield the items of a crawler module's `crawl` function as it scrapes them.
+
+    This is what the `iter_items` function of every crawler module returns.
+    Items are dicts, exactly as the CLI prints them. The crawl runs in a task
+    of its own, and the crawlers it creates send their items through an
+    ItemStream: a request is only marked handled once its items have been
+    taken, which is what lets an interrupted crawl resume without losing any.
+    The `on_written` callback an item is emitted with runs once write_items()
+    has written it out, or once it is taken by any other caller.
+    Raises CrawlFailedError once all items are yielded if any request failed.
+    """
+    stream = ItemStream()
+    end = object()
+
+    async def produce():
+        _item_stream.set(stream)
+        # The parents of the crawl are not written out by the writer of its items
+        _item_writer.set(None)
+        try:
+            return await crawl(parents, season, base_url, emit=stream.emit)
+        finally:
+            stream.items.put_nowait(end)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (entry := await stream.items.get()) is not end:
+            item, on_written = entry
+            yield item
+            if on_written is not None:
+                writer = _item_writer.get()
+                if writer is None:
+                    on_written()
+                else:
+                    writer.when_written(on_written)
+            await stream.take()
+        failures = await producer
+    finally:
+        # Only does anything when the caller stops iterating early
+        producer.cancel()
+
+    if failures:
+        raise CrawlFailedError(failures)
+
+
+def encode_item(item):
+    """Encode an item as a line of JSON."""
+    return (json.dumps(item) + '\n').encode('utf-8')
+
+
+class EmittedKeys:
+    """Keys of the items written so far, appended to a file to be skipped when a crawl resumes."""
+
+    def __init__(self, path):
+        self._keys = set()
+        if os.path.exists(path):
+            with open(path) as lines:
+                self._keys.update(line.rstrip('\n') for line in lines)
+        self._file = open(path, 'a')
+
+    @staticmethod
+    def key(item):
+        return hashlib.blake2b(json.dumps(item, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, keys):
+        for key in keys:
+            self._keys.add(key)
+            self._file.write(key + '\n')
+        self._file.flush()
+
+
+class ItemWriter:
+    """Write items to a binary stream as JSON lines, in batches.
+
+    Items are written out once WRITE_BATCH_SIZE of them are buffered, or when
+    the oldest one has waited WRITE_INTERVAL seconds. Call flush() when done.
+    With `emitted`, items already recorded there are skipped, and the others
+    are recorded once written.
+    """
+
+    def __init__(self, stream=None, batch_size=None, interval=None, emitted=None):
+        self._stream = stream or sys.stdout.buffer
+        self._batch_size = batch_size or WRITE_BATCH_SIZE
+        self.interval = interval if interval is not None else WRITE_INTERVAL
+        self._emitted = emitted
+        self._lines = []
+        self._keys = []
+        self._on_written = []
+        self._oldest = None
+        self.written = 0
+        self.skipped = 0
+
+    def write(self, item):
+        if self._emitted is not None:
+            key = self._emitted.key(item)
+            if key in self._emitted:
+                self.skipped += 1
+                return
+            self._keys.append(key)
+
+        if not self._lines:
+            self._oldest = time.monotonic()
+        self._lines.append(encode_item(item))
+        if len(self._lines) >= self._batch_size or self.overdue():
+            self.flush()
+
+    def overdue(self):
+        """Return whether the oldest buffered item has waited longer than the interval."""
+        return bool(self._lines) and time.monotonic() - self._oldest >= self.interval
+
+    @property
+    def pending(self):
+        """Number of items buffered but not written yet."""
+        return len(self._lines)
+
+    def when_written(self, callback):
+        """Call `callback` once the items given to write() so far are written out."""
+        if self._lines:
+            self._on_written.append(callback)
+        else:
+            callback()
+
+    def flush(self):
+        if self._lines:
+            self._stream.write(b''.join(self._lines))
+            self.written += len(self._lines)
+            self._lines = []
+        self._stream.flush()
+        # Recorded only once written, so a crash never loses an item
+        if self._keys:
+            self._emitted.add(self._keys)
+            self._keys = []
+        callbacks, self._on_written = self._on_written, []
+        for callback in callbacks:
+            callback()
+
+
+def build_item_writer():
+    """Build the writer for stdout, following TFMKT_STATE_DIR.
+
+    With a state directory, items are written one at a time, and those written
+    by an earlier run of the crawl are skipped.
+    """
+    directory = os.environ.get('TFMKT_STATE_DIR')
+    if not directory:
+        return ItemWriter()
+
+    os.makedirs(directory, exist_ok=True)
+    emitted = EmittedKeys(os.path.join(directory, 'emitted.keys'))
+    if len(emitted):
+        logger.info('Resuming from %s, skipping %d items already written', directory, len(emitted))
+    return ItemWriter(batch_size=1, emitted=emitted)
+
+
+async def write_items(items, writer=None):
+    """Write the items of an iter_items() generator to stdout, then exit non-zero if requests failed.
+
+    Buffered items are flushed when the crawl ends, every WRITE_INTERVAL while
+    it stalls, and on SIGTERM, which then exits with status 143.
+    """
+    writer = writer or build_item_writer()
+    token = _item_writer.set(writer)
+    terminated = False
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(writer.interval)
+            if writer.overdue():
+                writer.flush()
+
+    def terminate():
+        nonlocal terminated
+        terminated = True
+        task.cancel()
+
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    # Signal handlers can only be installed from the main thread
+    handles_sigterm = threading.current_thread() is threading.main_thread()
+    if handles_sigterm:
+        loop.add_signal_handler(signal.SIGTERM, terminate)
+    flusher = asyncio.create_task(flush_periodically())
+
+    try:
+        async for item in items:
+            writer.write(item)
+    except CrawlFailedError as error:
+        check_failures(error.failures)
+    except asyncio.CancelledError:
+        if not terminated:
+            raise
+        logger.warning('Terminated after writing %d items', writer.written + writer.pending)
+        sys.exit(128 + signal.SIGTERM)
+    finally:
+        flusher.cancel()
+        if handles_sigterm:
+            loop.remove_signal_handler(signal.SIGTERM)
+        writer.flush()
+        _item_writer.reset(token)
+
+
+class RecentKeys:
+    """The last `maxsize` keys seen, to drop duplicates in constant memory."""
+
+    def __init__(self, maxsize):
+        self._keys = OrderedDict()
+        self._maxsize = maxsize
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key):
+        """Remember `key`, returning False if it was seen already."""
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self._maxsize:
+            self._keys.popitem(last=False)
+        return True
+
+
+def write_dead_letter(name, request, error):
+    """Append a failed request to the TFMKT_DEAD_LETTER file, if there is one."""
+    path = os.environ.get('TFMKT_DEAD_LETTER')
+    if not path:
+        return
+
+    record = {
+        'crawler': name,
+        'url': request.url,
+        'label': request.label,
+        # Crawlee keeps its own bookkeeping in user_data, under dunder keys
+        'user_data': {
+            key: value for key, value in request.user_data.items()
+            if key != 'label' and not key.startswith('__')
+        },
+        'error': type(error).__name__,
+        'message': str(error),
+        # The shard the request was crawled under, None when the crawl was unsharded
+        'shard': current_shard(),
+    }
+    with open(path, 'a') as dead_letter:
+        dead_letter.write(json.dumps(record, default=str) + '\n')
+
+
+def load_dead_letters(path, name):
+    """Rebuild the requests of crawler `name` listed in a dead-letter file.
+
+    Requests are rebuilt with their original label and user data, so they go
+    back to the handler that failed them, with the context it had. With
+    TFMKT_SHARD, only those that failed under the same shard are rebuilt.
+    """
+    requests = []
+    with open(path) as dead_letter:
+        for line in dead_letter:
+            record = json.loads(line)
+            if record['crawler'] != name or not in_dead_letter_shard(record):
+                continue
+            requests.append(Request.from_url(
+                url=record['url'],
+                label=record['label'],
+                user_data=record['user_data'],
+                # A state directory remembers them as handled, retry them anyway
+                always_enqueue=True,
+            ))
+    return requests
+
+
+def current_shard():
+    """Return the TFMKT_SHARD the crawls started in this context apply, or None."""
+    if not _sharding.get():
+        return None
+    return os.environ.get('TFMKT_SHARD') or None
+
+
+def in_dead_letter_shard(record):
+    """Return whether the request of a dead-letter record belongs to this node.
+
+    Requests are not all sharded by a key their record holds: detail pages go
+    by their own href, pages built from parents by the parent's, and some
+    listings are read by every node. So a record goes back to the shard it
+    failed under, and to every node if that crawl was unsharded.
+    """
+    shard = current_shard()
+    return shard is None or record.get('shard') in (None, shard)
+
+
+def in_shard(key):
+    """Return whether the entity keyed `key`, usually its href, belongs to this node.
+
+    TFMKT_SHARD holds "i/n": the node takes the keys whose stable hash is i
+    modulo n, so n nodes given the same parents split the work between them
+    without any of them fetching the same page.
+    """
+    shard = current_shard()
+    if shard is None:
+        return True
+    index, count = (int(part) for part in shard.split('/'))
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count == index
+
+
+async def unsharded(items):
+    """Iterate over an iter_items() generator with TFMKT_SHARD ignored by its crawl.
+
+    For crawlers feeding a sharded one, whose every node needs all the parents.
+    The crawl task starts on the first item and copies the context it starts
+    in, so turning sharding off around each step is enough.
+    """
+    while True:
+        token = _sharding.set(False)
+        try:
+            item = await anext(items)
+        except StopAsyncIteration:
+            return
+        finally:
+            _sharding.reset(token)
+        yield item
+
+
 def check_failures(failures):
     """Exit with status 1 if there were any failed requests."""
     if failures:
+        record_worker_failures(failures)
         for url, error in failures:
             logger.error("Failed to scrape %s: %s", url, error)
         sys.exit(1)
@@ -69,30 +815,52 @@ def safe_strip(word):
     return word
 
 
-def read_lines(file_name, reading_fn):
-    with reading_fn(file_name) as f:
-        lines = f.readlines()
-        return [json.loads(line) for line in lines]
+async def iterate(items):
+    """Iterate over an iterable or an async iterable alike."""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def with_default(parents, default):
+    """Yield the parents, or the `default` ones if there are none.
+
+    Retries of failed requests get no default parents, see create_crawler.
+    """
+    empty = True
+    async for parent in iterate(parents):
+        empty = False
+        yield parent
+    if empty and not os.environ.get('TFMKT_RETRY_FAILED'):
+        for parent in default:
+            yield parent
+
 
+async def load_parents(parents_arg=None):
+    """Yield parents one at a time, from a JSON lines file (gzipped or not) or stdin.
 
-def load_parents(parents_arg=None):
+    Lines are only read as the crawl asks for them, so a crawler at the end of
+    a shell pipe starts on the first parent instead of waiting for stdin to close.
+    """
     if parents_arg is not None:
         extension = parents_arg.split(".")[-1]
-        if extension == "gz":
-            parents = read_lines(parents_arg, gzip.open)
-        else:
-            parents = read_lines(parents_arg, open)
+        with (gzip.open if extension == "gz" else open)(parents_arg) as lines:
+            for line in lines:
+                yield prepare_parent(json.loads(line))
     elif not sys.stdin.isatty():
-        parents = [json.loads(line) for line in sys.stdin]
-    else:
-        return []
+        # Read off the event loop, the upstream crawler may take a while to write the next line
+        while line := await asyncio.to_thread(sys.stdin.readline):
+            yield prepare_parent(json.loads(line))
 
-    # 2nd level parents are redundant
-    for parent in parents:
-        if parent.get('parent') is not None:
-            del parent['parent']
 
-    return parents
+def prepare_parent(parent):
+    # 2nd level parents are redundant
+    if parent.get('parent') is not None:
+        del parent['parent']
+    return parent
 
 
 def seasonize_href(item, season, base_url):
@@ -111,19 +879,22 @@ def seasonize_href(item, season, base_url):
         return f"{base_url}{item['href']}"
 
 
-def build_initial_requests(parents, season, base_url, label, spider_name):
-    requests = []
-    for item in parents:
+async def build_initial_requests(parents, season, base_url, label, spider_name, shard_parents=True):
+    """Yield the requests for the parents of a crawl.
+
+    Parents outside this node's shard are left out, unless `shard_parents` is
+    False for crawlers that shard the detail pages they discover instead.
+    """
+    async for item in iterate(parents):
         # clubs extraction is best done on first_tier competition types only
         if spider_name == 'clubs' and item.get('competition_type') != 'first_tier':
             continue
+        if shard_parents and not in_shard(item['href']):
+            continue
         seasoned_href = seasonize_href(item, season, base_url)
         item['seasoned_href'] = seasoned_href
-        requests.append(
-            Request.from_url(
-                url=seasoned_href,
-                label=label,
-                user_data={'parent': item},
-            )
+        yield Request.from_url(
+            url=seasoned_href,
+            label=label,
+            user_data={'parent': item},
         )
-    return requests
@@ -1,13 +1,23 @@
 import json
 import logging
 import sys
-from datetime import datetime
+from datetime import date, datetime
 
 from crawlee import Request
 from crawlee.crawlers import HttpCrawler
 
 from tfmkt.brightdata import looks_blocked
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, check_failures, create_crawler
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    create_crawler,
+    in_shard,
+    iterate,
+    run_crawler,
+    stream_items,
+    write_items,
+)
+from tfmkt.seen_index import open_seen_index, seen_marker
 
 logger = logging.getLogger(__name__)
 
@@ -35,27 +45,52 @@ def _club_href(club_id, season_id):
     return f'/spielplan/verein/{club_id}/saison_id/{season_id}'
 
 
+def season_completed(season, today=None):
+    """Return whether no more appearances can happen in `season`.
+
+    Most leagues label a season by the year it starts in and play into the
+    next one, others play within the calendar year. Either way, season S is
+    over once the year S + 1 is.
+    """
+    return season + 1 < (today or date.today()).year
+
+
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
-
-    requests = []
-    for parent in parents:
-        player_id = parent['href'].rstrip('/').split('/')[-1]
-        stats_href = parent['href'].replace('/profil/', '/leistungsdaten/')
-        requests.append(
-            Request.from_url(
+    seen_index = open_seen_index()
+
+    async def build_requests():
+        async for parent in iterate(parents):
+            if not in_shard(parent['href']):
+                continue
+            # Seasons still being played are crawled again until they are over
+            if (
+                seen_index is not None
+                and season_completed(season)
+                and seen_index.skip('appearances', (parent['href'], season))
+            ):
+                continue
+            player_id = parent['href'].rstrip('/').split('/')[-1]
+            stats_href = parent['href'].replace('/profil/', '/leistungsdaten/')
+            yield Request.from_url(
                 url=f"{base_url}/ceapi/performance-game/{player_id}",
                 label='parse_api',
                 user_data={'parent': parent, 'season': season, 'stats_href': stats_href},
             )
-        )
 
     # No Web Unlocker here: /ceapi is disallowed in Transfermarkt's robots.txt,
     # and Bright Data refuses to proxy it without KYC, answering 200 with a
     # "Residential Failed (bad_endpoint)" body instead of the JSON. Going direct
     # works from unblocked IPs and fails honestly from blocked ones.
-    crawler, failures = create_crawler(crawler_class=HttpCrawler, use_unlocker=False)
+    crawler, failures = await create_crawler(crawler_class=HttpCrawler, use_unlocker=False, name='appearances')
 
     @crawler.router.default_handler
     async def parse_api(context) -> None:
@@ -89,6 +124,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
             logger.warning("API returned success=false for %s", context.request.url)
             return
 
+        items = []
         for perf in data.get('data', {}).get('performance', []):
             game_info = perf['gameInformation']
 
@@ -152,7 +188,20 @@ async def run(parents_arg=None, season=2024, base_url=None):
                 'passes': distribution.get('passes'),
                 'pass_accuracy': distribution.get('passesReachedRatio'),
             }
-            print(json.dumps(item), flush=True)
-
-    await crawler.run(requests)
-    check_failures(failures)
+            items.append(item)
+
+        on_written = None
+        if season_completed(req_season):
+            on_written = seen_marker(seen_index, 'appearances', (parent['href'], req_season))
+        # Items are written in order, the season is recorded once its last one is
+        for item in items[:-1]:
+            await emit(item)
+        if items:
+            await emit(items[-1], on_written=on_written)
+        elif on_written is not None:
+            on_written()
+
+    await run_crawler(crawler, build_requests())
+    if seen_index is not None:
+        seen_index.report('appearances')
+    return failures
@@ -1,18 +1,47 @@
-import json
 import re
 from urllib.parse import unquote, urlparse
 
 from crawlee import Request
 
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, build_initial_requests, safe_strip, create_crawler, check_failures
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    build_initial_requests,
+    safe_strip,
+    create_crawler,
+    page_crawler_class,
+    page_selector,
+    env_flag,
+    run_crawler,
+    stream_items,
+    write_items,
+    in_shard,
+    prepare_parent,
+    seasonize_href,
+)
+from tfmkt.crawlers.players import SEEN_KIND, emit_player, extract_player_hrefs, player_requests
+from tfmkt.seen_index import open_seen_index
 
 
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
-    requests = build_initial_requests(parents, season, base_url, label='parse', spider_name='clubs')
+    # TFMKT_WITH_PLAYERS: crawl the players of the squads too
+    with_players = env_flag('TFMKT_WITH_PLAYERS')
+    # With the players, every node reads all club pages to find the profiles of its shard
+    requests = build_initial_requests(
+        parents, season, base_url, label='parse', spider_name='clubs', shard_parents=not with_players,
+    )
 
-    crawler, failures = create_crawler()
+    crawler, failures = await create_crawler(crawler_class=page_crawler_class(), name='clubs')
+    seen_index = open_seen_index() if with_players else None
 
     @crawler.router.handler('parse')
     async def parse(context) -> None:
@@ -24,7 +53,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
         def extract_team_href(row):
             return row.css('td')[1].css('a::attr(href)').get()
 
-        page_tables = context.selector.css('div.responsive-table')
+        page_tables = (await page_selector(context)).css('div.responsive-table')
         with_teams_info = [table for table in page_tables if is_teams_table(table)]
         assert len(with_teams_info) == 1
 
@@ -53,73 +82,94 @@ async def run(parents_arg=None, season=2024, base_url=None):
     @crawler.router.handler('parse_details')
     async def parse_details(context) -> None:
         base = context.request.user_data['base']
-        sel = context.selector
-
-        attributes = {}
-
-        attributes['total_market_value'] = sel.css('div.dataMarktwert a::text').get()
-
-        attributes['squad_size'] = safe_strip(
-            sel.xpath("//li[contains(text(),'Squad size:')]/span/text()").get()
-        )
-        attributes['average_age'] = safe_strip(
-            sel.xpath("//li[contains(text(),'Average age:')]/span/text()").get()
-        )
-
-        foreigners_element = sel.xpath("//li[contains(text(),'Foreigners:')]")[0]
-        attributes['foreigners_number'] = safe_strip(foreigners_element.xpath("span/a/text()").get())
-        attributes['foreigners_percentage'] = safe_strip(
-            foreigners_element.xpath("span/span/text()").get()
-        )
-
-        attributes['national_team_players'] = safe_strip(
-            sel.xpath("//li[contains(text(),'National team players:')]/span/a/text()").get()
-        )
-
-        stadium_element = sel.xpath("//li[contains(text(),'Stadium:')]")[0]
-        attributes['stadium_name'] = safe_strip(stadium_element.xpath("span/a/text()").get())
-        attributes['stadium_seats'] = safe_strip(stadium_element.xpath("span/span/text()").get())
-
-        attributes['net_transfer_record'] = safe_strip(
-            sel.xpath("//li[contains(text(),'Current transfer record:')]/span/span/a/text()").get()
-        )
+        sel = await page_selector(context)
+        item = extract_club(sel, base)
+        if not with_players:
+            await emit(item)
+            return
+
+        if in_shard(item['href']):
+            await emit(item)
+        # The squad page is the one players starts from, go to the profiles directly
+        parent = prepare_parent(dict(item))
+        parent['seasoned_href'] = seasonize_href(parent, season, base_url)
+        new_requests = player_requests(extract_player_hrefs(sel), parent, base_url, seen_index, label='parse_player')
+        if new_requests:
+            await context.add_requests(new_requests)
 
-        # Coach info from the "Coach for the season" section
-        coach_link = sel.xpath(
-            "//h2[contains(text(), 'Coach')]/..//a[contains(@href, 'profil/trainer')]"
+    @crawler.router.handler('parse_player')
+    async def parse_player(context) -> None:
+        await emit_player(context, emit, seen_index)
+
+    await run_crawler(crawler, requests)
+    if seen_index is not None:
+        seen_index.report(SEEN_KIND)
+    return failures
+
+
+def extract_club(selector, base):
+    """Build a club item from a parsed club squad page."""
+    attributes = {}
+
+    attributes['total_market_value'] = selector.css('div.dataMarktwert a::text').get()
+
+    attributes['squad_size'] = safe_strip(
+        selector.xpath("//li[contains(text(),'Squad size:')]/span/text()").get()
+    )
+    attributes['average_age'] = safe_strip(
+        selector.xpath("//li[contains(text(),'Average age:')]/span/text()").get()
+    )
+
+    foreigners_element = selector.xpath("//li[contains(text(),'Foreigners:')]")[0]
+    attributes['foreigners_number'] = safe_strip(foreigners_element.xpath("span/a/text()").get())
+    attributes['foreigners_percentage'] = safe_strip(
+        foreigners_element.xpath("span/span/text()").get()
+    )
+
+    attributes['national_team_players'] = safe_strip(
+        selector.xpath("//li[contains(text(),'National team players:')]/span/a/text()").get()
+    )
+
+    stadium_element = selector.xpath("//li[contains(text(),'Stadium:')]")[0]
+    attributes['stadium_name'] = safe_strip(stadium_element.xpath("span/a/text()").get())
+    attributes['stadium_seats'] = safe_strip(stadium_element.xpath("span/span/text()").get())
+
+    attributes['net_transfer_record'] = safe_strip(
+        selector.xpath("//li[contains(text(),'Current transfer record:')]/span/span/a/text()").get()
+    )
+
+    # Coach info from the "Coach for the season" section
+    coach_link = selector.xpath(
+        "//h2[contains(text(), 'Coach')]/..//a[contains(@href, 'profil/trainer')]"
+    )
+    if coach_link:
+        attributes['coach_name'] = coach_link[0].xpath('@title').get()
+        attributes['coach_href'] = coach_link[0].xpath('@href').get()
+    else:
+        # Fallback to legacy Mitarbeiter viewport selector
+        coach_element = selector.xpath(
+            '//div[contains(@data-viewport, "Mitarbeiter")]//div[@class="container-hauptinfo"]/a'
         )
-        if coach_link:
-            attributes['coach_name'] = coach_link[0].xpath('@title').get()
-            attributes['coach_href'] = coach_link[0].xpath('@href').get()
-        else:
-            # Fallback to legacy Mitarbeiter viewport selector
-            coach_element = sel.xpath(
-                '//div[contains(@data-viewport, "Mitarbeiter")]//div[@class="container-hauptinfo"]/a'
-            )
-            attributes['coach_name'] = coach_element.xpath('text()').get()
-            attributes['coach_href'] = coach_element.xpath('@href').get()
+        attributes['coach_name'] = coach_element.xpath('text()').get()
+        attributes['coach_href'] = coach_element.xpath('@href').get()
 
-        attributes['club_image_url'] = sel.xpath(
-            "//div[contains(@class, 'data-header__profile-container')]//img/@src"
-        ).get()
+    attributes['club_image_url'] = selector.xpath(
+        "//div[contains(@class, 'data-header__profile-container')]//img/@src"
+    ).get()
 
-        attributes['league_position'] = safe_strip(
-            sel.xpath("//li[contains(text(),'Table position:')]/span/text()").get()
-        )
-
-        attributes['code'] = unquote(urlparse(base["href"]).path.split("/")[1])
-        attributes['name'] = safe_strip(
-            sel.xpath("//span[@itemprop='legalName']/text()").get()
-        ) or safe_strip(
-            sel.xpath('//h1[@class="data-header__headline-wrapper data-header__headline-wrapper--oswald"]/text()').get()
-        )
+    attributes['league_position'] = safe_strip(
+        selector.xpath("//li[contains(text(),'Table position:')]/span/text()").get()
+    )
 
-        for key, value in attributes.items():
-            if value:
-                attributes[key] = value.strip()
+    attributes['code'] = unquote(urlparse(base["href"]).path.split("/")[1])
+    attributes['name'] = safe_strip(
+        selector.xpath("//span[@itemprop='legalName']/text()").get()
+    ) or safe_strip(
+        selector.xpath('//h1[@class="data-header__headline-wrapper data-header__headline-wrapper--oswald"]/text()').get()
+    )
 
-        item = {**base, **attributes}
-        print(json.dumps(item), flush=True)
+    for key, value in attributes.items():
+        if value:
+            attributes[key] = value.strip()
 
-    await crawler.run(requests)
-    check_failures(failures)
+    return {**base, **attributes}
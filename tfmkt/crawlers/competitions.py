@@ -1,24 +1,49 @@
-import json
 import re
 
 from crawlee import Request
 from inflection import parameterize, underscore
 
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, build_initial_requests, safe_strip, create_crawler, check_failures
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    build_initial_requests,
+    safe_strip,
+    create_crawler,
+    env_flag,
+    run_crawler,
+    stream_items,
+    write_items,
+    with_default,
+)
+from tfmkt.crawlers.countries import (
+    confederation_page_requests,
+    country_href,
+    country_item,
+    extract_countries,
+)
+from tfmkt.selectors import compiled
 
 
 async def run(parents_arg=None, season=2024, base_url=None):
-    base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
 
-    if not parents:
-        parents = [{'type': 'root', 'href': ''}]
+
+async def crawl(parents, season, base_url, emit):
+    base_url = base_url or DEFAULT_BASE_URL
+    parents = with_default(parents, [{'type': 'root', 'href': ''}])
 
     requests = build_initial_requests(parents, season, base_url, label='parse', spider_name='competitions')
 
     international_competitions = {}
+    # TFMKT_WITH_COUNTRIES: emit the countries the listings show too
+    with_countries = env_flag('TFMKT_WITH_COUNTRIES')
+    seen_countries = set()
 
-    crawler, failures = create_crawler()
+    crawler, failures = await create_crawler(name='competitions')
 
     @crawler.router.handler('parse')
     async def parse(context) -> None:
@@ -27,34 +52,9 @@ async def run(parents_arg=None, season=2024, base_url=None):
         current_url = context.request.url
         is_fifa_page = '/wettbewerbe/fifa' in current_url
 
-        if '?page=' not in current_url and not is_fifa_page:
-            confederation_pages = {
-                '/wettbewerbe/europa': 6,
-                '/wettbewerbe/amerika': 3,
-                '/wettbewerbe/asien': 3,
-                '/wettbewerbe/afrika': 1,
-            }
-
-            confederation_path = None
-            for path in confederation_pages:
-                if path in current_url:
-                    confederation_path = path
-                    break
-
-            if confederation_path:
-                total_pages = confederation_pages[confederation_path]
-                page_requests = []
-                for page_num in range(2, total_pages + 1):
-                    page_url = f"{base_url}{confederation_path}?page={page_num}"
-                    page_requests.append(
-                        Request.from_url(
-                            url=page_url,
-                            label='parse',
-                            user_data={'parent': parent},
-                        )
-                    )
-                if page_requests:
-                    await context.add_requests(page_requests)
+        page_requests = confederation_page_requests(current_url, base_url, parent)
+        if page_requests:
+            await context.add_requests(page_requests)
 
         # Extract national team competitions from headerless boxes on the confederation
         # page itself (page 1 only). Each confederation page has two headerless div.box
@@ -63,7 +63,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
         # The FIFA page (/wettbewerbe/fifa) only has national team competitions.
         if '?page=' not in current_url:
             seen_hrefs = set()
-            for box in context.selector.css('div.box'):
+            for box in compiled(context.selector).css('div.box'):
                 if safe_strip(box.css('h2.content-box-headline::text').get()):
                     continue  # skip boxes that have a heading (domestic leagues table)
                 for a in box.css(
@@ -86,58 +86,27 @@ async def run(parents_arg=None, season=2024, base_url=None):
                         'href': href_wo_season,
                         'competition_type': underscore(parameterize(name)),
                     }
-                    print(json.dumps(item), flush=True)
+                    await emit(item)
 
         # The FIFA page is a rankings table, not a country-league listing — skip
         # the country row extraction that feeds parse_competitions.
         if is_fifa_page:
             return
 
-        table_rows = context.selector.css('table.items tbody tr.odd, table.items tbody tr.even')
-
         new_requests = []
-        for row in table_rows:
-            country_image_url = row.xpath('td')[1].css('img::attr(src)').get()
-            if not country_image_url:
-                continue
-            matches = re.search(r'([0-9]+)\.png', country_image_url, re.IGNORECASE)
-            if not matches:
-                continue
-
-            country_name = row.xpath('td')[1].css('img::attr(title)').get()
-            country_code = (
-                row.xpath('td')[0]
-                .xpath('table/tr/td')[1]
-                .xpath('a/@href').get()
-                .split('/')[-1]
-            )
-
-            total_clubs = row.css('td:nth-of-type(3)::text').get()
-            total_players = row.css('td:nth-of-type(4)::text').get()
-            average_age = row.css('td:nth-of-type(5)::text').get()
-            foreigner_percentage = row.css('td:nth-of-type(6) a::text').get()
-            average_market_value = row.css('td:nth-of-type(7)::text').get()
-            total_value = row.css('td:nth-of-type(8)::text').get()
-
-            country_id = matches.group(1)
-            href = "/wettbewerbe/national/wettbewerbe/" + country_id
+        for country in extract_countries(compiled(context.selector)):
+            if with_countries and country['country_id'] not in seen_countries:
+                seen_countries.add(country['country_id'])
+                await emit(country_item(country, parent))
 
             cb_data = {
                 'parent': parent,
-                'country_id': country_id,
-                'country_name': country_name,
-                'country_code': country_code,
-                'total_clubs': total_clubs,
-                'total_players': total_players,
-                'average_age': average_age,
-                'foreigner_percentage': foreigner_percentage,
-                'average_market_value': average_market_value,
-                'total_value': total_value,
+                **country,
             }
 
             new_requests.append(
                 Request.from_url(
-                    url=base_url + href,
+                    url=base_url + country_href(country),
                     label='parse_competitions',
                     user_data={'base': cb_data},
                 )
@@ -154,7 +123,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
         parameterized_domestic_competitions_tag = underscore(parameterize(domestic_competitions_tag))
         international_competitions_tag = 'International competitions'
 
-        boxes = context.selector.css('div.box')
+        boxes = compiled(context.selector).css('div.box')
         relevant_boxes = {}
         for box in boxes:
             box_header = safe_strip(box.css('h2.content-box-headline::text').get())
@@ -216,10 +185,9 @@ async def run(parents_arg=None, season=2024, base_url=None):
                 **base,
                 **competition,
             }
-            print(json.dumps(item), flush=True)
+            await emit(item)
 
-    await crawler.run(requests)
-    check_failures(failures)
+    await run_crawler(crawler, requests)
 
     # Output deduped international competitions after crawl completes (replaces closed() hook)
     for key, value in international_competitions.items():
@@ -230,4 +198,6 @@ async def run(parents_arg=None, season=2024, base_url=None):
             'parent': international_competitions['parent'],
             **value,
         }
-        print(json.dumps(competition), flush=True)
+        await emit(competition)
+
+    return failures
@@ -1,4 +1,4 @@
-import json
+from tfmkt.common import stream_items, write_items
 
 DEFAULT_CONFEDERATION_HREFS = [
     '/wettbewerbe/europa',
@@ -10,5 +10,14 @@ DEFAULT_CONFEDERATION_HREFS = [
 
 
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items([], season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     for href in DEFAULT_CONFEDERATION_HREFS:
-        print(json.dumps({'type': 'confederation', 'href': href}), flush=True)
+        await emit({'type': 'confederation', 'href': href})
+    return []
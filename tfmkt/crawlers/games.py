@@ -1,82 +1,333 @@
-import json
+import os
 import re
 
 from crawlee import Request
 
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, build_initial_requests, safe_strip, create_crawler, check_failures
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    build_initial_requests,
+    safe_strip,
+    create_crawler,
+    page_crawler_class,
+    page_selector,
+    env_flag,
+    run_crawler,
+    stream_items,
+    write_items,
+    RecentKeys,
+    extract_page,
+    in_shard,
+)
+from tfmkt.crawlers.game_lineups import extract_formations, extract_lineups, lineups_request
+from tfmkt.seen_index import open_seen_index, seen_marker
 from tfmkt.utils import background_position_in_px_to_minute
 
+# Game ids remembered to drop duplicate games. The same game is usually
+# reached twice in quick succession, so recent ids are enough.
+SEEN_GAMES_SIZE = 100_000
+
+# Seen index kinds of the games read from their reports and from fixture lists
+# in lite mode, kept apart so a full crawl still fetches the reports
+SEEN_KIND = 'game'
+LITE_SEEN_KIND = 'game:lite'
+
+
+# Event types, in the order their events are listed in a game item, keyed by
+# the headline of the section of the game report listing them
+EVENT_SECTIONS = {
+    'Goals': 'Goals',
+    'Substitutions': 'Substitutions',
+    'Cards': 'Cards',
+    'Penalty shoot-out': 'Shootout',
+}
+
+
+def extract_game_events(selector):
+    """Return the goals, substitutions, cards and shoot-out events of a game report, in that order.
+
+    The sections are found in one pass, and events are read from each of them
+    according to its headline.
+    """
+    events_by_type = {event_type: [] for event_type in EVENT_SECTIONS.values()}
+    for section in selector.xpath("//div[./h2/@class = 'content-box-headline']"):
+        event_type = EVENT_SECTIONS.get(section.xpath('normalize-space(./h2/text())').get())
+        if event_type is not None:
+            events_by_type[event_type].extend(
+                extract_event(e, event_type) for e in section.xpath(".//div[@class='sb-aktion']")
+            )
+    return [event for events in events_by_type.values() for event in events]
+
+
+def extract_event(e, event_type):
+    """Build one event from its sb-aktion box."""
+    event = {}
+    event["type"] = event_type
+    if event_type == "Shootout":
+        event["minute"] = -1
+        extra_minute_text = ''
+    else:
+        clock = e.xpath("./div[1]/span[@class='sb-sprite-uhr-klein']")
+        background_position_match = re.match(
+            "background-position: ([-+]?[0-9]+)px ([-+]?[0-9]+)px;",
+            clock.xpath("@style").get()
+        )
+        event["minute"] = background_position_in_px_to_minute(
+            int(background_position_match.group(1)),
+            int(background_position_match.group(2)),
+        )
+        extra_minute_text = safe_strip(clock.xpath("text()").get())
+    if len(extra_minute_text) <= 1:
+        extra_minute = None
+    else:
+        extra_minute = int(extra_minute_text)
+
+    event["extra"] = extra_minute
+    event["player"] = {
+        "href": e.xpath("./div[@class = 'sb-aktion-spielerbild']/a/@href").get()
+    }
+    club_link = e.xpath("./div[@class = 'sb-aktion-wappen']/a")
+    event["club"] = {
+        "name": club_link.xpath("@title").get(),
+        "href": club_link.xpath("@href").get()
+    }
+
+    action_element = e.xpath("./div[@class = 'sb-aktion-aktion']")
+    action_hrefs = action_element.xpath("./a/@href").getall()
+    event["action"] = {
+        "result": safe_strip(
+            e.xpath("./div[@class = 'sb-aktion-spielstand']/b/text()").get()
+        ),
+        "description": safe_strip(
+            (" ".join([s.strip() for s in action_element.xpath("./text()").getall()])).strip()
+            or (" ".join(action_element.xpath(
+                ".//span[@class = 'sb-aktion-wechsel-aus']/span/text()"
+            ).getall())).strip()
+        ),
+        "player_in": {
+            "href": action_element.xpath(".//div/a/@href").get()
+        },
+        "player_assist": {
+            "href": action_hrefs[1] if len(action_hrefs) > 1 else None
+        }
+    }
+    return event
+
+
+def extract_game(selector, base):
+    """Build a game item from a parsed game report page."""
+    game_id = int(base['href'].split('/')[-1])
+
+    game_box = selector.css('div.box-content')
+
+    home_club_box = game_box.css('div.sb-heim')
+    away_club_box = game_box.css('div.sb-gast')
+
+    home_club_href = home_club_box.css('a::attr(href)').get()
+    home_club_name = safe_strip(
+        home_club_box.xpath('.//a/@title').get()
+    ) or safe_strip(
+        home_club_box.xpath('.//a/img/@alt').get()
+    )
+    away_club_href = away_club_box.css('a::attr(href)').get()
+    away_club_name = safe_strip(
+        away_club_box.xpath('.//a/@title').get()
+    ) or safe_strip(
+        away_club_box.xpath('.//a/img/@alt').get()
+    )
 
-def extract_game_events(selector, event_type):
-    event_elements = selector.xpath(
-        f"//div[./h2/@class = 'content-box-headline' and normalize-space(./h2/text()) = "
-        f"'{'Penalty shoot-out' if event_type == 'Shootout' else event_type}']"
-        f"//div[@class='sb-aktion']"
+    home_club_position = home_club_box[0].xpath('p/text()').get()
+    away_club_position = away_club_box[0].xpath('p/text()').get()
+
+    datetime_box = game_box.css('div.sb-spieldaten')[0]
+
+    text_elements = [
+        element for element in datetime_box.xpath('p//text()')
+        if len(safe_strip(element.get())) > 0
+    ]
+
+    matchday = safe_strip(text_elements[0].get()).split("  ")[0]
+    date = safe_strip(datetime_box.xpath('p/a[contains(@href, "datum")]/text()').get())
+
+    venue_box = game_box.css('p.sb-zusatzinfos')
+
+    stadium = safe_strip(venue_box.xpath('node()')[1].xpath('a/text()').get())
+    attendance = safe_strip(venue_box.xpath('node()')[1].xpath('strong/text()').get())
+    referee = safe_strip(venue_box.xpath('a[contains(@href, "schiedsrichter")]/@title').get())
+    referee_href = venue_box.xpath('a[contains(@href, "schiedsrichter")]/@href').get()
+
+    result_box = game_box.css('div.ergebnis-wrap')
+    result = safe_strip(result_box.css('div.sb-endstand::text').get())
+    half_time_score = safe_strip(result_box.css('div.sb-halbzeit::text').get())
+
+    # Kickoff time - search for time pattern in the date/time area
+    kickoff_time = None
+    for el in text_elements:
+        text = safe_strip(el.get())
+        if text and re.match(r'\d{1,2}:\d{2}', text):
+            kickoff_time = text
+            break
+
+    manager_names = selector.xpath(
+        "//tr[(contains(td/b/text(),'Manager')) or (contains(td/div/text(),'Manager'))]/td[2]/a/text()"
+    ).getall()
+    manager_hrefs = selector.xpath(
+        "//tr[(contains(td/b/text(),'Manager')) or (contains(td/div/text(),'Manager'))]/td[2]/a/@href"
+    ).getall()
+
+    game_events = extract_game_events(selector)
+
+    item = {
+        **base,
+        'type': 'game',
+        'game_id': game_id,
+        'home_club': {
+            'type': 'club',
+            'href': home_club_href,
+        },
+        'home_club_name': home_club_name,
+        'home_club_position': home_club_position,
+        'away_club': {
+            'type': 'club',
+            'href': away_club_href,
+        },
+        'away_club_name': away_club_name,
+        'away_club_position': away_club_position,
+        'result': result,
+        'half_time_score': half_time_score,
+        'matchday': matchday,
+        'date': date,
+        'kickoff_time': kickoff_time,
+        'stadium': stadium,
+        'attendance': attendance,
+        'referee': referee,
+        'referee_href': referee_href,
+        'events': game_events,
+    }
+
+    if len(manager_names) == 2:
+        home_manager_name, away_manager_name = manager_names
+        home_manager_href = manager_hrefs[0] if len(manager_hrefs) > 0 else None
+        away_manager_href = manager_hrefs[1] if len(manager_hrefs) > 1 else None
+        item["home_manager"] = {'name': home_manager_name, 'href': home_manager_href}
+        item["away_manager"] = {'name': away_manager_name, 'href': away_manager_href}
+
+    return item
+
+
+def extract_game_with_formations(selector, base):
+    """Build a game item from a game report page, with the formations of its line-ups or None."""
+    return extract_game(selector, base), extract_formations(selector)
+
+
+def competition_id(competition):
+    """Return the Transfermarkt id of a competition item, such as GB1."""
+    return competition['href'].rstrip('/').split('/')[-1]
+
+
+def full_competition_ids():
+    """Return the ids of the competitions TFMKT_FULL_COMPETITIONS keeps on full game reports in lite mode."""
+    return {code.strip() for code in os.environ.get('TFMKT_FULL_COMPETITIONS', '').split(',') if code.strip()}
+
+
+def _fixture_club(cell):
+    link = cell.xpath(".//a[contains(@href, '/verein/')]")
+    position = re.search(r'\d+', cell.xpath("normalize-space(.//span[@class='tabellenplatz'])").get() or '')
+    href = link.xpath('@href').get('')
+    return (
+        # Report pages link the clubs' overview, fixture lists their fixtures of the season
+        re.sub('/saison_id/[0-9]{4}$', '', href.replace('/spielplan/', '/startseite/')) or None,
+        safe_strip(link.xpath('@title').get()) or safe_strip(link.xpath('normalize-space()').get()),
+        f'Position: {position.group()}' if position else None,
     )
 
-    events = []
-    for e in event_elements:
-        event = {}
-        event["type"] = event_type
-        if event_type == "Shootout":
-            event["minute"] = -1
-            extra_minute_text = ''
-        else:
-            background_position_match = re.match(
-                "background-position: ([-+]?[0-9]+)px ([-+]?[0-9]+)px;",
-                e.xpath("./div[1]/span[@class='sb-sprite-uhr-klein']/@style").get()
-            )
-            event["minute"] = background_position_in_px_to_minute(
-                int(background_position_match.group(1)),
-                int(background_position_match.group(2)),
-            )
-            extra_minute_text = safe_strip(
-                e.xpath("./div[1]/span[@class='sb-sprite-uhr-klein']/text()").get()
-            )
-        if len(extra_minute_text) <= 1:
-            extra_minute = None
-        else:
-            extra_minute = int(extra_minute_text)
 
-        event["extra"] = extra_minute
-        event["player"] = {
-            "href": e.xpath("./div[@class = 'sb-aktion-spielerbild']/a/@href").get()
-        }
-        event["club"] = {
-            "name": e.xpath("./div[@class = 'sb-aktion-wappen']/a/@title").get(),
-            "href": e.xpath("./div[@class = 'sb-aktion-wappen']/a/@href").get()
-        }
+def extract_fixtures(selector):
+    """Yield (href, attributes) for the games of a parsed fixture list.
+
+    The attributes are the game item fields the list holds, in the format of
+    the game reports where the two differ. Dates and kickoff times are only
+    written on the first game of a day and time, the games below share them.
+    """
+    date = kickoff_time = None
+    for row in selector.xpath("//a[contains(@class, 'ergebnis-link')]/ancestor::tr[1]"):
+        href = row.xpath(".//a[contains(@class, 'ergebnis-link')]/@href").get()
+        cells = row.xpath('td')
+
+        row_date = safe_strip(row.xpath(".//a[contains(@href, 'datum')]/text()").get())
+        if row_date:
+            # 'Sat 8/17/24' on fixture lists, 'Sat, 8/17/24' on game reports
+            date, kickoff_time = re.sub(r'^(\w+),? ', r'\1, ', row_date), None
+        for cell in cells:
+            text = cell.xpath('normalize-space()').get()
+            if re.match(r'\d{1,2}:\d{2}( [AP]M)?$', text) and not cell.css('a.ergebnis-link'):
+                kickoff_time = text
+                break
+
+        club_cells = [cell for cell in cells if 'hauptlink' in cell.attrib.get('class', '')]
+        if len(club_cells) < 2:
+            continue
+        home_href, home_name, home_position = _fixture_club(club_cells[0])
+        away_href, away_name, away_position = _fixture_club(club_cells[-1])
+        matchday = safe_strip(row.xpath(
+            "normalize-space(ancestor::div[contains(@class, 'box')][1]/*[contains(@class, 'content-box-headline')])"
+        ).get())
 
-        action_element = e.xpath("./div[@class = 'sb-aktion-aktion']")
-        event["action"] = {
-            "result": safe_strip(
-                e.xpath("./div[@class = 'sb-aktion-spielstand']/b/text()").get()
-            ),
-            "description": safe_strip(
-                (" ".join([s.strip() for s in action_element.xpath("./text()").getall()])).strip()
-                or (" ".join(action_element.xpath(
-                    ".//span[@class = 'sb-aktion-wechsel-aus']/span/text()"
-                ).getall())).strip()
-            ),
-            "player_in": {
-                "href": action_element.xpath(".//div/a/@href").get()
+        yield href, {
+            'home_club': {
+                'type': 'club',
+                'href': home_href,
             },
-            "player_assist": {
-                "href": action_element.xpath("./a/@href").getall()[1]
-                if len(action_element.xpath("./a/@href").getall()) > 1 else None
-            }
+            'home_club_name': home_name,
+            'home_club_position': home_position,
+            'away_club': {
+                'type': 'club',
+                'href': away_href,
+            },
+            'away_club_name': away_name,
+            'away_club_position': away_position,
+            'result': safe_strip(row.xpath("normalize-space(.//a[contains(@class, 'ergebnis-link')])").get()),
+            # '1.Matchday' on fixture lists, '1. Matchday' on game reports
+            'matchday': re.sub(r'^(\d+)\. ?', r'\1. ', matchday) or None,
+            'date': date,
+            'kickoff_time': kickoff_time,
         }
-        events.append(event)
 
-    return events
+
+def fixture_games(selector, parent):
+    """Yield the lite game items of a parsed fixture list, for the competition `parent`."""
+    for href, attributes in extract_fixtures(selector):
+        yield {'parent': parent, 'href': href, 'type': 'game', 'game_id': int(href.split('/')[-1]), **attributes}
 
 
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
-    requests = build_initial_requests(parents, season, base_url, label='parse', spider_name='games')
+    # Every node reads all fixture lists, and only fetches the games of its shard
+    requests = build_initial_requests(
+        parents, season, base_url, label='parse', spider_name='games', shard_parents=False,
+    )
+
+    crawler, failures = await create_crawler(crawler_class=page_crawler_class(), name='games')
+    seen_games = RecentKeys(SEEN_GAMES_SIZE)
+    seen_index = open_seen_index()
+    # TFMKT_WITH_LINEUPS: crawl the line-ups of the games too
+    with_lineups = env_flag('TFMKT_WITH_LINEUPS')
+    lite = env_flag('TFMKT_LITE')
+    full_competitions = full_competition_ids()
 
-    crawler, failures = create_crawler()
+    def mark_seen(item, kind):
+        """Return the on_written callback recording a finished game. Fixtures still to be played are fetched again."""
+        if re.match(r'\d+:\d+', item['result'] or ''):
+            return seen_marker(seen_index, kind, item['game_id'])
+        return None
 
     @crawler.router.handler('parse')
     async def parse(context) -> None:
@@ -114,12 +365,28 @@ async def run(parents_arg=None, season=2024, base_url=None):
     @crawler.router.handler('extract_game_urls')
     async def extract_game_urls_handler(context) -> None:
         base = context.request.user_data['base']
-        sel = context.parsed_content
+        sel = await page_selector(context)
+
+        if lite and competition_id(base['parent']) not in full_competitions:
+            for item in fixture_games(sel, base['parent']):
+                if not in_shard(item['href']):
+                    continue
+                if seen_index is not None and seen_index.skip(LITE_SEEN_KIND, item['game_id']):
+                    continue
+                if item['game_id'] in seen_games:
+                    continue
+                await emit(item, on_written=mark_seen(item, LITE_SEEN_KIND))
+                seen_games.add(item['game_id'])
+            return
 
         game_links = sel.css('a.ergebnis-link')
         new_requests = []
         for game_link in game_links:
             href = game_link.xpath('@href').get()
+            if not in_shard(href):
+                continue
+            if seen_index is not None and seen_index.skip(SEEN_KIND, int(href.split('/')[-1])):
+                continue
             cb_data = {
                 'parent': base['parent'],
                 'href': href,
@@ -138,115 +405,29 @@ async def run(parents_arg=None, season=2024, base_url=None):
     @crawler.router.handler('parse_game')
     async def parse_game(context) -> None:
         base = context.request.user_data['base']
-        sel = context.parsed_content
-
-        game_id = int(base['href'].split('/')[-1])
-
-        game_box = sel.css('div.box-content')
-
-        home_club_box = game_box.css('div.sb-heim')
-        away_club_box = game_box.css('div.sb-gast')
-
-        home_club_href = home_club_box.css('a::attr(href)').get()
-        home_club_name = safe_strip(
-            home_club_box.xpath('.//a/@title').get()
-        ) or safe_strip(
-            home_club_box.xpath('.//a/img/@alt').get()
-        )
-        away_club_href = away_club_box.css('a::attr(href)').get()
-        away_club_name = safe_strip(
-            away_club_box.xpath('.//a/@title').get()
-        ) or safe_strip(
-            away_club_box.xpath('.//a/img/@alt').get()
-        )
-
-        home_club_position = home_club_box[0].xpath('p/text()').get()
-        away_club_position = away_club_box[0].xpath('p/text()').get()
-
-        datetime_box = game_box.css('div.sb-spieldaten')[0]
-
-        text_elements = [
-            element for element in datetime_box.xpath('p//text()')
-            if len(safe_strip(element.get())) > 0
-        ]
-
-        matchday = safe_strip(text_elements[0].get()).split("  ")[0]
-        date = safe_strip(datetime_box.xpath('p/a[contains(@href, "datum")]/text()').get())
-
-        venue_box = game_box.css('p.sb-zusatzinfos')
-
-        stadium = safe_strip(venue_box.xpath('node()')[1].xpath('a/text()').get())
-        attendance = safe_strip(venue_box.xpath('node()')[1].xpath('strong/text()').get())
-        referee = safe_strip(venue_box.xpath('a[contains(@href, "schiedsrichter")]/@title').get())
-        referee_href = venue_box.xpath('a[contains(@href, "schiedsrichter")]/@href').get()
-
-        result_box = game_box.css('div.ergebnis-wrap')
-        result = safe_strip(result_box.css('div.sb-endstand::text').get())
-        half_time_score = safe_strip(result_box.css('div.sb-halbzeit::text').get())
-
-        # Kickoff time - search for time pattern in the date/time area
-        kickoff_time = None
-        for el in text_elements:
-            text = safe_strip(el.get())
-            if text and re.match(r'\d{1,2}:\d{2}', text):
-                kickoff_time = text
-                break
-
-        manager_names = sel.xpath(
-            "//tr[(contains(td/b/text(),'Manager')) or (contains(td/div/text(),'Manager'))]/td[2]/a/text()"
-        ).getall()
-        manager_hrefs = sel.xpath(
-            "//tr[(contains(td/b/text(),'Manager')) or (contains(td/div/text(),'Manager'))]/td[2]/a/@href"
-        ).getall()
-
-        game_events = (
-            extract_game_events(sel, event_type="Goals")
-            + extract_game_events(sel, event_type="Substitutions")
-            + extract_game_events(sel, event_type="Cards")
-            + extract_game_events(sel, event_type="Shootout")
-        )
-
-        item = {
-            **base,
-            'type': 'game',
-            'game_id': game_id,
-            'home_club': {
-                'type': 'club',
-                'href': home_club_href,
-            },
-            'home_club_name': home_club_name,
-            'home_club_position': home_club_position,
-            'away_club': {
-                'type': 'club',
-                'href': away_club_href,
-            },
-            'away_club_name': away_club_name,
-            'away_club_position': away_club_position,
-            'result': result,
-            'half_time_score': half_time_score,
-            'matchday': matchday,
-            'date': date,
-            'kickoff_time': kickoff_time,
-            'stadium': stadium,
-            'attendance': attendance,
-            'referee': referee,
-            'referee_href': referee_href,
-            'events': game_events,
-        }
-
-        if len(manager_names) == 2:
-            home_manager_name, away_manager_name = manager_names
-            home_manager_href = manager_hrefs[0] if len(manager_hrefs) > 0 else None
-            away_manager_href = manager_hrefs[1] if len(manager_hrefs) > 1 else None
-            item["home_manager"] = {'name': home_manager_name, 'href': home_manager_href}
-            item["away_manager"] = {'name': away_manager_name, 'href': away_manager_href}
-
-        await context.push_data(item) # Push to dataset to prevent AdaptiveCrawler duplicates.
-
-    await crawler.run(requests)
-
-    dataset = await crawler.get_data()
-    for item in dataset.items:
-        print(json.dumps(item), flush=True)
-
-    check_failures(failures)
\ No newline at end of file
+        if with_lineups:
+            item, formations = await extract_page(context, extract_game_with_formations, base)
+        else:
+            item, formations = await extract_page(context, extract_game, base), None
+        if item['game_id'] in seen_games:
+            return
+        await emit(item, on_written=mark_seen(item, SEEN_KIND))
+        # The report is the page game_lineups starts from, go to the line-ups page directly.
+        # Games still to be played have no line-ups yet.
+        if formations is not None:
+            parent = {key: item[key] for key in ('type', 'href', 'game_id', 'home_club', 'away_club')}
+            await context.add_requests([lineups_request(parent, formations, base_url)])
+        # Only now, so a retry of a request that failed above emits the game again
+        seen_games.add(item['game_id'])
+
+    @crawler.router.handler('parse_lineups')
+    async def parse_lineups(context) -> None:
+        base = context.request.user_data['base']
+        await emit(await extract_page(context, extract_lineups, base))
+
+    await run_crawler(crawler, requests)
+    if seen_index is not None:
+        seen_index.report(SEEN_KIND)
+        if lite:
+            seen_index.report(LITE_SEEN_KIND)
+    return failures
@@ -1,22 +1,38 @@
-import json
 import re
 from urllib.parse import unquote, urlparse
 
 from crawlee import Request
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, build_initial_requests, safe_strip, create_crawler, check_failures
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    build_initial_requests,
+    safe_strip,
+    create_crawler,
+    run_crawler,
+    stream_items,
+    write_items,
+)
+from tfmkt.selectors import compiled
 
 
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
     requests = build_initial_requests(parents, season, base_url, label='parse', spider_name='national_teams')
 
-    crawler, failures = create_crawler()
+    crawler, failures = await create_crawler(name='national_teams')
 
     @crawler.router.handler('parse')
     async def parse(context) -> None:
         parent = context.request.user_data['parent']
-        sel = context.selector
+        sel = compiled(context.selector)
 
         # Find the "National teams" section: a div.box containing p.langer-text with "National teams"
         national_teams_box = sel.xpath(
@@ -52,7 +68,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
     @crawler.router.handler('parse_details')
     async def parse_details(context) -> None:
         base = context.request.user_data['base']
-        sel = context.selector
+        sel = compiled(context.selector)
 
         attributes = {}
 
@@ -119,7 +135,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
         attributes['code'] = unquote(urlparse(base["href"]).path.split("/")[1])
 
         item = {**base, **attributes}
-        print(json.dumps(item), flush=True)
+        await emit(item)
 
-    await crawler.run(requests)
-    check_failures(failures)
+    await run_crawler(crawler, requests)
+    return failures
@@ -4,182 +4,412 @@ import logging
 from urllib.parse import unquote, urlparse
 
 from crawlee import Request
+from parsel import Selector, SelectorList
 
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, build_initial_requests, safe_strip, create_crawler, check_failures
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    build_initial_requests,
+    safe_strip,
+    create_crawler,
+    page_crawler_class,
+    page_selector,
+    env_flag,
+    run_crawler,
+    stream_items,
+    write_items,
+    extract_page,
+    in_shard,
+    RecentKeys,
+)
+from tfmkt.seen_index import open_seen_index, seen_marker
+from tfmkt.selectors import plain
 
 logger = logging.getLogger(__name__)
 
+# Player hrefs remembered in lite mode, to emit players listed by two squads once
+SEEN_PLAYERS_SIZE = 100_000
+
+# Seen index kinds of the players scraped in full and in lite mode, kept apart
+# so a full crawl still fetches the profiles of players a lite one listed
+SEEN_KIND = 'player'
+LITE_SEEN_KIND = 'player:lite'
+
 
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
-    requests = build_initial_requests(parents, season, base_url, label='parse', spider_name='players')
+    # TFMKT_LITE: items built from listings rather than detail pages
+    lite = env_flag('TFMKT_LITE')
+    # Every node reads all squads, and only fetches the profiles of its shard
+    requests = build_initial_requests(
+        parents, season, base_url, label='parse', spider_name='players', shard_parents=False,
+    )
+    if lite:
+        requests = squad_requests(requests)
 
-    crawler, failures = create_crawler()
+    crawler, failures = await create_crawler(crawler_class=page_crawler_class(), name='players')
+    seen_index = open_seen_index()
+    seen_kind = LITE_SEEN_KIND if lite else SEEN_KIND
+    seen_players = RecentKeys(SEEN_PLAYERS_SIZE)
 
     @crawler.router.handler('parse')
     async def parse(context) -> None:
         parent = context.request.user_data['parent']
-        sel = context.selector
-
-        players_table = sel.xpath("//div[@class='responsive-table']")
-        if not players_table:
-            players_table = sel.xpath("//table[contains(@class, 'items')]")
-        assert len(players_table) >= 1
-        players_table = players_table[0]
-
-        player_hrefs = players_table.xpath(
-            '//table[@class="inline-table"]//td[@class="hauptlink"]/a/@href'
-        ).getall()
-
-        new_requests = []
-        for href in player_hrefs:
-            cb_data = {
-                'type': 'player',
-                'href': href,
-                'parent': parent,
-            }
-            new_requests.append(
-                Request.from_url(
-                    url=base_url + href,
-                    label='parse_details',
-                    user_data={'base': cb_data},
-                )
-            )
+        player_hrefs = extract_player_hrefs(await page_selector(context))
+
+        new_requests = player_requests(player_hrefs, parent, base_url, seen_index, seen_kind)
+        if new_requests:
+            await context.add_requests(new_requests)
+
+    @crawler.router.handler('parse_squad')
+    async def parse_squad(context) -> None:
+        parent = context.request.user_data['parent']
+
+        profile_hrefs = []
+        for href, item in squad_players(await page_selector(context), parent):
+            if not in_shard(href):
+                continue
+            if item is None:
+                profile_hrefs.append(href)
+                continue
+            if seen_index is not None and seen_index.skip(seen_kind, href):
+                continue
+            if seen_players.add(href):
+                await emit(item, on_written=seen_marker(seen_index, seen_kind, href))
 
+        # Rows the squad table says too little about are read from the profiles
+        new_requests = player_requests(profile_hrefs, parent, base_url, seen_index, seen_kind)
         if new_requests:
             await context.add_requests(new_requests)
 
     @crawler.router.handler('parse_details')
     async def parse_details(context) -> None:
-        base = context.request.user_data['base']
-        sel = context.selector
+        await emit_player(context, emit, seen_index, seen_kind)
 
-        attributes = {}
+    await run_crawler(crawler, requests)
+    if seen_index is not None:
+        seen_index.report(seen_kind)
+    return failures
+
+
+def extract_player_hrefs(selector):
+    """Return the hrefs of the player profiles listed on a parsed squad page."""
+    players_table = selector.xpath("//div[@class='responsive-table']")
+    if not players_table:
+        players_table = selector.xpath("//table[contains(@class, 'items')]")
+    assert len(players_table) >= 1
+    players_table = players_table[0]
+
+    return players_table.xpath(
+        '//table[@class="inline-table"]//td[@class="hauptlink"]/a/@href'
+    ).getall()
 
-        name_element = sel.xpath("//h1[@class='data-header__headline-wrapper']")
-        attributes["name"] = safe_strip("".join(name_element.xpath("text()").getall()).strip())
-        attributes["last_name"] = safe_strip(name_element.xpath("strong/text()").get())
-        attributes["number"] = safe_strip(name_element.xpath("span/text()").get())
-
-        attributes['name_in_home_country'] = sel.xpath(
-            "//span[text()='Name in home country:']/following::span[1]/text()"
-        ).get()
-        attributes['date_of_birth'] = sel.xpath(
-            "//span[@itemprop='birthDate']/text()"
-        ).get().strip().split(" (")[0]
-        attributes['place_of_birth'] = {
-            'country': sel.xpath(
-                "//span[text()='Place of birth:']/following::span[1]/span/img/@title"
-            ).get(),
-            'city': sel.xpath(
-                "//span[text()='Place of birth:']/following::span[1]/span/text()"
-            ).get(),
+
+def player_requests(player_hrefs, parent, base_url, seen_index, seen_kind=SEEN_KIND, label='parse_details'):
+    """Return the requests for the profiles of a squad, leaving out other shards' and seen players."""
+    new_requests = []
+    for href in player_hrefs:
+        if not in_shard(href):
+            continue
+        if seen_index is not None and seen_index.skip(seen_kind, href):
+            continue
+        cb_data = {
+            'type': 'player',
+            'href': href,
+            'parent': parent,
         }
-        attributes['age'] = sel.xpath(
-            "//span[@itemprop='birthDate']/text()"
-        ).get().strip().split('(')[-1].split(')')[0]
-        attributes['height'] = sel.xpath(
-            "//span[text()='Height:']/following::span[1]/text()"
-        ).get()
-        # Full name is the "Name in home country" which is the official full name
-        attributes['full_name'] = sel.xpath(
-            "//span[text()='Name in home country:']/following::span[1]/text()"
-        ).get()
-
-        all_citizenships = sel.xpath(
-            "//span[text()='Citizenship:']/following::span[1]/img/@title"
-        ).getall()
+        new_requests.append(
+            Request.from_url(
+                url=base_url + href,
+                label=label,
+                user_data={'base': cb_data},
+            )
+        )
+    return new_requests
+
+
+async def emit_player(context, emit, seen_index, seen_kind=SEEN_KIND):
+    """Emit the player of a profile page requested by player_requests()."""
+    base = context.request.user_data['base']
+    item = await extract_page(context, extract_player, base, context.request.url)
+    await emit(item, on_written=seen_marker(seen_index, seen_kind, base['href']))
+
+
+def squad_url(seasoned_href):
+    """Return the URL of the detailed squad view of a seasoned club or national team URL."""
+    return seasoned_href.replace('/startseite/', '/kader/') + '/plus/1'
+
+
+async def squad_requests(requests):
+    """Turn the requests for squad pages into requests for their detailed squad view."""
+    async for request in requests:
+        yield Request.from_url(
+            url=squad_url(request.url),
+            label='parse_squad',
+            user_data={'parent': request.user_data['parent']},
+        )
+
+
+# Columns of the detailed squad view by header, and the player fields they hold.
+# National team squads list the players' clubs under Club.
+SQUAD_COLUMNS = {
+    '#': 'number',
+    'Player': 'player',
+    'Date of birth/Age': 'date_of_birth',
+    'Nat.': 'citizenship',
+    'Current club': 'current_club',
+    'Club': 'current_club',
+    'Height': 'height',
+    'Foot': 'foot',
+    'Joined': 'joined',
+    'Contract': 'contract_expires',
+    'Market value': 'current_market_value',
+}
+
+
+def _squad_text(cell):
+    if cell is None:
+        return None
+    text = cell.xpath('normalize-space()').get()
+    return text if text and text != '-' else None
+
+
+def extract_squad(selector, parent):
+    """Yield (href, attributes) for the players of a parsed detailed squad view.
+
+    The attributes are the player item fields the table holds, in the format of
+    the profile pages where the two differ. They are None for rows without a
+    date of birth, which need their profile page.
+    """
+    table = selector.xpath("//div[@class='responsive-table']//table[@class='items']")
+    if not table:
+        return
+    table = table[0]
+
+    columns = {}
+    position = 0
+    for header in table.xpath('thead/tr/th'):
+        field = SQUAD_COLUMNS.get(header.xpath('normalize-space()').get())
+        if field is not None:
+            columns.setdefault(field, position)
+        position += int(header.attrib.get('colspan', 1))
+
+    for row in table.xpath("tbody/tr[contains(@class, 'odd') or contains(@class, 'even')]"):
+        cells = row.xpath('td')
+
+        def cell(field):
+            index = columns.get(field)
+            return cells[index] if index is not None and index < len(cells) else None
+
+        player_cell = cell('player')
+        if player_cell is None:
+            continue
+        player_link = player_cell.xpath(".//td[@class='hauptlink']/a")
+        href = player_link.xpath('@href').get()
+        if not href:
+            continue
+
+        birth_date = _squad_text(cell('date_of_birth'))
+        if not birth_date:
+            yield href, None
+            continue
+
+        attributes = {}
+        attributes['name'] = safe_strip(player_link.xpath('normalize-space()').get())
+        number = _squad_text(cell('number'))
+        attributes['number'] = f'#{number}' if number else None
+        attributes['date_of_birth'] = birth_date.split(" (")[0]
+        attributes['age'] = birth_date.split('(')[-1].split(')')[0] if '(' in birth_date else None
+        height = _squad_text(cell('height'))
+        attributes['height'] = re.sub(r'(\d)\s*m$', r'\1 m', height) if height else None
+
+        citizenship_cell = cell('citizenship')
+        all_citizenships = citizenship_cell.xpath('.//img/@title').getall() if citizenship_cell is not None else []
         attributes['citizenship'] = all_citizenships[0] if all_citizenships else None
         if len(all_citizenships) > 1:
             attributes['additional_citizenships'] = all_citizenships[1:]
-        attributes['position'] = safe_strip(sel.xpath(
-            "//span[text()='Position:']/following::span[1]/text()"
-        ).get())
-        attributes['player_agent'] = {
-            'href': sel.xpath(
-                "//span[text()='Player agent:']/following::span[1]/a/@href"
-            ).get(),
-            'name': sel.xpath(
-                "//span[text()='Player agent:']/following::span[1]/a/text()"
-            ).get(),
-        }
-        attributes['image_url'] = sel.xpath(
-            "//img[@class='data-header__profile-image']/@src"
-        ).get()
-        attributes['current_club'] = {
-            'href': sel.xpath(
-                "//span[contains(text(),'Current club:')]/following::span[1]/a/@href"
-            ).get(),
-        }
-        attributes['foot'] = sel.xpath(
-            "//span[text()='Foot:']/following::span[1]/text()"
-        ).get()
-        attributes['joined'] = sel.xpath(
-            "//span[text()='Joined:']/following::span[1]/text()"
-        ).get()
-        attributes['contract_expires'] = safe_strip(sel.xpath(
-            "//span[text()='Contract expires:']/following::span[1]/text()"
-        ).get())
-        attributes['day_of_last_contract_extension'] = sel.xpath(
-            "//span[text()='Date of last contract extension:']/following::span[1]/text()"
-        ).get()
-        attributes['outfitter'] = sel.xpath(
-            "//span[text()='Outfitter:']/following::span[1]/text()"
-        ).get()
-
-        # National team info (in the data-header section)
-        national_player_li = sel.xpath("//li[contains(text(), 'National player:')]")
-        if national_player_li:
-            national_team_country = safe_strip(
-                national_player_li.xpath(".//span/img/@title").get()
-            )
-            national_team_href = national_player_li.xpath(".//span/a/@href").get()
-            if national_team_href:
-                attributes['national_team'] = {
-                    'country': national_team_country,
-                    'href': national_team_href,
-                }
-
-        # International caps and goals (in the data-header section)
-        caps_goals_li = sel.xpath("//li[contains(text(), 'Caps/Goals:')]")
-        if caps_goals_li:
-            caps_goals_values = caps_goals_li.xpath("a/text()").getall()
-            if len(caps_goals_values) >= 2:
-                attributes['international_caps'] = safe_strip(caps_goals_values[0])
-                attributes['international_goals'] = safe_strip(caps_goals_values[1])
-
-        current_market_value_text = safe_strip(sel.xpath(
-            "//div[@class='tm-player-market-value-development__current-value']/text()"
-        ).get())
-        current_market_value_link = safe_strip(sel.xpath(
-            "//div[@class='tm-player-market-value-development__current-value']/a/text()"
-        ).get())
-        if current_market_value_text:
-            attributes['current_market_value'] = current_market_value_text
+        attributes['position'] = safe_strip(
+            player_cell.xpath(".//table[@class='inline-table']//tr[2]/td/text()").get()
+        )
+        image = player_cell.xpath('.//img')
+        attributes['image_url'] = image.xpath('@data-src').get() or image.xpath('@src').get()
+
+        club_cell = cell('current_club')
+        if club_cell is not None:
+            attributes['current_club'] = {'href': club_cell.xpath('.//a/@href').get()}
+        elif parent.get('type') == 'club':
+            attributes['current_club'] = {'href': parent['href']}
+        attributes['foot'] = _squad_text(cell('foot'))
+        attributes['joined'] = _squad_text(cell('joined'))
+        attributes['contract_expires'] = _squad_text(cell('contract_expires'))
+        attributes['current_market_value'] = _squad_text(cell('current_market_value'))
+        attributes['code'] = unquote(urlparse(href).path.split("/")[1])
+
+        yield href, attributes
+
+
+def squad_players(selector, parent):
+    """Yield (href, item) for the players of a parsed detailed squad view.
+
+    The item is the lite player item, or None for rows that need the profile page.
+    """
+    for href, attributes in extract_squad(selector, parent):
+        yield href, None if attributes is None else {'type': 'player', 'href': href, 'parent': parent, **attributes}
+
+
+# Labels of the profile info table, whose values extract_player reads
+PROFILE_LABELS = frozenset({
+    'Name in home country:',
+    'Place of birth:',
+    'Height:',
+    'Citizenship:',
+    'Position:',
+    'Player agent:',
+    'Foot:',
+    'Joined:',
+    'Contract expires:',
+    'Date of last contract extension:',
+    'Outfitter:',
+    'Social-Media:',
+})
+CURRENT_CLUB_LABEL = 'Current club:'
+
+
+def profile_values(selector):
+    """Map each of PROFILE_LABELS to the span holding its value, in one pass over the page.
+
+    The same as `//span[text()='<label>']/following::span[1]` for every label:
+    the value is the first span after the label span, past the spans nested in
+    it. The 'Current club:' label is matched by its first text only containing
+    the label, like `contains(text(), 'Current club:')`.
+    """
+    spans = list(selector.root.iter('span'))
+    values = {}
+    for index, span in enumerate(spans):
+        if len(span):
+            texts = [text for text in (span.text, *(child.tail for child in span)) if text is not None]
+        elif span.text is not None:
+            texts = [span.text]
         else:
-            attributes['current_market_value'] = current_market_value_link
-        attributes['highest_market_value'] = safe_strip(sel.xpath(
-            "//div[@class='tm-player-market-value-development__max-value']/text()"
-        ).get())
+            continue
+        labels = [text for text in texts if text in PROFILE_LABELS]
+        if texts and CURRENT_CLUB_LABEL in texts[0]:
+            labels.append(CURRENT_CLUB_LABEL)
+        if not labels:
+            continue
+
+        following = index + 1 + sum(1 for _ in span.iterdescendants('span'))
+        if following < len(spans):
+            for label in labels:
+                values.setdefault(label, Selector(root=spans[following], type='html'))
+    return values
+
+
+def extract_player(selector, base, url):
+    """Build a player item from a parsed player profile page."""
+    # The registry of CompiledSelector does not pay off here, see tfmkt.selectors
+    selector = plain(selector)
+    attributes = {}
+    values = profile_values(selector)
 
-        social_media_value_node = sel.xpath(
-            "//span[text()='Social-Media:']/following::span[1]"
+    def value(label, query):
+        value_selector = values.get(label)
+        return value_selector.xpath(query) if value_selector is not None else SelectorList()
+
+    name_element = selector.xpath("//h1[@class='data-header__headline-wrapper']")
+    attributes["name"] = safe_strip("".join(name_element.xpath("text()").getall()).strip())
+    attributes["last_name"] = safe_strip(name_element.xpath("strong/text()").get())
+    attributes["number"] = safe_strip(name_element.xpath("span/text()").get())
+
+    name_in_home_country = value('Name in home country:', 'text()').get()
+    birth_date = selector.xpath("//span[@itemprop='birthDate']/text()").get().strip()
+
+    attributes['name_in_home_country'] = name_in_home_country
+    attributes['date_of_birth'] = birth_date.split(" (")[0]
+    attributes['place_of_birth'] = {
+        'country': value('Place of birth:', 'span/img/@title').get(),
+        'city': value('Place of birth:', 'span/text()').get(),
+    }
+    attributes['age'] = birth_date.split('(')[-1].split(')')[0]
+    attributes['height'] = value('Height:', 'text()').get()
+    # Full name is the "Name in home country" which is the official full name
+    attributes['full_name'] = name_in_home_country
+
+    all_citizenships = value('Citizenship:', 'img/@title').getall()
+    attributes['citizenship'] = all_citizenships[0] if all_citizenships else None
+    if len(all_citizenships) > 1:
+        attributes['additional_citizenships'] = all_citizenships[1:]
+    attributes['position'] = safe_strip(value('Position:', 'text()').get())
+    attributes['player_agent'] = {
+        'href': value('Player agent:', 'a/@href').get(),
+        'name': value('Player agent:', 'a/text()').get(),
+    }
+    attributes['image_url'] = selector.xpath(
+        "//img[@class='data-header__profile-image']/@src"
+    ).get()
+    attributes['current_club'] = {
+        'href': value(CURRENT_CLUB_LABEL, 'a/@href').get(),
+    }
+    attributes['foot'] = value('Foot:', 'text()').get()
+    attributes['joined'] = value('Joined:', 'text()').get()
+    attributes['contract_expires'] = safe_strip(value('Contract expires:', 'text()').get())
+    attributes['day_of_last_contract_extension'] = value('Date of last contract extension:', 'text()').get()
+    attributes['outfitter'] = value('Outfitter:', 'text()').get()
+
+    # National team info (in the data-header section)
+    national_player_li = selector.xpath("//li[contains(text(), 'National player:')]")
+    if national_player_li:
+        national_team_country = safe_strip(
+            national_player_li.xpath(".//span/img/@title").get()
         )
-        if len(social_media_value_node) > 0:
-            attributes['social_media'] = []
-            for element in social_media_value_node.xpath('div[@class="socialmedia-icons"]/a'):
-                href = element.xpath('@href').get()
-                attributes['social_media'].append(href)
+        national_team_href = national_player_li.xpath(".//span/a/@href").get()
+        if national_team_href:
+            attributes['national_team'] = {
+                'country': national_team_country,
+                'href': national_team_href,
+            }
+
+    # International caps and goals (in the data-header section)
+    caps_goals_li = selector.xpath("//li[contains(text(), 'Caps/Goals:')]")
+    if caps_goals_li:
+        caps_goals_values = caps_goals_li.xpath("a/text()").getall()
+        if len(caps_goals_values) >= 2:
+            attributes['international_caps'] = safe_strip(caps_goals_values[0])
+            attributes['international_goals'] = safe_strip(caps_goals_values[1])
+
+    current_market_value_text = safe_strip(selector.xpath(
+        "//div[@class='tm-player-market-value-development__current-value']/text()"
+    ).get())
+    current_market_value_link = safe_strip(selector.xpath(
+        "//div[@class='tm-player-market-value-development__current-value']/a/text()"
+    ).get())
+    if current_market_value_text:
+        attributes['current_market_value'] = current_market_value_text
+    else:
+        attributes['current_market_value'] = current_market_value_link
+    attributes['highest_market_value'] = safe_strip(selector.xpath(
+        "//div[@class='tm-player-market-value-development__max-value']/text()"
+    ).get())
 
-        attributes['market_value_history'] = parse_market_history(sel, context.request.url)
-        attributes['code'] = unquote(urlparse(base["href"]).path.split("/")[1])
+    social_media_value_node = values.get('Social-Media:')
+    if social_media_value_node is not None:
+        attributes['social_media'] = []
+        for element in social_media_value_node.xpath('div[@class="socialmedia-icons"]/a'):
+            href = element.xpath('@href').get()
+            attributes['social_media'].append(href)
 
-        item = {**base, **attributes}
-        print(json.dumps(item), flush=True)
+    attributes['market_value_history'] = parse_market_history(selector, url)
+    attributes['code'] = unquote(urlparse(base["href"]).path.split("/")[1])
 
-    await crawler.run(requests)
-    check_failures(failures)
+    return {**base, **attributes}
 
 
 def parse_market_history(selector, url):
@@ -1,34 +1,50 @@
-import json
 import re
 
 from crawlee import Request
 
-from tfmkt.common import DEFAULT_BASE_URL, load_parents, safe_strip, create_crawler, check_failures
+from tfmkt.common import (
+    DEFAULT_BASE_URL,
+    load_parents,
+    safe_strip,
+    create_crawler,
+    run_crawler,
+    iterate,
+    in_shard,
+    stream_items,
+    write_items,
+)
+from tfmkt.selectors import compiled
 
 
 async def run(parents_arg=None, season=2024, base_url=None):
+    await write_items(iter_items(load_parents(parents_arg), season, base_url))
+
+
+def iter_items(parents, season=2024, base_url=None):
+    return stream_items(crawl, parents, season, base_url)
+
+
+async def crawl(parents, season, base_url, emit):
     base_url = base_url or DEFAULT_BASE_URL
-    parents = load_parents(parents_arg)
-    requests = []
-    for item in parents:
-        if item.get('type') != 'competition':
-            continue
-        href = item['href']
-        erfolge_href = href.replace('/startseite/', '/erfolge/')
-        requests.append(
-            Request.from_url(
+
+    async def build_requests():
+        async for item in iterate(parents):
+            if item.get('type') != 'competition' or not in_shard(item['href']):
+                continue
+            href = item['href']
+            erfolge_href = href.replace('/startseite/', '/erfolge/')
+            yield Request.from_url(
                 url=f"{base_url}{erfolge_href}",
                 label='parse',
                 user_data={'parent': item},
             )
-        )
 
-    crawler, failures = create_crawler()
+    crawler, failures = await create_crawler(name='tournament_editions')
 
     @crawler.router.handler('parse')
     async def parse(context) -> None:
         parent = context.request.user_data['parent']
-        sel = context.selector
+        sel = compiled(context.selector)
 
         table = sel.css('table.items')
         if not table:
@@ -81,7 +97,7 @@ async def run(parents_arg=None, season=2024, base_url=None):
                 'coach': coach_name,
                 'coach_href': coach_href,
             }
-            print(json.dumps(item), flush=True)
+            await emit(item)
 
-    await crawler.run(requests)
-    check_failures(failures)
+    await run_crawler(crawler, build_requests())
+    return failures
@@ -0,0 +1,40 @@
+from tfmkt.common import (
+    CrawlFailedError,
+    check_failures,
+    load_parents,
+    prepare_parent,
+    shared_http_clients,
+    unsharded,
+    write_items,
+)
+
+
+async def run_pipeline(modules, parents_arg=None, season=2024, base_url=None):
+    """Chain crawler modules in one event loop, printing the items of the last one.
+
+    Every item a stage yields becomes a parent of the next stage straight away,
+    the same as piping `tfmkt` invocations into each other but without the JSON
+    round trip, and with all stages sharing one HTTP client. Failed requests of
+    every stage are reported at the end. With TFMKT_SHARD only the last stage
+    is sharded, the earlier ones run in full to give it all of its parents.
+    """
+    failures = []
+
+    async def collect_failures(items):
+        try:
+            async for item in items:
+                yield item
+        except CrawlFailedError as error:
+            failures.extend(error.failures)
+
+    async def as_parents(items):
+        async for item in collect_failures(items):
+            yield prepare_parent(dict(item))
+
+    async with shared_http_clients():
+        items = modules[0].iter_items(load_parents(parents_arg), season, base_url)
+        for module in modules[1:]:
+            items = module.iter_items(as_parents(unsharded(items)), season, base_url)
+
+        await write_items(collect_failures(items))
+    check_failures(failures)
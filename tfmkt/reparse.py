@@ -0,0 +1,138 @@
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from tfmkt.cache import ResponseCache
+from tfmkt.common import ItemWriter, check_failures, env_flag
+from tfmkt.crawlers import clubs, game_lineups, games, players
+from tfmkt.selectors import CompiledSelector
+
+logger = logging.getLogger(__name__)
+
+# Pages handed to a worker process at a time, and batches of them in flight
+# per worker, so the archive is never listed into memory all at once
+REPARSE_BATCH_SIZE = 32
+BATCHES_PER_WORKER = 4
+
+
+def _player(selector, user_data, url):
+    return [players.extract_player(selector, user_data['base'], url)]
+
+
+def _club(selector, user_data, url):
+    return [clubs.extract_club(selector, user_data['base'])]
+
+
+def _game(selector, user_data, url):
+    return [games.extract_game(selector, user_data['base'])]
+
+
+def _lineups(selector, user_data, url):
+    return [game_lineups.extract_lineups(selector, user_data['base'])]
+
+
+def _squad_players(selector, user_data, url):
+    return [item for _, item in players.squad_players(selector, user_data['parent']) if item is not None]
+
+
+def _fixture_games(selector, user_data, url):
+    parent = user_data['base']['parent']
+    # Crawled through their game reports, which are reparsed as such
+    if games.competition_id(parent) in games.full_competition_ids():
+        return []
+    return list(games.fixture_games(selector, parent))
+
+
+# Handlers that can run over archived pages, keyed by crawler name. Each
+# crawler lists the labels of the requests its items are built from, with the
+# type of the `base` passed along with them (to tell handlers that share a
+# label apart), and a function building the items from (selector, user data, url).
+REPARSE_HANDLERS = {
+    'players': [
+        ('parse_details', 'player', _player),
+        # Profiles requested by clubs --with-players
+        ('parse_player', 'player', _player),
+    ],
+    'clubs': [('parse_details', 'club', _club)],
+    'games': [('parse_game', None, _game)],
+    'game_lineups': [('parse_lineups', None, _lineups)],
+}
+
+# Listings that items are built from with TFMKT_LITE, on top of the pages above
+LITE_REPARSE_HANDLERS = {
+    'players': [('parse_squad', None, _squad_players)],
+    'games': [('extract_game_urls', None, _fixture_games)],
+}
+
+
+def handlers(crawler):
+    """Return the (label, base type, extract) handlers of `crawler`, following TFMKT_LITE."""
+    if env_flag('TFMKT_LITE'):
+        return REPARSE_HANDLERS[crawler] + LITE_REPARSE_HANDLERS.get(crawler, [])
+    return REPARSE_HANDLERS[crawler]
+
+
+def _reparse_pages(pages):
+    """Run in a worker process: build the items of a batch of archived pages."""
+    results = []
+    for crawler, label, url, user_data, body_path in pages:
+        extract = next(extract for handler_label, _, extract in handlers(crawler) if handler_label == label)
+        with open(body_path, 'rb') as body_file:
+            body = body_file.read()
+        try:
+            results.append((url, extract(CompiledSelector(body=body), user_data, url), None))
+        except Exception as error:
+            results.append((url, None, error))
+    return results
+
+
+def find_pages(crawler, archive):
+    """Yield (crawler, label, url, user data, body path) for the archived pages `crawler` knows how to parse."""
+    base_types = {label: base_type for label, base_type, _ in handlers(crawler)}
+    for metadata, body_path in ResponseCache(archive).entries():
+        label = metadata.get('label')
+        if label not in base_types:
+            continue
+        user_data = metadata['user_data']
+        if base_types[label] is not None and user_data.get('base', {}).get('type') != base_types[label]:
+            continue
+        yield crawler, label, metadata['url'], user_data, str(body_path)
+
+
+def reparse(crawler, archive, jobs=None):
+    """Print the items `crawler` extracts from the pages in `archive`.
+
+    Pages are parsed on a pool of `jobs` processes, one per core by default,
+    with no request queue and no network involved. Items are printed in
+    archive order.
+    """
+    failures = []
+    parsed = 0
+    writer = ItemWriter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        pages = find_pages(crawler, archive)
+        pending = deque()
+        max_pending = (jobs or os.cpu_count() or 1) * BATCHES_PER_WORKER
+
+        def write_batch(results):
+            nonlocal parsed
+            for url, items, error in results:
+                if error is not None:
+                    failures.append((url, error))
+                    continue
+                parsed += 1
+                for item in items:
+                    writer.write(item)
+
+        while batch := list(islice(pages, REPARSE_BATCH_SIZE)):
+            pending.append(executor.submit(_reparse_pages, batch))
+            if len(pending) >= max_pending:
+                write_batch(pending.popleft().result())
+        while pending:
+            write_batch(pending.popleft().result())
+    writer.flush()
+
+    logger.info('Reparsed %d %s pages from %s, %d failed', parsed, crawler, archive, len(failures))
+    check_failures(failures)
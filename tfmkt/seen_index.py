@@ -0,0 +1,154 @@
+import atexit
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import time
+from collections import Counter
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+# Keys the Bloom filter is sized for at least, and the false positive rate it
+# is sized to. False positives only cost an SQLite lookup, never a skipped page.
+MIN_BLOOM_CAPACITY = 1_000_000
+BLOOM_ERROR_RATE = 0.01
+
+# Entities recorded, and seconds passed, before the entities recorded since the
+# last commit are written to the index. Those are lost if the crawl dies, and
+# only cost a refetch next time.
+COMMIT_INTERVAL = 1000
+COMMIT_SECONDS = 30
+
+# Seconds a write waits for another process writing to the same index, such as
+# another worker of a --workers crawl
+BUSY_TIMEOUT = 60
+
+
+class BloomFilter:
+    """Set membership in a fixed bit array, with false positives but no false negatives."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self._size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        # Double hashing: k positions out of two 64-bit hashes
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self._size for i in range(self._hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SeenIndex:
+    """Entities scraped by earlier runs, kept in SQLite with a Bloom filter in front.
+
+    Keys are grouped by kind, such as 'game' or 'player:lite'. The Bloom filter
+    answers most lookups for entities never seen without touching the
+    database; the database settles the rest exactly. `skipped` counts, per
+    kind, the lookups that found an entity already scraped.
+
+    Entities recorded are kept in memory and written in one short transaction
+    per commit, so processes sharing the index never wait long on each other.
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS seen (kind TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (kind, key))'
+        )
+        self._connection.commit()
+
+        count = self._connection.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+        self._bloom = BloomFilter(max(MIN_BLOOM_CAPACITY, 2 * count))
+        for kind, key in self._connection.execute('SELECT kind, key FROM seen'):
+            self._bloom.add(self._bloom_key(kind, key))
+        self.skipped = Counter()
+        self._uncommitted = set()
+        self._committed_at = time.monotonic()
+
+    @staticmethod
+    def _bloom_key(kind, key):
+        return f'{kind}\0{key}'
+
+    def __contains__(self, entity):
+        kind, key = entity
+        key = str(key)
+        if self._bloom_key(kind, key) not in self._bloom:
+            return False
+        if (kind, key) in self._uncommitted:
+            return True
+        return self._connection.execute(
+            'SELECT 1 FROM seen WHERE kind = ? AND key = ?', (kind, key)
+        ).fetchone() is not None
+
+    def skip(self, kind, key):
+        """Return whether the entity was already scraped, counting it as skipped if so."""
+        if (kind, key) in self:
+            self.skipped[kind] += 1
+            return True
+        return False
+
+    def add(self, kind, key):
+        """Record an entity as scraped, for later runs to skip."""
+        key = str(key)
+        self._uncommitted.add((kind, key))
+        self._bloom.add(self._bloom_key(kind, key))
+        if (
+            len(self._uncommitted) >= COMMIT_INTERVAL
+            or time.monotonic() - self._committed_at >= COMMIT_SECONDS
+        ):
+            self.commit()
+
+    def commit(self):
+        """Write the entities recorded since the last commit to disk."""
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO seen (kind, key) VALUES (?, ?)', self._uncommitted
+            )
+        self._uncommitted = set()
+        self._committed_at = time.monotonic()
+
+    def report(self, kind):
+        """Commit the index, and log how many `kind` entities were skipped."""
+        self.commit()
+        logger.info('Skipped %d %s entities already in the seen index', self.skipped[kind], kind)
+
+
+_seen_indexes = {}
+
+
+def open_seen_index():
+    """Open the seen index at TFMKT_SEEN_INDEX, or return None to crawl everything.
+
+    Crawlers in the same process share one index per path. Entities are only
+    recorded once their items are written, the last ones after the crawl
+    ends, so the index is committed again at exit.
+    """
+    path = os.environ.get('TFMKT_SEEN_INDEX')
+    if not path:
+        return None
+    if path not in _seen_indexes:
+        _seen_indexes[path] = SeenIndex(path)
+        atexit.register(_seen_indexes[path].commit)
+    return _seen_indexes[path]
+
+
+def seen_marker(seen_index, kind, key):
+    """Return the `on_written` callback recording an entity in `seen_index` once its item is written.
+
+    Returns None without an index.
+    """
+    if seen_index is None:
+        return None
+    return partial(seen_index.add, kind, key)
@@ -0,0 +1,91 @@
+"""Precompiled selectors shared by the crawlers.
+
+parsel resolves the evaluator of every query on each call, and looks CSS
+translations up again, which adds up on listing pages where the same queries
+run for every table row. CompiledSelector runs each query through a registry
+of XPath objects compiled once per process, and hands out CompiledSelectors, so
+a whole chain of `.css()`/`.xpath()` calls stays on the registry. Matches
+are wrapped without going through Selector's constructor again.
+
+That only pays off for many small queries. Player profiles run a few queries
+over the whole page, where evaluating them dominates, and are read with plain
+parsel selectors, see plain().
+"""
+from functools import lru_cache
+
+from lxml import etree
+from parsel import Selector
+from parsel.csstranslator import HTMLTranslator
+
+_translator = HTMLTranslator()
+
+# Only re:, mapping the EXSLT namespaces parsel also knows (set: and others)
+# into a long-lived evaluator grows its error log on every call
+NAMESPACES = {'re': 'http://exslt.org/regular-expressions'}
+REGISTRY_SIZE = 4096
+
+
+@lru_cache(maxsize=REGISTRY_SIZE)
+def compiled_xpath(query):
+    """Return the lxml XPath object for `query`, compiled on first use."""
+    try:
+        return etree.XPath(query, namespaces=NAMESPACES, smart_strings=False)
+    except etree.XPathError as exc:
+        raise ValueError(f'XPath error: {exc} in {query}')
+
+
+@lru_cache(maxsize=REGISTRY_SIZE)
+def css_to_xpath(query):
+    """Return the XPath translation of the CSS selector `query`."""
+    return _translator.css_to_xpath(query)
+
+
+class CompiledSelector(Selector):
+    """A parsel Selector for HTML pages whose queries go through the registry.
+
+    Queries with namespaces or XPath variables fall back to parsel, and so do
+    the set: functions.
+    """
+
+    __slots__ = ()
+
+    def xpath(self, query, namespaces=None, **kwargs):
+        root = self.root
+        if namespaces or kwargs or 'set:' in query or not hasattr(root, 'xpath'):
+            return super().xpath(query, namespaces, **kwargs)
+        try:
+            result = compiled_xpath(query)(root)
+        except etree.XPathError as exc:
+            raise ValueError(f'XPath error: {exc} in {query}')
+        if not isinstance(result, list):
+            result = [result]
+        return self.selectorlist_cls([self._wrap(x, query) for x in result])
+
+    def _wrap(self, root, query):
+        # What Selector(root=root, _expr=query, namespaces=..., type='html')
+        # sets, without its argument checks, which cost more than the query
+        selector = CompiledSelector.__new__(CompiledSelector)
+        selector.root = root
+        selector.type = 'html'
+        selector.namespaces = dict(self.namespaces)
+        selector._expr = query
+        selector._huge_tree = self._huge_tree
+        selector._text = None
+        return selector
+
+    def css(self, query):
+        return self.xpath(css_to_xpath(query))
+
+
+def compiled(selector):
+    """Return `selector` as a CompiledSelector over the same HTML document."""
+    if isinstance(selector, CompiledSelector) or selector.type != 'html':
+        return selector
+    return CompiledSelector(root=selector.root, type='html')
+
+
+def plain(selector):
+    """Return `selector` as a parsel Selector over the same HTML document."""
+    if not isinstance(selector, CompiledSelector):
+        return selector
+    return Selector(root=selector.root, type='html')
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from crawlee import ConcurrencySettings
+
+
+class TokenBucket:
+    """Rate limiter allowing `rate` acquisitions per second, in bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self._rate = rate
+        self._capacity = burst or max(1.0, rate)
+        self._tokens = self._capacity
+        self._clock = clock
+        self._updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        self._refill()
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+            self._refill()
+        self._tokens -= 1
+
+
+class TrafficLane:
+    """Concurrency cap and rate limit for one kind of traffic, such as direct requests.
+
+    Either limit may be None, meaning unlimited.
+    """
+
+    def __init__(self, name: str, concurrency: int | None = None, rate: float | None = None) -> None:
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self._bucket = TokenBucket(rate) if rate else None
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of the lane's concurrency slots for the duration of a request."""
+        if self._semaphore is None:
+            await self._wait_for_token()
+            yield
+            return
+
+        async with self._semaphore:
+            await self._wait_for_token()
+            yield
+
+    async def _wait_for_token(self) -> None:
+        if self._bucket is not None:
+            await self._bucket.acquire()
+
+
+def build_traffic_lane(name: str) -> TrafficLane:
+    """Build a lane from TFMKT_<NAME>_CONCURRENCY and TFMKT_<NAME>_RATE (requests per second)."""
+    concurrency = os.environ.get(f'TFMKT_{name.upper()}_CONCURRENCY')
+    rate = os.environ.get(f'TFMKT_{name.upper()}_RATE')
+    return TrafficLane(
+        name,
+        concurrency=int(concurrency) if concurrency else None,
+        rate=float(rate) if rate else None,
+    )
+
+
+def build_concurrency_settings(direct_lane: TrafficLane, unlocker_lane: TrafficLane | None) -> ConcurrencySettings | None:
+    """Size the crawler's own pool to the lanes, or return None to keep crawlee's defaults.
+
+    Without the Web Unlocker, all traffic is direct and the pool enforces the
+    direct lane itself. With it, each lane also enforces its limits inside the
+    HTTP client, and the pool is sized for both lanes to be busy at once: any
+    smaller and requests queued for a backed-off lane starve the other one, any
+    larger and requests pile up waiting on the lanes. A lane without a
+    concurrency cap counts for crawlee's default maximum. The pool starts at
+    full size only when every lane has a cap, and is rate limited only when
+    every lane has a rate.
+    """
+    lanes = [direct_lane] if unlocker_lane is None else [direct_lane, unlocker_lane]
+    if all(lane.concurrency is None and lane.rate is None for lane in lanes):
+        return None
+
+    defaults = ConcurrencySettings()
+    max_concurrency = sum(lane.concurrency or defaults.max_concurrency for lane in lanes)
+    return ConcurrencySettings(
+        max_concurrency=max_concurrency,
+        desired_concurrency=(
+            max_concurrency if all(lane.concurrency for lane in lanes)
+            else min(max_concurrency, defaults.desired_concurrency)
+        ),
+        max_tasks_per_minute=(
+            sum(lane.rate for lane in lanes) * 60 if all(lane.rate for lane in lanes) else float('inf')
+        ),
+    )
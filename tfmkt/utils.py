@@ -1,3 +1,14 @@
+SPRITE_COLUMNS = 10 # number of columns in the matrix
+SPRITE_ROWS = 13 # number of rows in the matrix
+SPRITE_SQUARE_PX = 36 # size of the chronometer square in pixels
+
+# Game minute shown by each square of the chronometer sprite, by row and column
+MINUTE_MATRIX = tuple(
+    tuple(range((a-1)*SPRITE_COLUMNS + 1, a*SPRITE_COLUMNS + 1))
+    for a in range(1, SPRITE_ROWS)
+)
+
+
 def background_position_in_px_to_minute(px_x: int, px_y: int) -> int:
     """Convert background-position arguments from the "sb-sprite-uhr-klein" CSS class to the game minute.
     This CSS class uses some smartness that moves the this image around so as to choose the game minutes
@@ -13,27 +24,13 @@ def background_position_in_px_to_minute(px_x: int, px_y: int) -> int:
     :rtype: int
     """
 
-    n = 10 # number of columns in the matrix
-    m = 13 # number of rows in the matrix
-    h = 36 # size of the chronometer square in pixels
-
-    x_offset = 0
-    y_offset = 0
-
-    matrix = [
-        list(range((a-1)*n + 1, a*n + 1))
-        for a in range(1, m)
-    ]
-
-    if abs(px_y) > h*(m - 1 - y_offset): # no data available
+    if abs(px_y) > SPRITE_SQUARE_PX*(SPRITE_ROWS - 1): # no data available
         return -1
 
-    x = abs(px_x) / h
+    x = abs(px_x) / SPRITE_SQUARE_PX
     assert x.is_integer()
-    x = int(x) + x_offset
 
-    y = abs(px_y) / h
+    y = abs(px_y) / SPRITE_SQUARE_PX
     assert y.is_integer()
-    y = int(y) + y_offset
 
-    return matrix[y][x]
+    return MINUTE_MATRIX[int(y)][int(x)]
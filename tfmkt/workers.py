@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a worker's output at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def record_worker_stats(section, **counters):
+    """Report counters, such as the Web Unlocker summary, to the coordinator of this worker.
+
+    Does nothing outside of a worker. The coordinator sums the counters of
+    every worker, see run_workers().
+    """
+    path = os.environ.get('TFMKT_WORKER_STATS')
+    if path:
+        with open(path, 'a') as stats:
+            stats.write(json.dumps({'section': section, 'counters': counters}) + '\n')
+
+
+def record_worker_failures(failures):
+    """Report failed requests to the coordinator of this worker, if there is one."""
+    path = os.environ.get('TFMKT_WORKER_STATS')
+    if path and failures:
+        with open(path, 'a') as stats:
+            for url, error in failures:
+                stats.write(json.dumps({'failure': {'url': url, 'error': str(error)}}) + '\n')
+
+
+def worker_argv(argv):
+    """Return the command line arguments `argv` for a worker.
+
+    --workers is dropped, and so is --state-dir, which every worker gets a
+    subdirectory of through TFMKT_STATE_DIR instead.
+    """
+    result = []
+    skip_value = False
+    for argument in argv:
+        if skip_value:
+            skip_value = False
+        elif argument in ('--workers', '--state-dir'):
+            skip_value = True
+        elif not argument.startswith(('--workers=', '--state-dir=')):
+            result.append(argument)
+    return result
+
+
+async def _merge_output(stream, output):
+    """Copy whole lines from a worker's stdout to ours, so items never interleave."""
+    partial = b''
+    while chunk := await stream.read(READ_CHUNK_SIZE):
+        lines_end = chunk.rfind(b'\n') + 1
+        if not lines_end:
+            partial += chunk
+            continue
+        output.write(partial + chunk[:lines_end])
+        output.flush()
+        partial = chunk[lines_end:]
+    if partial:
+        output.write(partial)
+        output.flush()
+
+
+async def _send(worker, line):
+    try:
+        worker.stdin.write(line)
+        await worker.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # the worker died, its exit status reports it
+
+
+async def _broadcast_stdin(workers):
+    """Send every line of our stdin to every worker, which each keep the parents of their shard."""
+    while line := await asyncio.to_thread(sys.stdin.buffer.readline):
+        await asyncio.gather(*(_send(worker, line) for worker in workers))
+    for worker in workers:
+        worker.stdin.close()
+
+
+async def run_workers(argv, count, parents_arg=None, state_dir=None):
+    """Run `tfmkt <argv>` in `count` worker processes, one per shard, merging their output.
+
+    Every worker crawls its own shard, see TFMKT_SHARD, with its own crawler
+    and event loop, so parsing runs on `count` cores. Their items are written
+    to stdout as they come, one whole line at a time. Parents read from stdin
+    are sent to every worker. Once all workers exit, the counters they report
+    are summed and logged, and the process exits non-zero if any request of
+    any worker failed.
+    """
+    read_stdin = parents_arg is None and not sys.stdin.isatty()
+    argv = worker_argv(argv)
+
+    with tempfile.TemporaryDirectory(prefix='tfmkt-workers-') as stats_dir:
+        workers = []
+        for index in range(count):
+            env = dict(
+                os.environ,
+                TFMKT_SHARD=f'{index}/{count}',
+                TFMKT_WORKER_STATS=os.path.join(stats_dir, f'worker-{index}.jsonl'),
+            )
+            if state_dir:
+                # Workers keep their request queues and written items apart
+                env['TFMKT_STATE_DIR'] = os.path.join(state_dir, f'worker-{index}')
+            workers.append(await asyncio.create_subprocess_exec(
+                sys.executable, '-m', 'tfmkt', *argv,
+                stdin=asyncio.subprocess.PIPE if read_stdin else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                env=env,
+            ))
+
+        def terminate():
+            for worker in workers:
+                if worker.returncode is None:
+                    worker.send_signal(signal.SIGTERM)
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, terminate)
+        try:
+            tasks = [_merge_output(worker.stdout, sys.stdout.buffer) for worker in workers]
+            if read_stdin:
+                tasks.append(_broadcast_stdin(workers))
+            await asyncio.gather(*tasks)
+            return_codes = [await worker.wait() for worker in workers]
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+
+        counters = defaultdict(Counter)
+        failures = []
+        for index in range(count):
+            path = os.path.join(stats_dir, f'worker-{index}.jsonl')
+            if not os.path.exists(path):
+                continue
+            with open(path) as stats:
+                for line in stats:
+                    record = json.loads(line)
+                    if 'failure' in record:
+                        failures.append(record['failure'])
+                    else:
+                        counters[record['section']].update(record['counters'])
+
+    for section, totals in counters.items():
+        logger.info(
+            '%s summary across %d workers: %s',
+            section,
+            count,
+            ' '.join(f'{name}={value}' for name, value in totals.items()),
+        )
+
+    if failures:
+        logger.error('%d requests failed across %d workers', len(failures), count)
+        sys.exit(1)
+    failed = [code for code in return_codes if code]
+    if failed:
+        logger.error('Workers exited with status %s', return_codes)
+        # A worker killed by signal N has a return code of -N
+        sys.exit(failed[0] if failed[0] > 0 else 128 - failed[0])